@@ -0,0 +1,232 @@
+"""Benchmark cases for the firmware hot paths.
+
+A case is a setup function registered with @case(name). It gets the
+environment from run.py and returns the function to time, an async
+function (anything returning a coroutine, set async_=True), or None when
+the case cannot run on this interpreter. Inputs are fixed so results can be
+compared before and after a change.
+"""
+
+import json
+
+CASES = []
+
+
+def case(name, async_=False):
+    def register(setup):
+        CASES.append((name, setup, async_))
+        return setup
+    return register
+
+
+# a getStats() list, see server/telemetry.py FIELDS
+STATS = ["e6616408432a0000", "\"2024-6-1\"", "\"7:19\"",
+         72, 60, 52, 44, 12.0, 500, 6.0, 255, 1980.5, 22.0, 600, 24.0, 55.0]
+
+# RTC datetime tuple of the sample
+DATETIME = (2024, 6, 1, 5, 7, 19, 30, 0)
+
+# gbeformat stat and log_avg dicts
+STAT = {"yea": 2024, "mon": 6, "day": 1, "hou": 7, "min": 19, "sec": 30,
+        "red": 72, "gre": 60, "blu": 52, "whi": 44, "vol": 12.0, "mam": 500,
+        "wat": 6.0, "fan": 255, "rpm": 1980.5, "sst": 22.0, "ssm": 600,
+        "boa": "e6616408432a0000", "con": "07:00", "cof": "19:00",
+        "cf0": 255, "cf1": 128, "cre": 72, "cgr": 60, "cbl": 52, "cwh": 44, "ctz": -5}
+LOG_AVG = {"red": 72.0, "gre": 60.0, "blu": 52.0, "whi": 44.0, "vol": 12.01,
+           "mam": 498.7, "wat": 5.99, "fan": 255.0, "rpm": 1975.2,
+           "sst": 22.03, "ssm": 601.4}
+
+# gbe_settings.json
+CONFIG = {
+    "lights": {"timer": {"on": "07:00", "off": "19:00"},
+               "duty": {"red": 72, "green": 60, "blue": 52, "white": 44}},
+    "fan": {"duty": {"when lights on": 255, "when lights off": 128}},
+    "time zone": {"GMT offset": -5},
+}
+
+# register values of the INA219 at 12V and 500mA
+INA219_REGISTERS = {0x00: 0x399F, 0x01: 5000, 0x02: 3000 << 3 | 2,
+                    0x03: 300, 0x04: 12500, 0x05: 4096}
+
+
+class FakeI2C:
+    """Answers register reads from a dict, writes are ignored"""
+
+    def __init__(self, registers):
+        self.registers = registers
+
+    def writeto_mem(self, addr, register, buf):
+        pass
+
+    def readfrom_mem(self, addr, register, n):
+        value = self.registers.get(register, 0)
+        return bytes([value >> 8 & 0xFF, value & 0xFF])
+
+    def readfrom_mem_into(self, addr, register, buf):
+        value = self.registers.get(register, 0)
+        buf[0] = value >> 8 & 0xFF
+        buf[1] = value & 0xFF
+
+
+class Sink:
+    """Socket that accepts every write and reads `data` over and over"""
+
+    def __init__(self, data=b""):
+        self.data = data
+        self._pos = 0
+
+    def write(self, buf):
+        return len(buf)
+
+    def readinto(self, buf, n=None):
+        n = len(buf) if n is None else n
+        data = self.data
+        for i in range(n):
+            buf[i] = data[self._pos]
+            self._pos = (self._pos + 1) % len(data)
+        return n
+
+
+# ------------------------------------------------------------------ main.py
+
+@case("main.getStats", async_=True)
+def get_stats(env):
+    return env.main and env.main["getStats"]
+
+
+@case("main.getStatsNoRTC", async_=True)
+def get_stats_no_rtc(env):
+    return env.main and env.main["getStatsNoRTC"]
+
+
+@case("main.getReadings", async_=True)
+def get_readings(env):
+    return env.main and env.main["getReadings"]
+
+
+@case("json.dumps(stats)")
+def json_dumps(env):
+    return lambda: json.dumps(STATS)
+
+
+# ---------------------------------------------------------------- gbeformat
+
+@case("gbeformat.columns")
+def columns(env):
+    gbeformat = env.load("gbeformat")
+    return lambda: gbeformat.columns(STAT)
+
+
+@case("gbeformat.hourlog")
+def hourlog(env):
+    gbeformat = env.load("gbeformat")
+    return lambda: gbeformat.hourlog(STAT, LOG_AVG)
+
+
+@case("gbeformat.url_query")
+def url_query(env):
+    gbeformat = env.load("gbeformat")
+    return lambda: gbeformat.url_query(STAT, LOG_AVG)
+
+
+@case("gbeformat.valid_config")
+def valid_config(env):
+    gbeformat = env.load("gbeformat")
+    return lambda: gbeformat.valid_config(CONFIG)
+
+
+# --------------------------------------------------------------------- auth
+
+@case("auth.Signer.sign")
+def signer_sign(env):
+    auth = env.load("auth")
+    signer = auth.Signer(b"\xe6\x61\x64\x08\x43\x2a\x00\x00", bytes(range(16)), path=None)
+    payload = bytes(63)
+    return lambda: signer.sign(payload)
+
+
+# ------------------------------------------------------------------ mqtt_as
+
+def _mqtt_client(env, data=b""):
+    mqtt_as = env.load("mqtt_as")
+    config = dict(mqtt_as.config)
+    config["server"] = "localhost"
+    client = mqtt_as.MQTTClient(config)
+    client._sock = Sink(data)
+    client._in_connect = True  # isconnected() without a network
+    return client
+
+
+@case("mqtt_as._publish", async_=True)
+def publish(env):
+    client = _mqtt_client(env)
+    payload = bytes(63)
+    return lambda: client._publish("data", payload, False, 1, 0, 1)
+
+
+@case("mqtt_as._recv_len", async_=True)
+def recv_len(env):
+    # 300, the remaining length of a backlog publish, takes two bytes
+    client = _mqtt_client(env, b"\xac\x02")
+    return client._recv_len
+
+
+# ------------------------------------------------------------------ drivers
+
+@case("ahtx0.AHT10._decode")
+def aht10_decode(env):
+    ahtx0 = env.load("ahtx0")
+    sensor = ahtx0.AHT10.__new__(ahtx0.AHT10)
+    sensor._buf = bytearray(b"\x1c\x8c\xcc\xc5\x99\x99")
+    return sensor._decode
+
+
+@case("stemma_soil_sensor._decode_temp")
+def stemma_decode_temp(env):
+    stemma_soil_sensor = env.load("stemma_soil_sensor")
+    sensor = stemma_soil_sensor.StemmaSoilSensor.__new__(stemma_soil_sensor.StemmaSoilSensor)
+    buf = bytearray(b"\x00\x16\x00\x00")
+    return lambda: sensor._decode_temp(buf)
+
+
+@case("ina219.INA219.snapshot")
+def ina219_snapshot(env):
+    ina219 = env.load("ina219")
+    ina = ina219.INA219(0.1, FakeI2C(INA219_REGISTERS))
+    ina.configure(gain=ina219.INA219.GAIN_8_320MV)
+    return ina.snapshot
+
+
+# ------------------------------------------------------------ data pipeline
+
+@case("telemetry.Encoder.pack")
+def encoder_pack(env):
+    telemetry = env.load("telemetry")
+    encoder = telemetry.Encoder(b"\xe6\x61\x64\x08\x43\x2a\x00\x00")
+    return lambda: encoder.pack(DATETIME, STATS)
+
+
+@case("aggregate.Aggregator.add")
+def aggregator_add(env):
+    aggregate = env.load("aggregate")
+    aggregator = aggregate.Aggregator(13, [60, 3600])
+    return lambda: aggregator.add(STATS, 3)
+
+
+@case("aggregate.Aggregator.collect")
+def aggregator_collect(env):
+    aggregate = env.load("aggregate")
+    aggregator = aggregate.Aggregator(13, [60, 3600])
+    aggregator.add(STATS, 3)
+    return aggregator.collect
+
+
+# ------------------------------------------------------------------- lights
+
+@case("ramp.index")
+def ramp_index(env):
+    ramp = env.load("ramp")
+    # 30 minute dawn and dusk ramps on every light channel
+    times, _ = ramp.schedule(7 * 3600, 19 * 3600, (72 << 8, 60 << 8, 52 << 8, 44 << 8, 255 << 8),
+                             (0, 0, 0, 0, 128 << 8), (1800,) * 4 + (0,), (1800,) * 4 + (0,))
+    return lambda: ramp.index(times, 18 * 3600 + 45 * 60)
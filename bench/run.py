@@ -0,0 +1,267 @@
+"""Microbenchmarks of the firmware hot paths, see bench/cases.py.
+
+Runs under CPython and the unix port of MicroPython and reports the time
+and the memory allocated per call. Under CPython the firmware runs on a
+simulated board (see sim/), so main.py cases are included and async cases
+also report the simulated time they waited, eg. for sensor conversions.
+Under MicroPython only lib/ is loaded.
+
+Allocations are measured with gc.mem_alloc() with the collector disabled
+under MicroPython and with the tracemalloc peak of each call under CPython,
+alloc_method in the results says which one was used. Compare results
+from the same interpreter only.
+
+Usage: python bench/run.py [--filter TEXT] [--calls N] [--out FILE]
+       micropython bench/run.py [--filter TEXT] [--calls N] [--out FILE]
+       python bench/run.py --compare BEFORE.json AFTER.json
+"""
+
+import gc
+import json
+import sys
+
+from cases import CASES
+
+MICROPYTHON = sys.implementation.name == "micropython"
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+ROOT = _here + "/.."
+
+if MICROPYTHON:
+    import asyncio
+    from time import ticks_us, ticks_diff
+
+    _clock = ticks_us
+
+    def _elapsed_us(start):
+        return ticks_diff(ticks_us(), start)
+else:
+    import tracemalloc
+    from time import perf_counter
+
+    _clock = perf_counter
+
+    def _elapsed_us(start):
+        return (perf_counter() - start) * 1000000
+
+
+class DeviceEnv:
+    """lib/ imported directly, main.py is not available"""
+
+    main = None
+    sim = None
+
+    def __init__(self):
+        sys.path.insert(0, ROOT + "/lib")
+
+    def load(self, name):
+        return __import__(name)
+
+    def run(self, coro):
+        return asyncio.run(coro)
+
+    def sim_ms(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class HostEnv:
+    """main.py booted on a simulated board and stopped once hardwareListener()
+       set up the sensors"""
+
+    def __init__(self):
+        sys.path.insert(0, ROOT)
+        from sim import Simulation
+        self.sim = Simulation(quiet=True)
+        self.board = self.sim.add_board(name="bench")
+        self.sim.run(1)
+        self.board.halt()
+        self.main = self.board.firmware.modules["__main__"].__dict__
+
+    def load(self, name):
+        return self.board.firmware.load(name)
+
+    def run(self, coro):
+        return self.sim.loop.run_until_complete(coro)
+
+    def sim_ms(self):
+        return self.sim.clock.now * 1000
+
+    def close(self):
+        self.sim.close()
+
+
+class GcProbe:
+    """Bytes allocated per call, from gc.mem_alloc() without collections"""
+
+    method = "gc.mem_alloc"
+
+    def open(self):
+        self.total = 0
+        gc.collect()
+        gc.disable()
+
+    def before(self):
+        self._start = gc.mem_alloc()
+
+    def after(self):
+        self.total += gc.mem_alloc() - self._start
+
+    def close(self):
+        gc.enable()
+
+
+class TracemallocProbe:
+    """Peak bytes allocated during each call"""
+
+    method = "tracemalloc-peak"
+
+    def open(self):
+        self.total = 0
+        gc.collect()
+        tracemalloc.start()
+
+    def before(self):
+        self._start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def after(self):
+        self.total += tracemalloc.get_traced_memory()[1] - self._start
+
+    def close(self):
+        tracemalloc.stop()
+
+
+def _run_sync(fn, n, probe):
+    if probe is None:
+        start = _clock()
+        for _ in range(n):
+            fn()
+        return _elapsed_us(start)
+    for _ in range(n):
+        probe.before()
+        fn()
+        probe.after()
+
+
+async def _run_async(fn, n, probe):
+    if probe is None:
+        start = _clock()
+        for _ in range(n):
+            await fn()
+        return _elapsed_us(start)
+    for _ in range(n):
+        probe.before()
+        await fn()
+        probe.after()
+
+
+def measure(env, fn, async_, calls, probe):
+    """Returns the result dict of one case"""
+    def repeat(n, p=None):
+        if async_:
+            return env.run(_run_async(fn, n, p))
+        return _run_sync(fn, n, p)
+
+    repeat(1)  # warm up caches and lazy setup
+    sim_start = env.sim_ms()
+    elapsed = repeat(calls)
+    result = {"calls": calls, "us_per_call": elapsed / calls}
+    if sim_start is not None and async_:
+        result["sim_ms_per_call"] = (env.sim_ms() - sim_start) / calls
+
+    alloc_calls = min(calls, 100)
+    probe.open()
+    try:
+        repeat(alloc_calls, probe)
+    finally:
+        probe.close()
+    result["alloc_bytes_per_call"] = probe.total / alloc_calls
+    result["alloc_method"] = probe.method
+    return result
+
+
+def run(name_filter=None, calls=1000):
+    env = DeviceEnv() if MICROPYTHON else HostEnv()
+    probe = GcProbe() if MICROPYTHON else TracemallocProbe()
+    results = []
+    try:
+        for name, setup, async_ in CASES:
+            if name_filter and name_filter not in name:
+                continue
+            try:
+                fn = setup(env)
+            except ImportError as e:
+                fn = None
+                print("%-32s skipped: %s" % (name, e))
+            if not fn:
+                continue
+            result = {"name": name}
+            result.update(measure(env, fn, async_, calls, probe))
+            results.append(result)
+            line = "%-32s %10.2f us %10.1f bytes" % (
+                name, result["us_per_call"], result["alloc_bytes_per_call"])
+            if "sim_ms_per_call" in result:
+                line += " %8.2f sim ms" % result["sim_ms_per_call"]
+            print(line)
+    finally:
+        env.close()
+    return {
+        "interpreter": sys.implementation.name,
+        "version": ".".join(str(v) for v in sys.implementation.version[:3]),
+        "platform": sys.platform,
+        "results": results,
+    }
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    if before["interpreter"] != after["interpreter"]:
+        print("warning: comparing %s with %s" % (before["interpreter"], after["interpreter"]))
+    old = {r["name"]: r for r in before["results"]}
+    print("%-32s %12s %12s %7s %10s %10s" % (
+        "case", "before us", "after us", "ratio", "before B", "after B"))
+    for r in after["results"]:
+        b = old.get(r["name"])
+        if b is None:
+            print("%-32s %12s %12.2f" % (r["name"], "-", r["us_per_call"]))
+            continue
+        print("%-32s %12.2f %12.2f %6.2fx %10.1f %10.1f" % (
+            r["name"], b["us_per_call"], r["us_per_call"],
+            r["us_per_call"] / b["us_per_call"] if b["us_per_call"] else 0,
+            b["alloc_bytes_per_call"], r["alloc_bytes_per_call"]))
+
+
+def main(argv):
+    name_filter = None
+    calls = 1000
+    out = None
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--compare" and i + 2 < len(argv):
+            compare(argv[i + 1], argv[i + 2])
+            return
+        elif arg == "--filter" and i + 1 < len(argv):
+            name_filter = argv[i + 1]
+        elif arg == "--calls" and i + 1 < len(argv):
+            calls = int(argv[i + 1])
+        elif arg == "--out" and i + 1 < len(argv):
+            out = argv[i + 1]
+        else:
+            print(__doc__)
+            sys.exit(2)
+        i += 2
+    report = run(name_filter, calls)
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f)
+        print("results written to " + out)
+
+
+main(sys.argv[1:])
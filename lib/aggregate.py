@@ -0,0 +1,114 @@
+"""
+Streaming min/max/mean of sensor readings over fixed time windows.
+
+Readings are added as they are sampled and folded into fixed size
+accumulators, so memory use does not depend on the sample rate or the window
+length. Values equal to MISSING (the -1 used by main.py for readings that
+failed) are left out of the statistics.
+"""
+
+import utime
+from array import array
+
+MISSING = -1
+
+
+class Window:
+    """Running count/min/max/sum/last of each field over `seconds`"""
+
+    def __init__(self, seconds, fields):
+        self.seconds = seconds
+        self._n = fields
+        self.count = array("L", [0] * fields)
+        self.min = array("f", [0] * fields)
+        self.max = array("f", [0] * fields)
+        self.sum = array("f", [0] * fields)
+        self.last = array("f", [0] * fields)
+        self.samples = 0
+        self.start = utime.ticks_ms()
+
+    def add(self, values, offset=0):
+        """Fold values[offset:offset + fields] into the window"""
+        self.samples += 1
+        for i in range(self._n):
+            v = values[offset + i]
+            if v == MISSING:
+                continue
+            if self.count[i]:
+                if v < self.min[i]:
+                    self.min[i] = v
+                if v > self.max[i]:
+                    self.max[i] = v
+            else:
+                self.min[i] = v
+                self.max[i] = v
+            self.sum[i] += v
+            self.count[i] += 1
+            self.last[i] = v
+
+    def due(self, now):
+        return utime.ticks_diff(now, self.start) >= self.seconds * 1000
+
+    def mean(self):
+        """Mean of each field, MISSING for fields without valid readings"""
+        return [self.sum[i] / self.count[i] if self.count[i] else MISSING
+                for i in range(self._n)]
+
+    def _valid(self, values):
+        return [values[i] if self.count[i] else MISSING for i in range(self._n)]
+
+    def minimum(self):
+        """Lowest reading of each field, MISSING for fields without valid readings"""
+        return self._valid(self.min)
+
+    def maximum(self):
+        """Highest reading of each field, MISSING for fields without valid readings"""
+        return self._valid(self.max)
+
+    def latest(self):
+        """Last valid reading of each field, MISSING for fields without one"""
+        return self._valid(self.last)
+
+    def reset(self, now):
+        for i in range(self._n):
+            self.count[i] = 0
+            self.min[i] = 0
+            self.max[i] = 0
+            self.sum[i] = 0
+            self.last[i] = 0
+        self.samples = 0
+        self.start = now
+
+
+class Aggregator:
+    """Feeds every sample to one Window per entry of `windows` (seconds)"""
+
+    def __init__(self, fields, windows):
+        self.windows = [Window(seconds, fields) for seconds in sorted(windows)]
+
+    def add(self, values, offset=0):
+        for window in self.windows:
+            window.add(values, offset)
+
+    def reset(self, now):
+        """Start every window again at now, eg. the time of the first sample"""
+        for window in self.windows:
+            window.reset(now)
+
+    def collect(self, now=None):
+        """Returns [(seconds, samples, means, mins, maxs, lasts)] for the
+           windows that ended by now (ticks_ms) and starts them again.
+           Pass the time the sample was due rather than when it was read,
+           so every window holds the same number of samples.
+           Usually empty, then nothing is allocated."""
+        if now is None:
+            now = utime.ticks_ms()
+        done = None
+        for window in self.windows:
+            if window.due(now):
+                if done is None:
+                    done = []
+                done.append((window.seconds, window.samples, window.mean(),
+                             window.minimum(), window.maximum(), window.latest()))
+                window.reset(now)
+        return done or ()
@@ -29,6 +29,7 @@ Author(s): Andreas Bühl, Kattni Rembor
 """
 
 import utime
+import uasyncio as asyncio
 from micropython import const
 
 
@@ -41,17 +42,40 @@ class AHT10:
     AHTX0_CMD_SOFTRESET = const(0xBA)  # Soft reset command
     AHTX0_STATUS_BUSY = const(0x80)  # Status bit for busy
     AHTX0_STATUS_CALIBRATED = const(0x08)  # Status bit for calibrated
+    AHTX0_MEASURE_MS = const(80)  # A measurement takes at least 75ms
 
-    def __init__(self, i2c, address=AHTX0_I2CADDR_DEFAULT):
-        utime.sleep_ms(20)  # 20ms delay to wake up
+    def __init__(self, i2c, address=AHTX0_I2CADDR_DEFAULT, max_age_ms=0, init=True):
+        # init resets and calibrates the sensor now, blocking for about 50ms.
+        # Pass False and await setup_async() to avoid blocking an event loop.
+        if init:
+            utime.sleep_ms(20)  # 20ms delay to wake up
         self._i2c = i2c
         self._address = address
         self._buf = bytearray(6)
-        self.reset()
-        if not self.initialize():
-            raise RuntimeError("Could not initialize")
         self._temp = None
         self._humidity = None
+        self._measured = None  # ticks_ms of the cached result
+        self.max_age_ms = max_age_ms  # How long the properties reuse a result
+        self._lock = asyncio.Lock()  # Held while an awaited measurement is in flight
+        if init:
+            self.reset()
+            if not self.initialize():
+                raise RuntimeError("Could not initialize")
+
+    async def setup_async(self):
+        """Like the reset and initialization of the constructor, but awaits the delays"""
+        await asyncio.sleep_ms(20)  # 20ms delay to wake up
+        self._buf[0] = self.AHTX0_CMD_SOFTRESET
+        self._i2c.writeto(self._address, self._buf[0:1])
+        await asyncio.sleep_ms(20)
+        self._buf[0] = self.AHTX0_CMD_INITIALIZE
+        self._buf[1] = 0x08
+        self._buf[2] = 0x00
+        self._i2c.writeto(self._address, self._buf[0:3])
+        while self.status & self.AHTX0_STATUS_BUSY:
+            await asyncio.sleep_ms(5)
+        if not self.status & self.AHTX0_STATUS_CALIBRATED:
+            raise RuntimeError("Could not initialize")
 
     def reset(self):
         """Perform a soft-reset of the AHT"""
@@ -79,21 +103,52 @@ class AHT10:
     @property
     def relative_humidity(self):
         """The measured relative humidity in percent."""
-        self._perform_measurement()
-        self._humidity = (
-            (self._buf[1] << 12) | (self._buf[2] << 4) | (self._buf[3] >> 4)
-        )
-        self._humidity = (self._humidity * 100) / 0x100000
+        if not self._is_fresh(self.max_age_ms):
+            self._perform_measurement()
+            self._decode()
         return self._humidity
 
     @property
     def temperature(self):
         """The measured temperature in degrees Celcius."""
-        self._perform_measurement()
-        self._temp = ((self._buf[3] & 0xF) << 16) | (self._buf[4] << 8) | self._buf[5]
-        self._temp = ((self._temp * 200.0) / 0x100000) - 50
+        if not self._is_fresh(self.max_age_ms):
+            self._perform_measurement()
+            self._decode()
         return self._temp
 
+    async def measure(self, max_age_ms=0):
+        """Return (relative humidity, temperature) from a single measurement,
+        awaiting the conversion instead of busy-waiting. A result younger than
+        max_age_ms is returned without a new measurement. A caller that comes
+        in while a measurement is in flight waits for it and shares its result."""
+        shared = self._lock.locked()
+        started = utime.ticks_ms()
+        async with self._lock:
+            # a measurement that was in flight when this call started is fresh enough
+            shared = (shared and self._measured is not None and
+                      utime.ticks_diff(self._measured, started) >= 0)
+            if not shared and not self._is_fresh(max_age_ms):
+                self._trigger_measurement()
+                await asyncio.sleep_ms(self.AHTX0_MEASURE_MS)
+                # status reads all 6 bytes, so the last read holds the result
+                while self.status & self.AHTX0_STATUS_BUSY:
+                    await asyncio.sleep_ms(5)
+                self._decode()
+            return self._humidity, self._temp
+
+    def _is_fresh(self, max_age_ms):
+        return (self._measured is not None and
+                utime.ticks_diff(utime.ticks_ms(), self._measured) < max_age_ms)
+
+    def _decode(self):
+        """Decode humidity and temperature from the buffer and cache them"""
+        buf = self._buf
+        humidity = (buf[1] << 12) | (buf[2] << 4) | (buf[3] >> 4)
+        self._humidity = (humidity * 100) / 0x100000
+        temp = ((buf[3] & 0xF) << 16) | (buf[4] << 8) | buf[5]
+        self._temp = ((temp * 200.0) / 0x100000) - 50
+        self._measured = utime.ticks_ms()
+
     def _read_to_buffer(self):
         """Read sensor data to buffer"""
         self._i2c.readfrom_into(self._address, self._buf)
@@ -0,0 +1,138 @@
+"""
+Message authentication with a per-board secret.
+
+Every payload is wrapped in an envelope that the server can check cheaply:
+
+    offset type  field
+    0      B     MAGIC (0xA7), never "[" or a telemetry record version
+    1      8s    board id (raw machine.unique_id())
+    9      I     counter, little endian, grows with every message
+    13     ...   payload
+    -8     8s    tag, the first 8 bytes of HMAC-SHA256(key, everything before it)
+
+The counter lets the server reject replayed messages. Messages to the box,
+such as settings over MQTT, use the same envelope signed with the same key
+and are checked with unwrap(), the caller keeps the counter of the last one.
+The server keeps a sequence per board for them, so its counters only grow.
+
+One message can address several boxes. Its board id is FLEET and the tag is
+replaced with a list of (board id, tag) entries, each over everything before
+the list with the key of that board, followed by the number of entries:
+
+    -2-16n 8s 8s board id, tag, once for every board addressed
+    -2     H     n, little endian
+
+The counter of a box is kept in RAM and a block of values is reserved on flash at a time, so flash is written once
+every `reserve` messages and a reset skips the rest of the block instead of
+reusing counter values.
+
+The secret is made once by SETUP.PY ("Enroll this box"), which prints it
+with the board id to be registered on the server with
+`python -m server.auth register`. It never goes over the network.
+"""
+
+import binascii
+import hashlib
+import json
+import ustruct as struct
+from micropython import const
+
+MAGIC = const(0xA7)
+_HEADER = "<B8sI"
+HEADER_SIZE = const(13)
+TAG_SIZE = const(8)
+FLEET = b"\xff" * 8
+
+
+class Signer:
+    """Wraps payloads in authenticated envelopes.
+       :param bytes board: raw board id, eg: machine.unique_id().
+       :param bytes key: the secret shared with the server.
+       :param str path: file holding the end of the reserved counter block,
+           None keeps the counter in RAM only.
+       :param int reserve: counter values reserved per flash write."""
+
+    def __init__(self, board, key, path="/config/auth_counter", reserve=256):
+        self._board = bytes(board[:8])
+        # HMAC pads, the key is shorter than the SHA-256 block
+        key = bytes(key) + bytes(64 - len(key))
+        self._ipad = bytes(b ^ 0x36 for b in key)
+        self._opad = bytes(b ^ 0x5C for b in key)
+        self._path = path
+        self._reserve = reserve
+        self._header = bytearray(HEADER_SIZE)
+        self.counter = 0
+        if path:
+            try:
+                with open(path, "rb") as f:
+                    self.counter = struct.unpack("<I", f.read(4))[0]
+            except (OSError, ValueError):
+                pass
+        self._save()
+
+    def _save(self):
+        self._limit = self.counter + self._reserve
+        if not self._path:
+            return
+        with open(self._path, "wb") as f:
+            f.write(struct.pack("<I", self._limit))
+
+    def tag(self, *parts):
+        """Truncated HMAC-SHA256 of the concatenated parts"""
+        inner = hashlib.sha256(self._ipad)
+        for part in parts:
+            inner.update(part)
+        outer = hashlib.sha256(self._opad)
+        outer.update(inner.digest())
+        return outer.digest()[:TAG_SIZE]
+
+    def sign(self, payload):
+        """Returns payload wrapped in an envelope with the next counter value"""
+        self.counter += 1
+        if self.counter >= self._limit:
+            self._save()
+        struct.pack_into(_HEADER, self._header, 0, MAGIC, self._board, self.counter)
+        return b"".join((self._header, payload, self.tag(self._header, payload)))
+
+    def unwrap(self, message):
+        """Returns (counter, payload) of an envelope signed for this board,
+           None for a fleet message that does not address it, raises
+           ValueError if it is neither"""
+        if len(message) < HEADER_SIZE + TAG_SIZE or message[0] != MAGIC:
+            raise ValueError("not a signed message")
+        board = message[1:9]
+        if board == FLEET:
+            entries = struct.unpack_from("<H", message, len(message) - 2)[0]
+            end = len(message) - 2 - 16 * entries
+            if end < HEADER_SIZE:
+                raise ValueError("not a signed message")
+            for i in range(end, end + 16 * entries, 16):
+                if message[i:i + 8] == self._board:
+                    received = message[i + 8:i + 16]
+                    break
+            else:
+                return None
+        elif board == self._board:
+            end = len(message) - TAG_SIZE
+            received = message[end:]
+        else:
+            raise ValueError("signed for another board")
+        data = message[:end]
+        expected = self.tag(data)
+        # compares every byte so the time taken does not reveal the tag
+        diff = 0
+        for i in range(TAG_SIZE):
+            diff |= expected[i] ^ received[i]
+        if diff:
+            raise ValueError("wrong tag")
+        return struct.unpack_from("<I", message, 9)[0], data[HEADER_SIZE:]
+
+def load(board, path="/config/auth.json"):
+    """Returns a Signer with the key SETUP.PY wrote, or None if the box
+       was not enrolled"""
+    try:
+        with open(path) as f:
+            enrolled = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return Signer(board, binascii.unhexlify(enrolled["key"]))
@@ -35,9 +35,23 @@ PER_DAY     = (3)
 PER_WEEKDAY = (4)
 PER_MONTH   = (5)
 
+# Square wave rates for SquareWave()
+SQW_1HZ     = (0)
+SQW_1024HZ  = (1)
+SQW_4096HZ  = (2)
+SQW_8192HZ  = (3)
+
+# Control register bits
+CTRL_A1IE   = (0x01)
+CTRL_A2IE   = (0x02)
+CTRL_INTCN  = (0x04)
+CTRL_RS     = (0x18)
+CTRL_BBSQW  = (0x40)
+
 class DS3231():
     def __init__(self, i2c):
         self.i2c = i2c
+        self._dt = bytearray(7)  # burst buffer for registers 0x00-0x06
         self.setReg(DS3231_REG_CTRL, 0x4C)
 
     def DecToHex(self, dat):
@@ -111,17 +125,29 @@ class DS3231():
             self.Minute(dat[1]%60)
             self.Second(dat[2]%60)
 
+    # Reads or writes all date and time registers in one I2C transaction,
+    # so the value can't roll over between registers.
+    # Returns [year, month, day, weekday, hour, minute, second]
     def DateTime(self, dat = None):
+        buf = self._dt
         if dat == None:
-            return self.Date() + [self.Weekday()] + self.Time()
+            self.i2c.readfrom_mem_into(DS3231_I2C_ADDR, DS3231_REG_SEC, buf)
+            return [self.HexToDec(buf[6]) + 2000,
+                    self.HexToDec(buf[5] & 0x1F),  # bit 7 is the century
+                    self.HexToDec(buf[4]),
+                    self.HexToDec(buf[3]),
+                    self.HexToDec(buf[2] & 0x3F),  # 24 hour mode
+                    self.HexToDec(buf[1]),
+                    self.HexToDec(buf[0] & 0x7F)]
         else:
-            self.Year(dat[0])
-            self.Month(dat[1])
-            self.Day(dat[2])
-            self.Weekday(dat[3])
-            self.Hour(dat[4])
-            self.Minute(dat[5])
-            self.Second(dat[6])
+            buf[0] = self.DecToHex(dat[6]%60)
+            buf[1] = self.DecToHex(dat[5]%60)
+            buf[2] = self.DecToHex(dat[4]%24)
+            buf[3] = self.DecToHex(dat[3]%8)
+            buf[4] = self.DecToHex(dat[2]%32)
+            buf[5] = self.DecToHex(dat[1]%13)
+            buf[6] = self.DecToHex(dat[0]%100)
+            self.i2c.writeto_mem(DS3231_I2C_ADDR, DS3231_REG_SEC, buf)
 
     def ALARM(self, day, hour, minute, repeat):
         IE = self.getReg(DS3231_REG_CTRL)
@@ -149,6 +175,13 @@ class DS3231():
     def ClearALARM(self):
         self.setReg(DS3231_REG_STA, 0)
 
+    # Output a square wave on the INT/SQW pin, eg: a 1Hz tick for timing.
+    # The pin is open drain and needs a pull-up. Disables alarm interrupts.
+    def SquareWave(self, rate = SQW_1HZ):
+        ctrl = self.getReg(DS3231_REG_CTRL)
+        ctrl &= ~(CTRL_RS | CTRL_INTCN | CTRL_A1IE | CTRL_A2IE)
+        self.setReg(DS3231_REG_CTRL, ctrl | (rate << 3) | CTRL_BBSQW)
+
     def Temperature(self):
         t1 = self.getReg(DS3231_REG_TEMP)
         t2 = self.getReg(DS3231_REG_TEMP + 1)
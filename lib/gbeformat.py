@@ -137,6 +137,22 @@ def valid_config(config):
             return False
     except:
         return False
+    # optional dawn and dusk ramps, minutes for all light channels or {channel: minutes}
+    try:
+        ramp = config['lights'].get('ramp', {})
+        for key in ('dawn', 'dusk'):
+            minutes = ramp.get(key, 0)
+            if not isinstance(minutes, dict):
+                minutes = {'red': minutes}
+            for channel, value in minutes.items():
+                if channel not in ('red', 'green', 'blue', 'white') or not isinstance(value, (int, float)) or value < 0 or value > 720:
+                    return False
+        if ramp.get('shape', 'sine') not in ('sine', 'linear'):
+            return False
+        if not isinstance(ramp.get('steps', 64), int) or not 1 <= ramp.get('steps', 64) <= 255:
+            return False
+    except:
+        return False
     try:
         if config['time zone']['GMT offset'] >= -11 and config['time zone']['GMT offset'] <= 13:
             pass
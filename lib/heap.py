@@ -0,0 +1,94 @@
+"""
+Heap statistics and garbage collection at quiet moments.
+
+MicroPython collects garbage when an allocation fails or, with
+gc.threshold() set, after that many bytes were allocated. Either way the
+pause lands on whichever task happened to allocate, eg. in the middle of an
+LED fade. Heap sets the threshold to a fraction of the heap and idle()
+collects early, once part of the threshold was used, when the caller knows
+nothing time critical is running. Automatic collections are then rare.
+
+stats() reports free and allocated memory, the lowest free memory seen, the
+largest block that can still be allocated, and the number and duration of
+the collections made by Heap.
+"""
+
+import gc
+import utime
+
+
+class Heap:
+    """Collection policy and statistics.
+       :param float threshold: fraction of the heap allocated between
+           automatic collections, 0 keeps MicroPython's default.
+       :param float idle: idle() collects once this fraction of the
+           threshold (or of the heap without one) was allocated."""
+
+    def __init__(self, threshold=0.25, idle=0.5):
+        gc.collect()
+        self.size = gc.mem_free() + gc.mem_alloc()
+        if threshold:
+            gc.threshold(int(self.size * threshold))
+        self.idle_bytes = int(self.size * (threshold or 1) * idle)
+        self.collections = 0
+        self.last_pause_us = 0
+        self.max_pause_us = 0
+        self.min_free = gc.mem_free()
+        self._collected = gc.mem_alloc()
+
+    def collect(self):
+        """Collect now and time the pause"""
+        start = utime.ticks_us()
+        gc.collect()
+        pause = utime.ticks_diff(utime.ticks_us(), start)
+        self.collections += 1
+        self.last_pause_us = pause
+        if pause > self.max_pause_us:
+            self.max_pause_us = pause
+        self._collected = gc.mem_alloc()
+
+    def idle(self):
+        """Call when nothing time critical runs for a while. Collects if
+           idle_bytes were allocated since the last collection, returns
+           True if it did."""
+        free = gc.mem_free()
+        if free < self.min_free:
+            self.min_free = free
+        if gc.mem_alloc() - self._collected < self.idle_bytes:
+            return False
+        self.collect()
+        return True
+
+    def largest_free(self, resolution=64):
+        """Size of the largest block that can be allocated, found by trying
+           allocations. Failed allocations make MicroPython collect, so
+           call this rarely."""
+        low = 0
+        high = gc.mem_free()
+        while high - low > resolution:
+            size = (low + high) // 2
+            try:
+                block = bytearray(size)
+                block = None
+                low = size
+            except MemoryError:
+                high = size
+        return low
+
+    def stats(self, reset=True):
+        """Returns a dict for the diagnostics topic, reset starts the
+           low water mark and the pause maximum again"""
+        self.collect()
+        stats = {
+            "free": gc.mem_free(),
+            "alloc": gc.mem_alloc(),
+            "largest free": self.largest_free(),
+            "min free": self.min_free,
+            "collections": self.collections,
+            "last pause us": self.last_pause_us,
+            "max pause us": self.max_pause_us,
+        }
+        if reset:
+            self.min_free = stats["free"]
+            self.max_pause_us = 0
+        return stats
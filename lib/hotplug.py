@@ -0,0 +1,162 @@
+"""
+Hot-plug detection for I2C sensors.
+
+Every poll addresses each device once with a zero length write, which costs
+one I2C transaction and no driver code while nothing changes. A device is
+only set up (driver construction, resets, calibration) when its address
+newly answers, and torn down when it stops answering twice in a row or
+when `max_errors` reads in a row failed.
+
+Each device moves through these states:
+
+    ABSENT  -- answers -->  SETUP  -- ok -->  READY
+       ^                      |                 |
+       |                    fails           gone / errors
+       |                      v                 |
+       +---- backoff over -- BACKOFF  <---------+ (if it was not stable)
+
+A device that fails its setup, or disappears less than `stable_ms` after
+it came up, waits in BACKOFF for a delay that doubles each time, up to
+`max_backoff_ms`, so a flapping connector does not make the box reset the
+sensor over and over.
+"""
+
+import utime
+import uasyncio as asyncio
+from micropython import const
+
+ABSENT = const(0)
+SETUP = const(1)
+READY = const(2)
+BACKOFF = const(3)
+
+STATE_NAMES = ("absent", "setup", "ready", "backoff")
+
+
+class Device:
+    """One pluggable I2C device.
+       :param str name: name used in messages.
+       :param I2C i2c: bus the device is connected to.
+       :param int addr: I2C address of the device.
+       :param setup: async function of (i2c, addr) that returns the driver
+           object, or raises if the device could not be set up.
+       :param int max_errors: failed reads in a row, reported with error(),
+           after which the device is set up again."""
+
+    def __init__(self, name, i2c, addr, setup, max_errors=3):
+        self.name = name
+        self.i2c = i2c
+        self.addr = addr
+        self.setup = setup
+        self.max_errors = max_errors
+        self.state = ABSENT
+        self.driver = None
+        self.errors = 0
+        self.backoff_ms = 0
+        self._misses = 0
+        self._since = utime.ticks_ms()  # when the state was entered
+        self._until = 0  # end of the backoff
+
+    def answers(self):
+        try:
+            self.i2c.writeto(self.addr, b"")
+            return True
+        except OSError:
+            return False
+
+    def error(self):
+        """Report a failed read, the device is set up again after max_errors in a row"""
+        self.errors += 1
+
+    def ok(self):
+        """Report a good read, the failed reads before it no longer count"""
+        self.errors = 0
+
+    def _enter(self, state, now):
+        self.state = state
+        self._since = now
+
+
+class HotPlug:
+    """Polls a set of Devices.
+       :param int min_backoff_ms: first backoff delay.
+       :param int max_backoff_ms: longest backoff delay.
+       :param int stable_ms: a device that stayed ready this long starts
+           over at min_backoff_ms when it fails."""
+
+    def __init__(self, min_backoff_ms=1000, max_backoff_ms=60000, stable_ms=60000):
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.stable_ms = stable_ms
+        self.devices = []
+
+    def add(self, name, i2c, addr, setup, max_errors=3):
+        device = Device(name, i2c, addr, setup, max_errors)
+        self.devices.append(device)
+        return device
+
+    def _backoff(self, device, now):
+        if device.backoff_ms:
+            device.backoff_ms = min(device.backoff_ms * 2, self.max_backoff_ms)
+        else:
+            device.backoff_ms = self.min_backoff_ms
+        device._until = utime.ticks_add(now, device.backoff_ms)
+        device._enter(BACKOFF, now)
+
+    def _lost(self, device, now):
+        device.driver = None
+        if utime.ticks_diff(now, device._since) < self.stable_ms:
+            self._backoff(device, now)
+        else:
+            device.backoff_ms = 0
+            device._enter(ABSENT, now)
+
+    async def _setup(self, device):
+        try:
+            device.driver = await device.setup(device.i2c, device.addr)
+        except Exception:
+            device.driver = None
+
+    async def poll(self):
+        """Check every device, set up the ones that appeared. Returns the
+           devices that became ready or stopped being ready."""
+        now = utime.ticks_ms()
+        changed = []
+        pending = []
+        for device in self.devices:
+            state = device.state
+            if state == READY:
+                if device.errors >= device.max_errors:
+                    self._lost(device, now)
+                    changed.append(device)
+                elif device.answers():
+                    device._misses = 0
+                else:
+                    device._misses += 1
+                    if device._misses >= 2:
+                        self._lost(device, now)
+                        changed.append(device)
+            elif state == BACKOFF:
+                if utime.ticks_diff(now, device._until) >= 0:
+                    device._enter(ABSENT, now)
+                    state = ABSENT
+            if state == ABSENT and device.answers():
+                device._enter(SETUP, now)
+                pending.append(device)
+
+        if pending:
+            await asyncio.gather(*[self._setup(device) for device in pending])
+            now = utime.ticks_ms()
+            for device in pending:
+                if device.driver is None:
+                    self._backoff(device, now)
+                    continue
+                device.errors = 0
+                device._misses = 0
+                device._enter(READY, now)
+                changed.append(device)
+        return changed
+
+    def states(self):
+        """{name: state name} of every device, for diagnostics"""
+        return {d.name: STATE_NAMES[d.state] for d in self.devices}
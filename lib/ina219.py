@@ -5,6 +5,7 @@ MicroPython using the I2C bus.
 """
 import logging
 import utime
+import uasyncio as asyncio
 from math import trunc
 from micropython import const
 
@@ -133,6 +134,7 @@ class INA219:
         self._min_device_current_lsb = self._calculate_min_current_lsb()
         self._gain = None
         self._auto_gain_enabled = False
+        self._register_buf = bytearray(2)
 
     def configure(self, voltage_range=RANGE_32V, gain=GAIN_AUTO,
                   bus_adc=ADC_12BIT, shunt_adc=ADC_12BIT):
@@ -194,6 +196,47 @@ class INA219:
         value = self._voltage_register()
         return float(value) * self.__BUS_MILLIVOLTS_LSB / 1000
 
+    def snapshot(self):
+        """Return (voltage, current, power, shunt voltage) read in one pass.
+
+        Voltage is in volts, current in milliamps, power in milliwatts and
+        shunt voltage in millivolts. The bus voltage register, with the
+        overflow flag, is read once for all four values and the registers
+        are read back to back, so they come from the same conversion.
+        A DeviceRangeError exception is thrown if current overflow occurs.
+        """
+        return self.__snapshot(self.__read_register_fast(self.__REG_BUSVOLTAGE))
+
+    async def snapshot_async(self, timeout_ms=100):
+        """Like snapshot(), but first awaits the conversion ready (CNVR) flag.
+
+        Reading the power register clears the flag, so consecutive calls
+        always return values from a new conversion. After timeout_ms the
+        latest values are returned anyway.
+        """
+        start = utime.ticks_ms()
+        bus = self.__read_register_fast(self.__REG_BUSVOLTAGE)
+        while not bus & self.__CNVR:
+            if utime.ticks_diff(utime.ticks_ms(), start) > timeout_ms:
+                break
+            await asyncio.sleep_ms(1)
+            bus = self.__read_register_fast(self.__REG_BUSVOLTAGE)
+        return self.__snapshot(bus)
+
+    def __snapshot(self, bus):
+        while bus & self.__OVF:
+            if not self._auto_gain_enabled:
+                raise DeviceRangeError(self.__GAIN_VOLTS[self._gain])
+            self._increase_gain()
+            bus = self.__read_register_fast(self.__REG_BUSVOLTAGE)
+        shunt = self.__read_register_fast(self.__REG_SHUNTVOLTAGE, True)
+        current = self.__read_register_fast(self.__REG_CURRENT, True)
+        power = self.__read_register_fast(self.__REG_POWER)
+        return ((bus >> 3) * self.__BUS_MILLIVOLTS_LSB / 1000,
+                current * self._current_lsb * 1000,
+                power * self._power_lsb * 1000,
+                shunt * self.__SHUNT_MILLIVOLTS_LSB)
+
     def supply_voltage(self):
         """Return the bus supply voltage in volts.
 
@@ -404,6 +447,15 @@ class INA219:
         self.__log_register_operation("read", register, register_value)
         return register_value
 
+    def __read_register_fast(self, register, negative_value_supported=False):
+        # Reads into a preallocated buffer and skips logging, for snapshot()
+        buf = self._register_buf
+        self._i2c.readfrom_mem_into(self._address, register, buf)
+        register_value = (buf[0] << 8) | buf[1]
+        if negative_value_supported and register_value > 32767:
+            register_value -= 65536
+        return register_value
+
     def __log_register_operation(self, msg, register, value):
         # performance optimisation
         if logging._level == logging.DEBUG:
@@ -0,0 +1,171 @@
+"""
+Append-only ring log store for data that could not be uploaded.
+
+Records are written into a fixed number of preallocated segment files, so
+appending never creates files or grows the filesystem. Every record slot has
+the same size and holds a small header (sequence number, CRC32 and length)
+followed by the payload. The slot of a record follows from its sequence
+number, so the read cursor is a single persisted integer and reads never scan.
+
+When the store is full the oldest records are overwritten.
+"""
+
+import binascii
+import ustruct as struct
+from micropython import const
+
+_HEADER = "<IIH"  # sequence number, crc32 of payload, payload length
+_HEADER_SIZE = const(10)
+_META = "<HHHH"  # format version, segments, records per segment, payload size
+_VERSION = const(1)
+
+
+class LogStore:
+    """Ring buffer of fixed size records spread over preallocated segment files.
+       :param str path: directory holding the segment, meta and cursor files.
+       :param int segments: number of segment files.
+       :param int records_per_segment: record slots in each segment file.
+       :param int payload_size: largest payload a record can hold."""
+
+    def __init__(self, path, segments=4, records_per_segment=128, payload_size=256):
+        self._path = path
+        self._segments = segments
+        self._per_segment = records_per_segment
+        self._payload_size = payload_size
+        self._record_size = _HEADER_SIZE + payload_size
+        self.capacity = segments * records_per_segment
+        self._buf = bytearray(self._record_size)
+        self._mv = memoryview(self._buf)
+        self._zeros = memoryview(bytes(payload_size))
+        self.dropped = 0  # records overwritten before they were read
+
+        if not self._load_meta():
+            self._format()
+        self._next = self._find_next()
+        self._read = self._load_cursor()
+
+    # ------------------------------------------------------------ setup
+
+    def _file(self, name):
+        return "{}/{}".format(self._path, name)
+
+    def _segment(self, index):
+        return self._file("ring{}.bin".format(index))
+
+    def _load_meta(self):
+        """Returns True if the files on flash match this store's geometry"""
+        try:
+            with open(self._file("ring.meta"), "rb") as f:
+                meta = struct.unpack(_META, f.read(8))
+        except (OSError, ValueError):
+            return False
+        return meta == (_VERSION, self._segments, self._per_segment, self._payload_size)
+
+    def _format(self):
+        """Preallocate empty segments, discarding any previous store"""
+        for i in range(self._segments):
+            self._mv[:] = bytes(self._record_size)
+            with open(self._segment(i), "wb") as f:
+                for _ in range(self._per_segment):
+                    f.write(self._buf)
+        with open(self._file("ring.meta"), "wb") as f:
+            f.write(struct.pack(_META, _VERSION, self._segments,
+                                self._per_segment, self._payload_size))
+        self._save_cursor(1)
+
+    def _find_next(self):
+        """Find the sequence number following the newest record on flash"""
+        newest = 0
+        header = self._mv[:_HEADER_SIZE]
+        for i in range(self._segments):
+            with open(self._segment(i), "rb") as f:
+                for slot in range(self._per_segment):
+                    f.seek(slot * self._record_size)
+                    f.readinto(header)
+                    seq = struct.unpack_from("<I", self._buf, 0)[0]
+                    if seq > newest:
+                        newest = seq
+        return newest + 1
+
+    def _load_cursor(self):
+        try:
+            with open(self._file("ring.cur"), "rb") as f:
+                cursor = struct.unpack("<I", f.read(4))[0]
+        except (OSError, ValueError):
+            cursor = 1
+        return min(max(cursor, self._oldest()), self._next)
+
+    def _save_cursor(self, cursor):
+        with open(self._file("ring.cur"), "wb") as f:
+            f.write(struct.pack("<I", cursor))
+
+    def _oldest(self):
+        return max(1, self._next - self.capacity)
+
+    def _locate(self, seq):
+        """Returns (segment index, byte offset) of the slot for seq"""
+        index = (seq - 1) % self.capacity
+        return index // self._per_segment, (index % self._per_segment) * self._record_size
+
+    # -------------------------------------------------------------- API
+
+    def pending(self):
+        """Number of records appended but not yet committed"""
+        return self._next - self._read
+
+    def append(self, payload):
+        """Write payload as the newest record, overwriting the oldest if full"""
+        n = len(payload)
+        if n > self._payload_size:
+            raise ValueError("record too large")
+        seq = self._next
+        struct.pack_into(_HEADER, self._buf, 0, seq, binascii.crc32(payload), n)
+        self._mv[_HEADER_SIZE:_HEADER_SIZE + n] = payload
+        self._mv[_HEADER_SIZE + n:] = self._zeros[n:]
+        segment, offset = self._locate(seq)
+        with open(self._segment(segment), "r+b") as f:
+            f.seek(offset)
+            f.write(self._buf)
+        self._next = seq + 1
+        if self._read < self._oldest():
+            self.dropped += self._oldest() - self._read
+            self._read = self._oldest()
+
+    def read(self, max_records, start=None):
+        """Read up to max_records from the cursor, or from sequence number
+           start, without consuming them. Returns (list of payloads, last
+           sequence number read). Records that fail their CRC are skipped.
+           Pass the sequence number to commit() once the records have been
+           handled."""
+        records = []
+        seq = self._read if start is None else max(start, self._read)
+        end = min(self._next, seq + max_records)
+        f = None
+        segment = -1
+        try:
+            while seq < end:
+                s, offset = self._locate(seq)
+                if s != segment:
+                    if f:
+                        f.close()
+                    f = open(self._segment(s), "rb")
+                    segment = s
+                f.seek(offset)
+                f.readinto(self._buf)
+                rseq, crc, n = struct.unpack_from(_HEADER, self._buf, 0)
+                if rseq == seq and n <= self._payload_size:
+                    payload = bytes(self._mv[_HEADER_SIZE:_HEADER_SIZE + n])
+                    if binascii.crc32(payload) == crc:
+                        records.append(payload)
+                seq += 1
+        finally:
+            if f:
+                f.close()
+        return records, seq - 1
+
+    def commit(self, seq):
+        """Mark every record up to and including seq as handled"""
+        cursor = min(seq + 1, self._next)
+        if cursor > self._read:
+            self._read = cursor
+            self._save_cursor(cursor)
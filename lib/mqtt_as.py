@@ -100,6 +100,8 @@ config = {
     "ssid": None,
     "wifi_pw": None,
     "queue_len": 0,
+    "max_inflight": 4,
+    "gc_collect": True,  # collect garbage every second while connected
 }
 
 
@@ -136,6 +138,8 @@ class MQTT_base:
             raise ValueError("invalid keepalive time")
         self._response_time = config["response_time"] * 1000  # Repub if no PUBACK received (ms).
         self._max_repubs = config["max_repubs"]
+        self._max_inflight = config["max_inflight"]  # qos 1 publications awaiting PUBACK
+        self._gc_collect = config.get("gc_collect", True)
         self._clean_init = config["clean_init"]  # clean_session state on first connection
         self._clean = config["clean"]  # clean_session state on reconnect
         will = config["will"]
@@ -170,6 +174,9 @@ class MQTT_base:
 
         self.newpid = pid_gen()
         self.rcv_pids = set()  # PUBACK and SUBACK pids awaiting ACK response
+        self._pid_evts = {}  # Event per pid in rcv_pids, set when the ACK arrives
+        self._inflight = 0  # qos 1 publications in flight
+        self._window = asyncio.Event()  # Set when an in-flight slot is freed
         self.last_rx = ticks_ms()  # Time of last communication from broker
         self.lock = asyncio.Lock()
 
@@ -376,38 +383,76 @@ class MQTT_base:
             self.dprint("Wi-Fi not started, unable to disconnect interface")
         self._sta_if.active(False)
 
+    def _add_pid(self, pid):  # Register a pid awaiting an ACK
+        self.rcv_pids.add(pid)
+        self._pid_evts[pid] = asyncio.Event()
+
+    def _ack_pid(self, pid):  # Called by wait_msg when an ACK arrives
+        if pid not in self.rcv_pids:
+            return False
+        self.rcv_pids.discard(pid)
+        evt = self._pid_evts.pop(pid, None)
+        if evt is not None:
+            evt.set()
+        return True
+
+    def _release_pid(self, pid):  # Forget a pid that will not be ACKed
+        self.rcv_pids.discard(pid)
+        self._pid_evts.pop(pid, None)
+
+    # Wake every coro awaiting an ACK, eg: because the connection went down.
+    def _wake_pids(self):
+        for evt in self._pid_evts.values():
+            evt.set()
+
+    # Wait for the ACK event, no polling. Returns False on timeout or if
+    # woken by a connection failure.
     async def _await_pid(self, pid):
-        t = ticks_ms()
-        while pid in self.rcv_pids:  # local copy
-            if self._timeout(t) or not self.isconnected():
-                break  # Must repub or bail out
-            await asyncio.sleep_ms(100)
-        else:
-            return True  # PID received. All done.
-        return False
+        evt = self._pid_evts.get(pid)
+        if evt is None:
+            return pid not in self.rcv_pids
+        evt.clear()
+        if pid in self.rcv_pids and self.isconnected():
+            try:
+                await asyncio.wait_for_ms(evt.wait(), self._response_time)
+            except asyncio.TimeoutError:
+                pass
+        return pid not in self.rcv_pids
 
     # qos == 1: coro blocks until wait_msg gets correct PID.
+    # Up to max_inflight qos 1 publications from concurrent coros may await
+    # their PUBACK at once; further ones wait for a free slot.
     # If WiFi fails completely subclass re-publishes with new PID.
     async def publish(self, topic, msg, retain, qos):
-        pid = next(self.newpid)
-        if qos:
-            self.rcv_pids.add(pid)
-        async with self.lock:
-            await self._publish(topic, msg, retain, qos, 0, pid)
         if qos == 0:
+            async with self.lock:
+                await self._publish(topic, msg, retain, qos, 0, next(self.newpid))
             return
 
-        count = 0
-        while 1:  # Await PUBACK, republish on timeout
-            if await self._await_pid(pid):
-                return
-            # No match
-            if count >= self._max_repubs or not self.isconnected():
-                raise OSError(-1)  # Subclass to re-publish with new PID
+        while self._inflight >= self._max_inflight:
+            self._window.clear()
+            await self._window.wait()
+        self._inflight += 1
+        pid = next(self.newpid)
+        self._add_pid(pid)
+        try:
             async with self.lock:
-                await self._publish(topic, msg, retain, qos, dup=1, pid=pid)  # Add pid
-            count += 1
-            self.REPUB_COUNT += 1
+                await self._publish(topic, msg, retain, qos, 0, pid)
+            count = 0
+            while 1:  # Await PUBACK, republish on timeout
+                if await self._await_pid(pid):
+                    return
+                # No match
+                if count >= self._max_repubs or not self.isconnected():
+                    raise OSError(-1)  # Subclass to re-publish with new PID
+                async with self.lock:
+                    await self._publish(topic, msg, retain, qos, dup=1, pid=pid)  # Add pid
+                count += 1
+                self.REPUB_COUNT += 1
+        finally:
+            self._release_pid(pid)
+            self._inflight -= 1
+            self._window.set()
 
     async def _publish(self, topic, msg, retain, qos, dup, pid):
         pkt = bytearray(b"\x30\0\0\0")
@@ -434,28 +479,34 @@ class MQTT_base:
     async def subscribe(self, topic, qos):
         pkt = bytearray(b"\x82\0\0\0")
         pid = next(self.newpid)
-        self.rcv_pids.add(pid)
+        self._add_pid(pid)
         struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, pid)
-        async with self.lock:
-            await self._as_write(pkt)
-            await self._send_str(topic)
-            await self._as_write(qos.to_bytes(1, "little"))
+        try:
+            async with self.lock:
+                await self._as_write(pkt)
+                await self._send_str(topic)
+                await self._as_write(qos.to_bytes(1, "little"))
 
-        if not await self._await_pid(pid):
-            raise OSError(-1)
+            if not await self._await_pid(pid):
+                raise OSError(-1)
+        finally:
+            self._release_pid(pid)
 
     # Can raise OSError if WiFi fails. Subclass traps.
     async def unsubscribe(self, topic):
         pkt = bytearray(b"\xa2\0\0\0")
         pid = next(self.newpid)
-        self.rcv_pids.add(pid)
+        self._add_pid(pid)
         struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic), pid)
-        async with self.lock:
-            await self._as_write(pkt)
-            await self._send_str(topic)
+        try:
+            async with self.lock:
+                await self._as_write(pkt)
+                await self._send_str(topic)
 
-        if not await self._await_pid(pid):
-            raise OSError(-1)
+            if not await self._await_pid(pid):
+                raise OSError(-1)
+        finally:
+            self._release_pid(pid)
 
     # Wait for a single incoming MQTT message and process it.
     # Subscribed messages are delivered to a callback previously
@@ -486,9 +537,7 @@ class MQTT_base:
                 raise OSError(-1, "Invalid PUBACK packet")
             rcv_pid = await self._as_read(2)
             pid = rcv_pid[0] << 8 | rcv_pid[1]
-            if pid in self.rcv_pids:
-                self.rcv_pids.discard(pid)
-            else:
+            if not self._ack_pid(pid):
                 raise OSError(-1, "Invalid pid in PUBACK packet")
 
         if op == 0x90:  # SUBACK
@@ -496,17 +545,13 @@ class MQTT_base:
             if resp[3] == 0x80:
                 raise OSError(-1, "Invalid SUBACK packet")
             pid = resp[2] | (resp[1] << 8)
-            if pid in self.rcv_pids:
-                self.rcv_pids.discard(pid)
-            else:
+            if not self._ack_pid(pid):
                 raise OSError(-1, "Invalid pid in SUBACK packet")
 
         if op == 0xB0:  # UNSUBACK
             resp = await self._as_read(3)
             pid = resp[2] | (resp[1] << 8)
-            if pid in self.rcv_pids:
-                self.rcv_pids.discard(pid)
-            else:
+            if not self._ack_pid(pid):
                 raise OSError(-1)
 
         if op & 0xF0 != 0x30:
@@ -712,6 +757,7 @@ class MQTTClient(MQTT_base):
     def _reconnect(self):  # Schedule a reconnection if not underway.
         if self._isconnected:
             self._isconnected = False
+            self._wake_pids()  # Publications awaiting an ACK must bail out
             asyncio.create_task(self._kill_tasks(True))  # Shut down tasks and socket
             if self._events:  # Signal an outage
                 self.down.set()
@@ -729,7 +775,8 @@ class MQTTClient(MQTT_base):
         while self._has_connected:
             if self.isconnected():  # Pause for 1 second
                 await asyncio.sleep(1)
-                gc.collect()
+                if self._gc_collect:
+                    gc.collect()
             else:  # Link is down, socket is closed, tasks are killed
                 try:
                     self._sta_if.disconnect()
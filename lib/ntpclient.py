@@ -1,6 +1,7 @@
 # ntpclient_base.py
 
 import sys
+import network
 import usocket as socket
 import ustruct as struct
 from machine import RTC, Pin
@@ -11,12 +12,23 @@ import utime
 NTP_DELTA = 3155673600
 # (date(2000, 1, 1) - date(1970, 1, 1)).days * 24*60*60
 UNIX_DELTA = 946684800
+# Seconds between the NTP epoch (1900) and the epoch of utime on this port
+EPOCH_DELTA = NTP_DELTA if utime.localtime(0)[0] == 2000 else NTP_DELTA - UNIX_DELTA
 
 # Poll and adjust intervals
 MIN_POLL = 64           # never poll faster than every 32 seconds
 MAX_POLL = 1024         # default maximum poll interval
 ADJ_INTERVAL = 2        # interval in seconds to call adjtime()
 
+# rp2 clock discipline
+SAMPLES = 4             # requests per poll, the one with the lowest delay is used
+SAMPLE_SPACING = 2      # seconds between the requests of one poll
+STEP_THRESHOLD = 16     # offsets of more seconds than this are stepped
+SLEW_INTERVAL = 30      # seconds between one second slew corrections
+STABLE_US = 250000      # offsets below this let the poll interval grow
+RESOLVE_AFTER = 3       # failed requests in a row before the host is looked up again
+DNS_TIMEOUT = 2         # seconds to wait for the DNS reply
+
 # time_add_us() -
 #   Adds a number of microseconds to a timestamp.
 #   Returns a timestamp.
@@ -40,10 +52,13 @@ def time_diff_us(ts1, ts2):
 #   Class implementing the uasyncio based NTP client
 class ntpclient_base:
     def __init__(self, host = 'pool.ntp.org', poll = MAX_POLL,
-                 max_startup_delta = 1, debug = False):
+                 max_startup_delta = 1, debug = False, tz_offset = 0):
         self.host = host
+        self.dns = None         # DNS server address, the one of the WLAN if None
+        self.tz_offset = tz_offset  # seconds the RTC runs ahead of UTC
         self.sock = None
         self.addr = None
+        self.failures = 0       # failed requests since the last good reply
         self.rstr = None
         self.wstr = None
         self.req_poll = poll
@@ -55,13 +70,69 @@ class ntpclient_base:
         asyncio.create_task(self._poll_task())
         asyncio.create_task(self._adj_task())
 
+    # _resolve() -
+    #   Looks up the address of the server with a DNS query of our own.
+    #   getaddrinfo() blocks until the DNS server answers or times out,
+    #   this awaits the reply so the other tasks keep running meanwhile.
+    #   Returns an (ip, port) tuple.
+    async def _resolve(self):
+        if all(part.isdigit() for part in self.host.split('.')):
+            return (self.host, 123)
+        query = bytearray(b"\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+        struct.pack_into("!H", query, 0, utime.ticks_us() & 0xFFFF)
+        for label in self.host.split('.'):
+            query.append(len(label))
+            query.extend(label.encode())
+        query.extend(b"\x00\x00\x01\x00\x01")  # end of name, type A, class IN
+
+        server = self.dns or network.WLAN(network.STA_IF).ifconfig()[3]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect((server, 53))
+            writer = asyncio.StreamWriter(sock)
+            writer.write(query)
+            await writer.drain()
+            try:
+                reply = await asyncio.wait_for(asyncio.StreamReader(sock).read(512), DNS_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise Exception("timeout looking up " + self.host)
+        finally:
+            sock.close()
+
+        if len(reply) < 12 or reply[0:2] != query[0:2] or reply[3] & 0x0F:
+            raise Exception("failed to look up " + self.host)
+        answers = struct.unpack_from("!H", reply, 6)[0]
+        offset = self._skip_name(reply, 12) + 4  # the question, then its type and class
+        for _ in range(answers):
+            offset = self._skip_name(reply, offset)
+            rtype, _, _, length = struct.unpack_from("!HHIH", reply, offset)
+            offset += 10
+            if rtype == 1 and length == 4:
+                return ("{}.{}.{}.{}".format(*reply[offset:offset + 4]), 123)
+            offset += length
+        raise Exception("no address for " + self.host)
+
+    @staticmethod
+    def _skip_name(reply, offset):
+        # Returns the offset after a name in a DNS message
+        while True:
+            length = reply[offset]
+            if length & 0xC0 == 0xC0:
+                return offset + 2  # compressed, a pointer ends the name
+            offset += length + 1
+            if not length:
+                return offset
+
     async def _poll_server(self):
         # We try to stay with the same server as long as possible. Only
-        # lookup the address on startup or after errors.
+        # lookup the address on startup or after RESOLVE_AFTER failed
+        # requests in a row, other errors just reopen the socket.
         if self.sock is None:
-            self.addr = socket.getaddrinfo(self.host, 123)[0][-1]
-            if self.debug:
-                print("ntpclient: new server address:", self.addr)
+            if self.addr is None or self.failures >= RESOLVE_AFTER:
+                self.addr = await self._resolve()
+                self.failures = 0
+                if self.debug:
+                    print("ntpclient: new server address:", self.addr)
 
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sock.connect(self.addr)
@@ -69,10 +140,12 @@ class ntpclient_base:
             self.rstr = asyncio.StreamReader(self.sock)
             self.wstr = asyncio.StreamWriter(self.sock)
 
-        # Send the NTP v3 request to the server
+        # Send the NTP v3 request to the server. The transmit timestamp is
+        # only used to match the reply, the server echoes it back.
         wbuf = bytearray(48)
         wbuf[0] = 0b00011011
         start_ticks = utime.ticks_us()
+        struct.pack_into("!I", wbuf, 44, start_ticks)
         self.wstr.write(wbuf)
         await self.wstr.drain()
 
@@ -86,14 +159,14 @@ class ntpclient_base:
         roundtrip_us = utime.ticks_diff(utime.ticks_us(), start_ticks)
 
         # Record the current time as a (sec, usec) tuple
-        now = self.rtc.datetime()
-        dtnow = (now[0], now[1], now[2], now[4], now[5], now[6], 0, 0)
-        if sys.platform == 'esp32':
-            tnow = (utime.mktime(dtnow), now[7])
-        elif sys.platform == 'esp8266':
-            tnow = (utime.mktime(dtnow), now[7] * 1000)
-        else:
-            raise RuntimeError("unsupported platform '{}'".format(sys.platform))
+        tnow = self._now()
+
+        # Reject short, stale and unsynchronized replies
+        if len(rbuf) < 48 or rbuf[24:32] != wbuf[40:48]:
+            raise Exception("unexpected reply from server")
+        if rbuf[0] >> 6 == 3 or rbuf[0] & 0x07 != 4 or not 0 < rbuf[1] < 16:
+            raise Exception("server is not synchronized")
+        self.failures = 0
 
         # Get the server's receive and send timestamps in (sec, frac)
         # tuple format (epoch = 1900)
@@ -106,8 +179,8 @@ class ntpclient_base:
         # t2 = server side transmit time
         # t3 = client side receive time (based on that sent time ^^^^)
         #t0 = (0,0)
-        t1 = (d1[0] - NTP_DELTA, int(d1[1] / 4294.967))
-        t2 = (d2[0] - NTP_DELTA, int(d2[1] / 4294.967))
+        t1 = (d1[0] - EPOCH_DELTA, int(d1[1] / 4294.967))
+        t2 = (d2[0] - EPOCH_DELTA, int(d2[1] / 4294.967))
         #t3 = (0, roundtrip_us)
 
         # Calculate the delay (round trip minus time spent on the server)
@@ -117,6 +190,33 @@ class ntpclient_base:
         # tuple. Delay and delta are in microseconds, ts2 is (sec, usec).
         return (delay, time_diff_us(tnow, t2), t2)
 
+    # _now() -
+    #   Returns the RTC time in UTC as a (sec, usec) tuple.
+    def _now(self):
+        now = self.rtc.datetime()
+        dtnow = (now[0], now[1], now[2], now[4], now[5], now[6], 0, 0)
+        if sys.platform == 'esp32':
+            tnow = (utime.mktime(dtnow), now[7])
+        elif sys.platform == 'esp8266':
+            tnow = (utime.mktime(dtnow), now[7] * 1000)
+        elif sys.platform == 'rp2':
+            # the rp2 RTC has no subseconds
+            tnow = (utime.mktime(dtnow), 0)
+        else:
+            raise RuntimeError("unsupported platform '{}'".format(sys.platform))
+        return (tnow[0] - self.tz_offset, tnow[1])
+
+    # _close() -
+    #   Closes the socket after an error, the address is kept until
+    #   RESOLVE_AFTER requests failed.
+    def _close(self):
+        self.failures += 1
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.rstr = None
+        self.wstr = None
+
     async def _poll_task(self):
         # Needs to be implemented per platform
         pass
@@ -124,3 +224,143 @@ class ntpclient_base:
     async def _adj_task(self):
         # Needs to be implemented per platform
         pass
+
+
+# ntpclient -
+#   rp2 implementation.
+#
+#   The rp2 RTC only counts whole seconds and cannot be trimmed, so the
+#   clock is disciplined in whole seconds. Before every poll the client
+#   waits for the RTC second to roll over and measures from that edge with
+#   ticks_ms(), which gives offsets to a few milliseconds. Each poll sends
+#   SAMPLES requests and keeps the one with the lowest delay. Offsets of
+#   more than STEP_THRESHOLD seconds, and a first sample that is off by
+#   half a second or more, step the RTC on a second boundary. Smaller offsets of a second or more are
+#   slewed one second every SLEW_INTERVAL seconds. The poll interval
+#   doubles from MIN_POLL up to poll while the clock stays within
+#   STABLE_US, and halves again when it does not.
+#
+#   on_step is called without arguments after the first good sample, after
+#   the RTC was stepped and after a slew finished. ready is a callable returning False while the network
+#   is down, polls are skipped until it returns True.
+class ntpclient(ntpclient_base):
+    def __init__(self, host = 'pool.ntp.org', poll = MAX_POLL,
+                 max_startup_delta = 1, debug = False, tz_offset = 0,
+                 on_step = None, ready = None):
+        self.on_step = on_step
+        self.ready = ready
+        self.synced = False
+        self.offset = None      # last measured offset in microseconds
+        self._edge = (0, 0)     # (RTC second, ticks_ms) at the last roll over
+        self._slew = 0          # whole seconds left to slew
+        self._polling = False
+        super().__init__(host, poll, max_startup_delta, debug, tz_offset)
+
+    def _now(self):
+        sec, ticks = self._edge
+        ms = utime.ticks_diff(utime.ticks_ms(), ticks)
+        return (sec + ms // 1000 - self.tz_offset, (ms % 1000) * 1000)
+
+    async def _find_edge(self):
+        # Wait for the RTC second to change, polling every 10ms
+        sec = utime.time()
+        for _ in range(110):
+            await asyncio.sleep_ms(10)
+            now = utime.time()
+            if now != sec:
+                self._edge = (now, utime.ticks_ms())
+                return
+        raise RuntimeError("RTC is not running")
+
+    async def _sample(self):
+        # Returns the (delay, offset) of the best of SAMPLES requests or
+        # None if none of them succeeded. The offset is positive when
+        # the RTC is ahead.
+        best = None
+        await self._find_edge()
+        for i in range(SAMPLES):
+            if i:
+                await asyncio.sleep(SAMPLE_SPACING)
+            try:
+                delay, delta, _ = await self._poll_server()
+            except Exception as e:
+                if self.debug:
+                    print("ntpclient:", e)
+                self._close()
+                continue
+            if best is None or delay < best[0]:
+                best = (delay, delta - delay // 2)
+        return best
+
+    def _set_rtc(self, sec):
+        # Set the RTC to sec (UTC, utime epoch) plus the time zone offset
+        t = utime.localtime(sec + self.tz_offset)
+        self.rtc.datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+
+    async def _step(self, offset):
+        # Wait for the next full second of network time and set the RTC
+        sec, usec = time_add_us(self._now(), -offset)
+        await asyncio.sleep_ms((1000000 - usec) // 1000)
+        self._set_rtc(sec + 1)
+        self._slew = 0
+        if self.debug:
+            print("ntpclient: stepped RTC by {}us".format(-offset))
+        self._stepped()
+
+    def _stepped(self):
+        if self.on_step:
+            self.on_step()
+
+    async def _poll_task(self):
+        while True:
+            if self.ready and not self.ready():
+                await asyncio.sleep(5)
+                continue
+            self._polling = True
+            try:
+                sample = await self._sample()
+            except Exception as e:
+                if self.debug:
+                    print("ntpclient:", e)
+                sample = None
+
+            if sample is None:
+                self.poll = max(self.poll // 2, MIN_POLL)
+            else:
+                delay, offset = sample
+                self.offset = offset
+                if self.debug:
+                    print("ntpclient: delay {}us offset {}us".format(delay, offset))
+                if not self.synced and abs(offset) >= min(self.max_startup_delta, 500000) \
+                        or abs(offset) > STEP_THRESHOLD * 1000000:
+                    await self._step(offset)
+                else:
+                    # offsets under half a second are below the RTC resolution
+                    self._slew = -round(offset / 1000000)
+                    if not self.synced:
+                        # the RTC was already right
+                        self._stepped()
+                self.synced = True
+                if abs(offset) < STABLE_US:
+                    self.poll = min(self.poll * 2, self.req_poll)
+                else:
+                    self.poll = max(self.poll // 2, MIN_POLL)
+            self._polling = False
+
+            await asyncio.sleep(self.poll)
+
+    async def _adj_task(self):
+        while True:
+            await asyncio.sleep(SLEW_INTERVAL)
+            if not self._slew or self._polling:
+                continue
+            # Move the RTC by one second right after it rolled over
+            step = 1 if self._slew > 0 else -1
+            try:
+                await self._find_edge()
+            except RuntimeError:
+                continue
+            self._set_rtc(utime.time() - self.tz_offset + step)
+            self._slew -= step
+            if not self._slew:
+                self._stepped()
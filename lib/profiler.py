@@ -0,0 +1,154 @@
+"""
+Per task run time and stall detection for the uasyncio event loop.
+
+Profiler.wrap() puts a probe around a coroutine. uasyncio resumes the task
+through the probe's send() and throw(), which time each step, the code that
+runs between two yields, with utime.ticks_us(). For every task it keeps the
+cumulative run time, the number of wakes and the longest step. Steps longer
+than stall_ms are stalls: the task held the loop and every other task,
+including the watchdog feeder, had to wait.
+
+On the rp2 port the task that is running and the last stall are also kept in
+the watchdog scratch registers, which survive soft resets and watchdog
+resets, so after a reset the profiler knows which task held the loop.
+"""
+
+import sys
+import utime
+from machine import mem32
+
+# Watchdog SCRATCH0-2 of the RP2040, SCRATCH4-7 are used by the bootrom
+_SCRATCH_RUNNING = const(0x4005800C)  # _MAGIC | index of the running task
+_SCRATCH_STALL = const(0x40058010)    # index << 24 | stall ms
+_SCRATCH_STALLS = const(0x40058014)   # stalls since power on
+_MAGIC = const(0x10AD0000)
+_IDLE = const(0xFF)
+
+_RP2 = sys.platform == "rp2"
+
+
+class _Probe:
+    """Wraps one coroutine, uasyncio resumes the task through send() and throw()"""
+
+    def __init__(self, profiler, index, coro):
+        self._profiler = profiler
+        self._index = index
+        self._coro = coro
+
+    def send(self, value):
+        profiler = self._profiler
+        profiler._enter(self._index)
+        start = utime.ticks_us()
+        try:
+            return self._coro.send(value)
+        finally:
+            profiler._leave(self._index, utime.ticks_diff(utime.ticks_us(), start))
+
+    def throw(self, *args):
+        profiler = self._profiler
+        profiler._enter(self._index)
+        start = utime.ticks_us()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            profiler._leave(self._index, utime.ticks_diff(utime.ticks_us(), start))
+
+    def close(self):
+        return self._coro.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def __await__(self):
+        return self
+
+
+class Profiler:
+    """Run time statistics of the tasks named in `names`.
+       :param names: task names, in the same order on every boot so the
+           scratch registers can be decoded after a reset.
+       :param int stall_ms: steps longer than this are reported as stalls.
+       :param bool enabled: when False wrap() returns the coroutine as is."""
+
+    def __init__(self, names, stall_ms=500, enabled=True):
+        self.names = tuple(names)
+        self.enabled = enabled
+        self._stall_us = stall_ms * 1000
+        n = len(self.names)
+        self.run_us = [0] * n
+        self.wakes = [0] * n
+        self.max_us = [0] * n
+        self.stalls = 0
+        self.last_stall = None  # (task name, ms)
+        # task that was running when the board last reset, None if the loop
+        # was between tasks or nothing is known
+        self.reset_task = None
+        self._restore()
+
+    def _restore(self):
+        if not _RP2:
+            return
+        if mem32[_SCRATCH_RUNNING] & 0xFFFF0000 == _MAGIC:
+            self.reset_task = self.name(mem32[_SCRATCH_RUNNING] & 0xFF)
+            stall = mem32[_SCRATCH_STALL]
+            if stall:
+                self.last_stall = (self.name(stall >> 24), stall & 0xFFFFFF)
+            self.stalls = mem32[_SCRATCH_STALLS]
+        else:  # power on, the registers hold nothing of ours
+            mem32[_SCRATCH_STALL] = 0
+            mem32[_SCRATCH_STALLS] = 0
+        mem32[_SCRATCH_RUNNING] = _MAGIC | _IDLE
+
+    def name(self, index):
+        if index == _IDLE:
+            return None
+        return self.names[index] if index < len(self.names) else "task " + str(index)
+
+    def wrap(self, name, coro):
+        """Returns coro wrapped in a probe, pass the result to create_task() or gather()"""
+        if not self.enabled:
+            return coro
+        return _Probe(self, self.names.index(name), coro)
+
+    def _enter(self, index):
+        if _RP2:
+            mem32[_SCRATCH_RUNNING] = _MAGIC | index
+
+    def _leave(self, index, us):
+        if _RP2:
+            mem32[_SCRATCH_RUNNING] = _MAGIC | _IDLE
+        self.run_us[index] += us
+        self.wakes[index] += 1
+        if us > self.max_us[index]:
+            self.max_us[index] = us
+        if us > self._stall_us:
+            self._stalled(index, us // 1000)
+
+    def _stalled(self, index, ms):
+        self.stalls += 1
+        self.last_stall = (self.names[index], ms)
+        print("stall: " + self.names[index] + " held the event loop for " + str(ms) + " ms")
+        if _RP2:
+            mem32[_SCRATCH_STALL] = index << 24 | max(1, min(ms, 0xFFFFFF))
+            mem32[_SCRATCH_STALLS] = self.stalls
+
+    def summary(self, reset=True):
+        """Returns a dict for the diagnostics topic. tasks holds
+           [name, run ms, wakes, longest step ms] for each task since the
+           last reset of the counters."""
+        tasks = [[self.names[i], self.run_us[i] // 1000, self.wakes[i], self.max_us[i] // 1000]
+                 for i in range(len(self.names))]
+        if reset:
+            for i in range(len(self.names)):
+                self.run_us[i] = 0
+                self.wakes[i] = 0
+                self.max_us[i] = 0
+        return {
+            "reset task": self.reset_task,
+            "last stall": self.last_stall,
+            "stalls": self.stalls,
+            "tasks": tasks,
+        }
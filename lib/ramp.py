@@ -0,0 +1,93 @@
+"""
+Dawn and dusk ramps for the light schedule, compiled into integer tables.
+
+schedule() turns the light timer, the duty of each channel and the ramp
+lengths into a day of keyframes: the second of the day at which each one
+starts (an array of ints, sorted) and the duty_u16 of every channel from
+then until the next keyframe. Ramps are sampled `steps` times, so the float
+math runs once when the schedule is loaded and the control loop only looks
+up the current keyframe, writes the channels that changed and sleeps until
+the next keyframe. Keyframes that would not change any channel are left out.
+
+Without ramps the day has two keyframes, the on and the off time. A channel
+ramps up over its dawn length starting at the on time and down over its dusk
+length ending at the off time. When both ramps are longer than the time the
+lights are on, the lower of the two wins.
+"""
+
+import math
+from array import array
+
+SHAPES = ("sine", "linear")
+
+
+def _level(shape, x):
+    """Fraction of the full duty x of the way through a ramp, 0 <= x <= 1"""
+    if shape == "linear":
+        return x
+    return (1 - math.cos(math.pi * x)) / 2
+
+
+def _lit(second, on, off):
+    if on <= off:
+        return on <= second < off
+    return second >= on or second < off
+
+
+def duties_at(second, on, off, on_duties, off_duties, dawn, dusk, shape="sine"):
+    """Duties of every channel at a second of the day. on_duties and
+       off_duties are duty_u16 values, dawn and dusk the ramp length of
+       each channel in seconds, 0 for none."""
+    if not _lit(second, on, off):
+        return tuple(off_duties)
+    since = (second - on) % 86400
+    until = (off - second) % 86400
+    duties = []
+    for i, duty in enumerate(on_duties):
+        level = 1
+        if dawn[i] and since < dawn[i]:
+            level = min(level, _level(shape, since / dawn[i]))
+        if dusk[i] and until < dusk[i]:
+            level = min(level, _level(shape, until / dusk[i]))
+        duties.append(int((duty >> 8) * level + 0.5) << 8)
+    return tuple(duties)
+
+
+def schedule(on, off, on_duties, off_duties, dawn, dusk, shape="sine", steps=64):
+    """Returns (keyframe seconds of the day, duties of each keyframe)"""
+    # the ends of every ramp and `steps` samples over the longest one
+    seconds = {on, off}
+    seconds.update((on + length) % 86400 for length in dawn)
+    seconds.update((off - length) % 86400 for length in dusk)
+    longest = max(dawn)
+    for k in range(1, steps if longest else 0):
+        seconds.add((on + longest * k // steps) % 86400)
+    longest = max(dusk)
+    for k in range(1, steps if longest else 0):
+        seconds.add((off - longest + longest * k // steps) % 86400)
+
+    times = array("l")
+    duties = []
+    for second in sorted(seconds):
+        current = duties_at(second, on, off, on_duties, off_duties, dawn, dusk, shape)
+        if duties and current == duties[-1]:
+            continue
+        times.append(second)
+        duties.append(current)
+    # the first keyframe continues the last one of the day before
+    if len(duties) > 1 and duties[0] == duties[-1]:
+        times = times[1:]
+        duties.pop(0)
+    return times, duties
+
+
+def index(times, second):
+    """Index of the keyframe in effect at a second of the day"""
+    lo, hi = 0, len(times)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if times[mid] <= second:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo - 1  # -1 before the first keyframe, the last one of the day before
@@ -45,6 +45,7 @@ Implementation Notes
 """
 
 import time
+import uasyncio as asyncio
 
 STATUS_BASE = const(0x00)
 TOUCH_BASE = const(0x0F)
@@ -54,22 +55,37 @@ _STATUS_SWRST = const(0x7F)
 
 _HW_ID_CODE = const(0x55)
 
+_RESET_DELAY_MS = const(500)
+
 class Seesaw:
     """Driver for SeeSaw I2C generic conversion trip.
        :param I2C i2c: I2C bus the SeeSaw is connected to.
-       :param int addr: I2C address of the SeeSaw device."""
-    def __init__(self, i2c, addr):
+       :param int addr: I2C address of the SeeSaw device.
+       :param bool reset: reset the chip now, blocking for 500ms. Pass False
+           and await sw_reset_async() to avoid blocking an event loop."""
+    def __init__(self, i2c, addr, reset=True):
         self.i2c = i2c
         self.addr = addr
-        self.sw_reset()
+        self._cmd = bytearray(3)
+        self._buf1 = bytearray(1)
+        # register selects and reads of overlapping async reads must not interleave
+        self._lock = asyncio.Lock()
+        if reset:
+            self.sw_reset()
 
     def sw_reset(self):
         """Trigger a software reset of the SeeSaw chip"""
         self._write8(STATUS_BASE, _STATUS_SWRST, 0xFF)
         time.sleep(.500)
+        self._check_chip_id(self._read8(STATUS_BASE, _STATUS_HW_ID))
 
-        chip_id = self._read8(STATUS_BASE, _STATUS_HW_ID)
+    async def sw_reset_async(self):
+        """Like sw_reset(), but awaits the reset delay"""
+        self._write8(STATUS_BASE, _STATUS_SWRST, 0xFF)
+        await asyncio.sleep_ms(_RESET_DELAY_MS)
+        self._check_chip_id(await self._read8_async(STATUS_BASE, _STATUS_HW_ID))
 
+    def _check_chip_id(self, chip_id):
         if chip_id != _HW_ID_CODE:
             raise RuntimeError("SeeSaw hardware ID returned (0x{:x}) is not "
                                "correct! Expected 0x{:x}. Please check your wiring."
@@ -79,9 +95,12 @@ class Seesaw:
         self._write(reg_base, reg, bytearray([value]))
 
     def _read8(self, reg_base, reg):
-        ret = bytearray(1)
-        self._read(reg_base, reg, ret)
-        return ret[0]
+        self._read(reg_base, reg, self._buf1)
+        return self._buf1[0]
+
+    async def _read8_async(self, reg_base, reg):
+        await self._read_async(reg_base, reg, self._buf1)
+        return self._buf1[0]
 
     def _read(self, reg_base, reg, buf, delay=.005):
         self._write(reg_base, reg)
@@ -90,9 +109,22 @@ class Seesaw:
 
         self.i2c.readfrom_into(self.addr, buf)
 
+    async def _read_async(self, reg_base, reg, buf, delay_ms=5):
+        """Like _read(), but awaits the delay between the write and the read"""
+        async with self._lock:
+            self._write(reg_base, reg)
+
+            await asyncio.sleep_ms(delay_ms)
+
+            self.i2c.readfrom_into(self.addr, buf)
+
     def _write(self, reg_base, reg, buf=None):
+        if buf is None:
+            self._cmd[0] = reg_base
+            self._cmd[1] = reg
+            self.i2c.writeto(self.addr, memoryview(self._cmd)[:2])
+            return
         full_buffer = bytearray([reg_base, reg])
-        if buf is not None:
-            full_buffer += buf
+        full_buffer += buf
 
         self.i2c.writeto(self.addr, full_buffer)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Status LED pulses for the control box NeoPixel.
+
+A pulse fades a colour in and out. The brightness steps are gamma corrected
+and computed once, and the frames of each colour are built the first time
+it is used, so playing a pulse only copies prepared tuples to the pixel.
+
+Requests wait in a short queue ordered by priority, first come first served
+within a priority. Requesting a colour that is already waiting does
+nothing, and when the queue is full a request only gets in by replacing a
+waiting one of lower priority. run() sleeps on an Event while there is
+nothing to play, so an idle LED costs nothing.
+"""
+
+import uasyncio as asyncio
+
+# GRB, the order the NeoPixel takes
+GREEN = (1, 0, 0)
+RED = (0, 1, 0)
+BLUE = (0, 0, 1)
+YELLOW = (1, 1, 0)
+
+GAMMA = 2.2
+
+
+def levels(steps, gamma=GAMMA):
+    """Gamma corrected brightness rising over steps, then falling back to 0"""
+    rise = [int(255 * (i / steps) ** gamma + 0.5) for i in range(steps + 1)]
+    return bytes(rise + list(reversed(rise[:-1])))
+
+
+class StatusLed:
+    """Plays pulses on pixel 0 of a NeoPixel strip.
+       :param np: neopixel.NeoPixel.
+       :param int steps: brightness steps of each fade.
+       :param int step_ms: time each step is shown.
+       :param int queue_len: pulses that can wait at most."""
+
+    def __init__(self, np, steps=64, step_ms=16, queue_len=4):
+        self.np = np
+        self.step_ms = step_ms
+        self.queue_len = queue_len
+        self.levels = levels(steps)
+        self.dropped = 0
+        self._frames = {}  # colour: tuple of pixel values
+        self._queue = []  # [priority, order, colour], next pulse first
+        self._order = 0
+        self._ready = asyncio.Event()
+
+    def frames(self, color):
+        frames = self._frames.get(color)
+        if frames is None:
+            g, r, b = color
+            frames = tuple((g * v, r * v, b * v) for v in self.levels)
+            self._frames[color] = frames
+        return frames
+
+    def pulse(self, color, priority=0):
+        """Queue a pulse of color, a GRB tuple of 0 or 1 like GREEN"""
+        queue = self._queue
+        for item in queue:
+            if item[2] == color:
+                if priority > item[0]:
+                    item[0] = priority
+                    queue.sort(key=self._key)
+                return
+        if len(queue) >= self.queue_len:
+            if queue[-1][0] >= priority:
+                self.dropped += 1
+                return
+            queue.pop()
+            self.dropped += 1
+        self._order += 1
+        queue.append([priority, self._order, color])
+        queue.sort(key=self._key)
+        self._ready.set()
+
+    @staticmethod
+    def _key(item):
+        return (-item[0], item[1])
+
+    def pending(self):
+        return len(self._queue)
+
+    async def run(self):
+        """Plays queued pulses forever"""
+        np = self.np
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            for frame in self.frames(self._queue.pop(0)[2]):
+                np[0] = frame
+                np.write()
+                await asyncio.sleep_ms(self.step_ms)
@@ -49,6 +49,7 @@ import time
 import ustruct
 
 import seesaw
+import uasyncio as asyncio
 
 _STATUS_TEMP = const(0x04)
 
@@ -58,18 +59,29 @@ class StemmaSoilSensor(seesaw.Seesaw):
     """Driver for Adafruit STEMMA Soil Sensor - I2C Capacitive Moisture Sensor
        :param I2C i2c: I2C bus the SeeSaw is connected to.
        :param int addr: I2C address of the SeeSaw device. Default is 0x36."""
-    def __init__(self, i2c, addr=0x36):
-        super().__init__(i2c, addr)
+    def __init__(self, i2c, addr=0x36, reset=True):
+        super().__init__(i2c, addr, reset)
+        self._buf2 = bytearray(2)
+        self._buf4 = bytearray(4)
 
     def get_temp(self):
-        buf = bytearray(4)
+        buf = self._buf4
         self._read(seesaw.STATUS_BASE, _STATUS_TEMP, buf, .005)
+        return self._decode_temp(buf)
+
+    async def get_temp_async(self):
+        """Like get_temp(), but awaits the conversion delay"""
+        buf = self._buf4
+        await self._read_async(seesaw.STATUS_BASE, _STATUS_TEMP, buf, 5)
+        return self._decode_temp(buf)
+
+    def _decode_temp(self, buf):
         buf[0] = buf[0] & 0x3F
         ret = ustruct.unpack(">I", buf)[0]
         return 0.00001525878 * ret
 
     def get_moisture(self):
-        buf = bytearray(2)
+        buf = self._buf2
 
         self._read(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, buf, .005)
         ret = ustruct.unpack(">H", buf)[0]
@@ -85,4 +97,18 @@ class StemmaSoilSensor(seesaw.Seesaw):
             if count > 3:
                 raise RuntimeError("Could not get a valid moisture reading.")
 
-        return ret
\ No newline at end of file
+        return ret
+
+    async def get_moisture_async(self):
+        """Like get_moisture(), but awaits the conversion and retry delays"""
+        buf = self._buf2
+
+        # retry if reading was bad
+        for _ in range(5):
+            await self._read_async(seesaw.TOUCH_BASE, _TOUCH_CHANNEL_OFFSET, buf, 5)
+            ret = ustruct.unpack(">H", buf)[0]
+            if ret <= 4095:
+                return ret
+            await asyncio.sleep_ms(1)
+
+        raise RuntimeError("Could not get a valid moisture reading.")
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Heartbeat supervisor for the hardware watchdog.
+
+Feeding the watchdog from a task of its own only proves that the event loop
+still turns, a task stuck waiting forever (a lost event, a publish that never
+returns) goes unnoticed. Instead every critical task is registered with a
+deadline and calls beat() each time it gets through its loop. run() feeds the
+watchdog every `feed_ms`, well inside its timeout, and only while every
+registered task beat within its deadline.
+
+A task that waits for work it cannot be blamed for calls idle() before
+waiting, its deadline only starts again at the next beat(). A task can also
+be registered with an `excused` function, while it returns True the task is
+not checked, eg. a publish that waits for the network to come back.
+
+When a task misses its deadline, its index in `names` is saved in a watchdog
+scratch register and the watchdog is not fed again, so the board resets
+within the watchdog timeout and knows after the reset which task went silent.
+"""
+
+import sys
+import utime
+import uasyncio as asyncio
+from machine import mem32, WDT
+from micropython import const
+
+# Watchdog SCRATCH3 of the RP2040, SCRATCH0-2 are used by lib/profiler.py
+_SCRATCH_SILENT = const(0x40058018)  # _MAGIC | index of the silent task
+_MAGIC = const(0x5E1E0000)
+
+_RP2 = sys.platform == "rp2"
+
+
+class Supervisor:
+    """Feeds the watchdog while the registered tasks are healthy.
+       :param names: task names, in the same order on every boot so the
+           scratch register can be decoded after a reset.
+       :param int timeout_ms: watchdog timeout, at most 8388 on the RP2040.
+       :param int feed_ms: time between two feeds, less than timeout_ms."""
+
+    def __init__(self, names, timeout_ms=8388, feed_ms=1000):
+        if not 0 < feed_ms < timeout_ms:
+            raise ValueError("feed_ms must be between 0 and timeout_ms")
+        self.names = tuple(names)
+        self.timeout_ms = timeout_ms
+        self.feed_ms = feed_ms
+        self.silent = None  # name of the task that went silent
+        # task that went silent before the last reset, None if nothing is known
+        self.reset_task = None
+        self._tasks = {}  # index: [deadline ms, last beat or None while idle, excused]
+        self._restore()
+
+    def _restore(self):
+        if not _RP2:
+            return
+        value = mem32[_SCRATCH_SILENT]
+        if value & 0xFFFF0000 == _MAGIC:
+            index = value & 0xFF
+            self.reset_task = self.names[index] if index < len(self.names) else "task " + str(index)
+        mem32[_SCRATCH_SILENT] = 0
+
+    def register(self, name, deadline_ms, excused=None):
+        """Supervise the task called name, it has to beat every deadline_ms"""
+        self._tasks[self.names.index(name)] = [deadline_ms, utime.ticks_ms(), excused]
+
+    def beat(self, name):
+        task = self._tasks.get(self.names.index(name))
+        if task:
+            task[1] = utime.ticks_ms()
+
+    def idle(self, name):
+        """The task waits for work, it is not checked until its next beat()"""
+        task = self._tasks.get(self.names.index(name))
+        if task:
+            task[1] = None
+
+    def check(self):
+        """Returns the name of a task that missed its deadline, or None"""
+        now = utime.ticks_ms()
+        for index, task in self._tasks.items():
+            deadline_ms, last, excused = task
+            if last is None:
+                continue
+            if excused and excused():
+                task[1] = now
+                continue
+            if utime.ticks_diff(now, last) > deadline_ms:
+                return self.names[index]
+        return None
+
+    def _give_up(self, name):
+        self.silent = name
+        if _RP2:
+            mem32[_SCRATCH_SILENT] = _MAGIC | self.names.index(name)
+        print(f"{name} went silent, no longer feeding the watchdog")
+
+    async def run(self):
+        """Feeds the watchdog until a task misses its deadline"""
+        wdt = WDT(timeout=self.timeout_ms)
+        while True:
+            silent = self.check()
+            if silent:
+                self._give_up(silent)
+                return
+            wdt.feed()
+            await asyncio.sleep_ms(self.feed_ms)
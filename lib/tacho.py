@@ -0,0 +1,119 @@
+"""
+Fan tachometer with stall detection.
+
+The tach output of the fan pulls its pin low `pulses_per_rev` times per
+revolution. irq() is the pin interrupt handler: it stores the time of the
+edge in a ring of preallocated ticks_us values and counts it, so it never
+allocates and can run as a hard interrupt. Readers copy the count and the
+edge times they need with interrupts disabled, so they never see a half
+updated ring.
+
+rpm() is the rolling speed over the time since it was last called, from the
+number of edges in between. At low speeds that window holds only a few edges
+and the count is coarse, so the speed comes from the average period of the
+latest edges in the ring instead.
+
+A fan that stops gives no edges at all, so stalled() compares the age of the
+last edge with the commanded duty: a fan that is driven, had `spin_up_ms` to
+start and gave no edge for `stall_ms` is stalled.
+"""
+
+import utime
+import machine
+from array import array
+from micropython import const
+
+_EDGES_MASK = const(0x3FFFFFFF)  # the edge count stays a small int
+
+
+class Tachometer:
+    """Measures the speed of a fan from its tach pulses.
+       :param int pulses_per_rev: tach pulses per revolution.
+       :param int ring: edge times kept, a power of 2.
+       :param int min_edges: below this many edges since the last rpm() the
+           speed is taken from the edge periods.
+       :param int stall_ms: a driven fan without an edge for this long is stalled.
+       :param int spin_up_ms: time a fan gets to start once its duty is above 0."""
+
+    def __init__(self, pulses_per_rev=2, ring=16, min_edges=8, stall_ms=1000, spin_up_ms=3000):
+        self.pulses_per_rev = pulses_per_rev
+        self.min_edges = min_edges
+        self.stall_ms = stall_ms
+        self.spin_up_ms = spin_up_ms
+        self.edges = 0
+        self.stall = False
+        self.stalls = 0
+        self._times = array("L", [0] * ring)
+        self._mask = ring - 1
+        self._window_edges = 0
+        self._window_us = utime.ticks_us()
+        self._rpm = 0
+        self._seen_edges = 0
+        self._last_edge_ms = utime.ticks_ms()  # time of the last edge seen by a reader
+        self._driven_since = None
+        self._stall_edges = 0
+
+    def irq(self, pin):
+        """Pin interrupt handler, pass it to Pin.irq() with hard=True"""
+        edges = self.edges
+        self._times[edges & self._mask] = utime.ticks_us()
+        self.edges = (edges + 1) & _EDGES_MASK
+
+    def _last_edge(self):
+        """Returns (edges, ms since the last edge or, before any edge, since the start)"""
+        state = machine.disable_irq()
+        edges = self.edges
+        newest = self._times[(edges - 1) & self._mask]
+        machine.enable_irq(state)
+        now = utime.ticks_ms()
+        if edges != self._seen_edges:
+            self._seen_edges = edges
+            age_us = utime.ticks_diff(utime.ticks_us(), newest)
+            self._last_edge_ms = utime.ticks_add(now, -(age_us // 1000))
+        return edges, utime.ticks_diff(now, self._last_edge_ms)
+
+    def rpm(self):
+        """Speed since the last call"""
+        now = utime.ticks_us()
+        elapsed = utime.ticks_diff(now, self._window_us)
+        if elapsed <= 0:
+            return self._rpm
+        state = machine.disable_irq()
+        edges = self.edges
+        count = (edges - self._window_edges) & _EDGES_MASK
+        # the newest edges, one more than were counted so they span `count` periods
+        span = min(max(count + 1, 2), self._mask + 1, edges)
+        newest = self._times[(edges - 1) & self._mask]
+        oldest = self._times[(edges - span) & self._mask]
+        machine.enable_irq(state)
+        self._window_edges = edges
+        self._window_us = now
+
+        scale = 60000000 // self.pulses_per_rev
+        if count >= self.min_edges:
+            self._rpm = count * scale // elapsed
+        elif span < 2 or self._last_edge()[1] > self.stall_ms:
+            self._rpm = 0
+        else:
+            periods = utime.ticks_diff(newest, oldest)
+            self._rpm = (span - 1) * scale // periods if periods > 0 else count * scale // elapsed
+        return self._rpm
+
+    def stalled(self, duty):
+        """True if the fan does not turn although it is driven with duty"""
+        if not duty:
+            self._driven_since = None
+            self.stall = False
+            return False
+        now = utime.ticks_ms()
+        if self._driven_since is None:
+            self._driven_since = now
+        edges, age = self._last_edge()
+        if self.stall and edges == self._stall_edges:
+            return True  # no edge since, even once the age of the last one wrapped around
+        stall = utime.ticks_diff(now, self._driven_since) >= self.spin_up_ms and age > self.stall_ms
+        if stall and not self.stall:
+            self.stalls += 1
+            self._stall_edges = edges
+        self.stall = stall
+        return stall
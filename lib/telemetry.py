@@ -0,0 +1,129 @@
+"""
+Compact binary encoding of the stats returned by getStats() in main.py.
+
+A record is a fixed size little endian struct. The first byte is the format
+version, which can never be "[" (0x5B), so receivers can tell binary records
+from json lists on the same topic. Several records published together are
+simply concatenated.
+
+Version 3 layout (63 bytes):
+
+    offset type  field
+    0      B     version
+    1      B     flags, bit 0 set if the timestamp is valid
+    2      8s    board id (raw machine.unique_id())
+    10     I     timestamp, seconds since 2000-01-01 00:00 local time
+    14     4B    red, green, blue, white duty
+    18     H     bus voltage, 1/100 V
+    20     h     current, mA
+    22     H     power, 1/100 W
+    24     B     fan duty
+    25     H     fan rpm
+    27     h     soil temperature, 1/100 C
+    29     H     soil moisture
+    31     h     ambient temperature, 1/100 C
+    33     H     ambient humidity, 1/100 %
+    35     H     length of the window the values were averaged over, seconds
+    37     H     number of samples averaged
+    39     3h    soil temperature min, max and last over the window, 1/100 C
+    45     3H    soil moisture min, max and last
+    51     3h    ambient temperature min, max and last, 1/100 C
+    57     3H    ambient humidity min, max and last, 1/100 %
+
+Version 2 records are the first 39 bytes of version 3, without the min, max
+and last values. Version 1 records are the first 35 bytes, without the window.
+
+Readings that are missing (-1 in getStats()) are sent as MISSING_U16 or
+MISSING_I16.
+"""
+
+import utime
+import ustruct as struct
+from micropython import const
+
+VERSION = const(3)
+FORMAT = "<BB8sIBBBBHhHBHhHhHHHhhhHHHhhhHHH"
+SIZE = const(63)
+_V2_FORMAT = "<BB8sIBBBBHhHBHhHhHHH"
+_EXTREMES_FORMAT = "<hhhHHHhhhHHH"
+_EXTREMES_OFFSET = const(39)
+
+# index of the soil and ambient readings in the lists of pack()'s extremes
+_SST = const(9)
+_SSM = const(10)
+_AHT = const(11)
+_AHH = const(12)
+
+FLAG_TIME = const(0x01)
+
+MISSING_U16 = const(0xFFFF)
+MISSING_I16 = const(-32768)
+
+_EPOCH_2000 = utime.mktime((2000, 1, 1, 0, 0, 0, 0, 0))
+
+
+def timestamp(datetime):
+    """Seconds since 2000-01-01 for an RTC datetime tuple"""
+    return utime.mktime((datetime[0], datetime[1], datetime[2],
+                         datetime[4], datetime[5], datetime[6], 0, 0)) - _EPOCH_2000
+
+
+def _u8(value):
+    return max(0, min(int(value + 0.5), 255))
+
+
+def _u16(value, scale=1):
+    if value < 0:
+        return MISSING_U16
+    return min(int(value * scale + 0.5), MISSING_U16 - 1)
+
+
+def _i16(value, scale=1):
+    if value == -1:
+        return MISSING_I16
+    value = int(value * scale + (0.5 if value >= 0 else -0.5))
+    return max(MISSING_I16 + 1, min(value, 32767))
+
+
+class Encoder:
+    """Packs getStats() lists into a preallocated record buffer.
+       :param bytes board_id: raw board id, eg: machine.unique_id()."""
+
+    def __init__(self, board_id):
+        self._board = bytes(board_id[:8])
+        self.buf = bytearray(SIZE)
+
+    def pack(self, datetime, stats, window=0, samples=1, extremes=None):
+        """Pack stats (a getStats() list) into self.buf and return it.
+           datetime is the RTC datetime of the sample or None if unknown,
+           window and samples describe how the values were averaged and
+           extremes is (mins, maxs, lasts) over the window, each a list of
+           readings in getStats() order after the date and time. Without
+           extremes the values of stats are used. The buffer is reused by
+           the next call."""
+        if datetime:
+            flags = FLAG_TIME
+            ts = timestamp(datetime)
+        else:
+            flags = 0
+            ts = 0
+        struct.pack_into(_V2_FORMAT, self.buf, 0, VERSION, flags, self._board, ts,
+                         _u8(stats[3]), _u8(stats[4]), _u8(stats[5]), _u8(stats[6]),
+                         _u16(stats[7], 100), _i16(stats[8]), _u16(stats[9], 100),
+                         _u8(stats[10]), _u16(stats[11]),
+                         _i16(stats[12], 100), _u16(stats[13]),
+                         _i16(stats[14], 100), _u16(stats[15], 100),
+                         min(window, 65535), min(samples, 65535))
+        # the extremes are packed on their own so no argument tuple is built for them
+        if extremes is None:
+            mins = maxs = lasts = stats
+            i = 3  # the readings start after the board id, date and time
+        else:
+            mins, maxs, lasts = extremes
+            i = 0
+        struct.pack_into(_EXTREMES_FORMAT, self.buf, _EXTREMES_OFFSET,
+                         _i16(mins[i + _SST], 100), _i16(maxs[i + _SST], 100), _i16(lasts[i + _SST], 100),
+                         _u16(mins[i + _SSM]), _u16(maxs[i + _SSM]), _u16(lasts[i + _SSM]),
+                         _i16(mins[i + _AHT], 100), _i16(maxs[i + _AHT], 100), _i16(lasts[i + _AHT], 100),
+                         _u16(mins[i + _AHH], 100), _u16(maxs[i + _AHH], 100), _u16(lasts[i + _AHH], 100))
+        return self.buf
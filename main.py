@@ -20,22 +20,37 @@ globals().clear()
 # Import Required libraries
 import machine
 import gbeformat
-from ds3231 import DS3231
-import seesaw
-import stemma_soil_sensor
-import ahtx0
-import ina219
+import logstore
+import telemetry
+import aggregate
+import profiler
+import heap
+import auth
+import hotplug
+import statusled
+import supervisor
+import tacho
+import ramp
 import os
 import utime
 import json
 import uasyncio as asyncio
 import neopixel
 import binascii
-#TODO use another library instead of ntptime that is non blocking and asynchronous
-import ntptime
-from machine import WDT
+import network
+from ntpclient import ntpclient
 from mqtt_as import MQTTClient,config
 
+# milliseconds since power on at which each boot phase ended, published once on the
+# "boot" topic after the first data upload (see publishBootProfile)
+bootProfile = {}
+
+def bootMark(phase):
+    if phase not in bootProfile:
+        bootProfile[phase] = utime.ticks_ms()
+
+bootMark("imports")
+
 print("\n\n\n\n\n\n\n\n\n\n")
 print('  ____ ____  _____')
 print(' / ___| __ )| ____|   GROWING BEYOND EARTH(R)')
@@ -66,80 +81,48 @@ def fileExists(filename):
 
 libNotFoundMessage = " not found in /lib/, please make sure all the required libraries are in /lib/ in the pico. You can get a fresh copy of the entire program at https://github.com/Growing-Beyond-Earth/GBE-Box-Python-Experimental"
 
-if not fileExists("/lib/ina219.py"):
-    raise Exception(f"ina219.py{libNotFoundMessage}")
-
-if not fileExists("/lib/ahtx0.py"):
-    raise Exception(f"ahtx0.py{libNotFoundMessage}")
-
-if not fileExists("/lib/stemma_soil_sensor.py"):
-    raise Exception(
-        f"stemma_soil_sensor.py{libNotFoundMessage}")
-
-if not fileExists("/lib/seesaw.py"):
-    raise Exception(f"seesaw.py{libNotFoundMessage}")
-
-if not fileExists("/lib/ds3231.py"):
-    raise Exception(f"ds3231.py{libNotFoundMessage}")
-
-if not fileExists("/lib/gbeformat.py"):
-    raise Exception(f"gbeformat.py{libNotFoundMessage}")
-
-# Encryption to help prevent bad actors from sending junk data
-# Prevents impersonating other grow boxes.
-
-if not fileExists("/key.json"):
-    raise Exception("Public Key not found!, please get a fresh copy of the program at https://github.com/Growing-Beyond-Earth/GBE-Box-Python-Experimental")
-
-# reads key.json, will contain keys, server code has private key
-with open("/key.json", "r") as f:
-    publicKey = json.load(f)
-
-def encrypt_message(msg):
-    e, n = publicKey[0], publicKey[1]
-    cipher_text = [pow(ord(char), e, n) for char in msg]
-    return cipher_text
-
-
-
-# example usage:
-# public_key = (e, n)  # replace e and n with the actual values
-# message = 'Hello, World!'
-# encrypted_message = encrypt_message(*public_key, message)
+# Device drivers are imported the first time their device answers, so boxes without
+# a sensor never spend the time or the memory. A device whose driver can't be
+# loaded is treated as unplugged.
+drivers = {}
 
+def driver(name):
+    module = drivers.get(name)
+    if module is None:
+        try:
+            module = __import__(name)
+        except ImportError:
+            print(f"WARNING: {name}.py{libNotFoundMessage}")
+            module = False
+        drivers[name] = module
+    return module
 
 # Load Load lights, fan, time zone configuration from JSON file
 # Check to see if gbe_settings exists
 if not fileExists("/config/gbe_settings.json"):
     raise Exception("gbe_settings.json not found!, did you run SETUP.py?")
 
-# Open the settings Json file
-with open('/config/gbe_settings.json') as settings_file:
-    config = json.load(settings_file)
+# Open the settings Json file. settings holds the file as is, config adds it to
+# the mqtt_as defaults
+SETTINGS_PATH = '/config/gbe_settings.json'
+with open(SETTINGS_PATH) as settings_file:
+    settings = json.load(settings_file)
     settings_file.close()
+config.update(settings)
 
 # Set up status LED on Control Box
 np = neopixel.NeoPixel(machine.Pin(6), 1)
 npc = {"red": [0, 1, 0], "green": [1, 0, 0], "blue": [0, 0, 1], "yellow": [
     0.6, 1, 0], "cyan": [0.8, 0, 0.8], "magenta": [0, 0.8, 0.8], "white": [0.6, 0.6, 0.6]}
 
-# blue and yellow pulse at startup to indicate python software (grb color scheme used for np[0])
-for val in range(0, 255):
-    np[0] = [0, 0, val]
-    np.write()
-    utime.sleep_ms(2)
-for val in range(255, -1, -1):
-    np[0] = [0, 0, val]
-    np.write()
-    utime.sleep_ms(2)
-for val in range(0, 255):
-    np[0] = [val, val, 0]
-    np.write()
-    utime.sleep_ms(2)
-for val in range(255, -1, -1):
-    np[0] = [val, val, 0]
-    np.write()
-    utime.sleep_ms(2)
+# Status LED pulses are queued with a priority and played by the ledStatus task, which
+# sleeps while there is nothing to play (see lib/statusled.py)
+LED_CONNECTED = 0     # green pulse, a sensor was connected
+LED_DISCONNECTED = 1  # red pulse, a sensor was disconnected or the fan stalled
+LED_STARTUP = 2       # blue and yellow pulse at startup to indicate python software
+statusLed = statusled.StatusLed(np)
+statusLed.pulse(statusled.BLUE, LED_STARTUP)
+statusLed.pulse(statusled.YELLOW, LED_STARTUP)
 
 # -------  Networking setup --------
 
@@ -154,8 +137,21 @@ if not fileExists("/config/wifi_settings.json"):
 # Define the wifi device
 # Get the Unique ID of the Pico. This line makes a conversion from an ascii string to a python string hex number
 board_id = binascii.hexlify(machine.unique_id()).decode()
-# encrypted board id for sharing
-encryptedBoardId = encrypt_message(board_id)
+
+# Authentication to help prevent bad actors from sending junk data
+# Prevents impersonating other grow boxes. SETUP.py enrolls the box with a secret that is
+# registered on the server by hand, every message is then signed with the secret,
+# see lib/auth.py. Boxes that were not enrolled send unsigned messages.
+signer = auth.load(machine.unique_id())
+if not signer:
+    print("WARNING: box not enrolled, data is sent unsigned and settings can't be changed over MQTT. Run SETUP.py to enroll it")
+
+# wraps a payload in an authenticated envelope if the box is enrolled
+def signed(payload):
+    if signer:
+        return signer.sign(payload)
+    return payload
+
 # Load wifi settings and connect to wifi if they are set up.
 if wifi_config:
     with open('/config/wifi_settings.json') as wifi_file:
@@ -163,7 +159,7 @@ if wifi_config:
         wifi_file.close()
     config['ssid'] = wifi_config['NETWORK_NAME']
     config['wifi_pw'] = wifi_config['NETWORK_PASSWORD']
-    config["queue_len"] = 1
+    config["queue_len"] = 0  # incoming messages go to subs_cb, see onMessage()
     config['client_id'] = board_id
     #TODO make a central server that this will connect to, for now, connect to a raspberry pi on the local network
     config['server'] = "3.84.36.243"
@@ -177,8 +173,10 @@ if wifi_config:
     config['clean_init'] = True
     config['clean'] = True
     config['max_repubs'] = 4
+    config['max_inflight'] = 4
     config['will'] = None
     config['port'] = 1883
+    config['gc_collect'] = False  # collections are left to memoryHeap.idle()
 
 
 
@@ -187,75 +185,95 @@ if wifi_config:
 
 
 
-# -------Set up I2C bus 0 for devices inside the control box----
+# I2C addresses of the supported devices
+INA219_ADDR = 0x40  # bus 0
+DS3231_ADDR = 0x68  # bus 0
+AHT10_ADDR = 0x38   # bus 1
+SOIL_ADDR = 0x36    # bus 1
 
-i2c0 = machine.I2C(0, sda=machine.Pin(16), scl=machine.Pin(17))
+# whether a device answers at addr, a zero length write only addresses it
+def deviceAnswers(i2c, addr):
+    try:
+        i2c.writeto(addr, b'')
+        return True
+    except OSError:
+        return False
 
-try:
-    ina = ina219.INA219(0.1, i2c0)
-    ina.configure()
-    print("Connected to electrical current sensor")
-except:
-    ina = False
 
-i2c1 = machine.I2C(1, sda=machine.Pin(18), scl=machine.Pin(19), freq=400000)
+# -------Set up I2C bus 0 for devices inside the control box----
 
-# ----Set up I2C bus 1 for devices outside the control box-------
-# this will try and setup for all supported sensors.
-try:
-    seesaw = stemma_soil_sensor.StemmaSoilSensor(i2c1)
-    print("Connected to soil moisture sensor")
-except:
-    seesaw = False
+i2c0 = machine.I2C(0, sda=machine.Pin(16), scl=machine.Pin(17))
 
-# setup the aht10
-try:
-    aht10 = ahtx0.AHT10(i2c1)
-    aht10.initialize()
-    print("test init worked!")
-except Exception as e:
-    print("test init failed")
-    aht10 = False
-
-# while True:
-#     if aht10:
-#         humid = aht10.relative_humidity
-#         temp = aht10.temperature
-#         print(humid,temp)
-    
+# ----Set up I2C bus 1 for devices outside the control box-------
+i2c1 = machine.I2C(1, sda=machine.Pin(18), scl=machine.Pin(19), freq=400000)
 
-# ---Set internal clock using network time or I2C realtime clock---
+# The sensors are hot-plugged (see lib/hotplug.py): hardwareListener() checks that
+# each address still answers and sets a sensor up, loading its driver, only when it
+# appears. Its first check runs as soon as the event loop starts, while Wi-Fi connects.
+# Backoff delays for sensors that keep failing can be set in a "hotplug" section of
+# gbe_settings.json ("min backoff ms", "max backoff ms")
+
+# returns the driver module of a sensor, raises if it is missing so the sensor backs off
+def sensorDriver(name):
+    module = driver(name)
+    if not module:
+        raise ImportError(name)
+    return module
+
+async def setupINA(i2c, addr):
+    sensor = sensorDriver("ina219").INA219(0.1, i2c, address = addr)
+    sensor.configure()
+    return sensor
+
+async def setupSoilSensor(i2c, addr):
+    sensor = sensorDriver("stemma_soil_sensor").StemmaSoilSensor(i2c, addr, reset = False)
+    await sensor.sw_reset_async()
+    return sensor
+
+async def setupAht10(i2c, addr):
+    sensor = sensorDriver("ahtx0").AHT10(i2c, addr, init = False)
+    await sensor.setup_async()
+    return sensor
+
+hotplugSettings = config.get('hotplug', {})
+HOTPLUG_POLL_MS = 500
+sensors = hotplug.HotPlug(hotplugSettings.get('min backoff ms', 1000),
+                          hotplugSettings.get('max backoff ms', 60000))
+inaDevice = sensors.add("current sensor", i2c0, INA219_ADDR, setupINA)
+soilDevice = sensors.add("soil sensor", i2c1, SOIL_ADDR, setupSoilSensor)
+ahtDevice = sensors.add("ambient sensor", i2c1, AHT10_ADDR, setupAht10)
+
+# drivers of the connected sensors, False while one is not connected
+ina = False
+seesaw = False
+aht10 = False
+
+
+# ---Set internal clock using the I2C realtime clock---
 # the variable "rtc", refers to the Micropython RTC library, NOT the external battery powered RTC.
-# Machine.RTC() will attempt to be synced using the battery powered RTC or the Internet.
+# Machine.RTC() is set from the battery powered RTC at boot and synced with network time by
+# the ntp client once the event loop runs (see onNetworkTime).
 # If neither is available, it will run unsynced.
 lt = False
 batteryClock = False
 rtc = machine.RTC()
 accurateTime = True
+# optional "ntp": {"server": "pool.ntp.org", "max poll": 1024} in gbe_settings.json
+ntpSettings = config.get('ntp', {})
 
 
 try:  # get local time from I2C RTC
-    batteryClock = DS3231(i2c0)
-    # Add a zero at the end of the localtime table for formatting
-    lt = ([x for x in batteryClock.DateTime()] + [0])  # type: ignore
+    if deviceAnswers(i2c0, DS3231_ADDR) and driver("ds3231"):
+        batteryClock = drivers["ds3231"].DS3231(i2c0)
+        # Add a zero at the end of the localtime table for formatting
+        lt = ([x for x in batteryClock.DateTime()] + [0])  # type: ignore
 except:
-    pass
+    batteryClock = False
 
 # Use internal clock if its time is already set
 if machine.RTC().datetime()[0] > 2021:
     lt = list(machine.RTC().datetime())
 
-try:  # Use network time if available
-    ntptime.settime()  # Set the internal RTC time to the network time in UTC
-    # Correct time for local time zone
-    ct = utime.localtime(
-        utime.time() - (abs(config["time zone"]["GMT offset"])) * 3600)
-    lt = [ct[0], ct[1], ct[2], ct[6], ct[3], ct[4],
-          ct[5], 0]   # Format time for setting RTC
-    ntp = True
-except:
-    ntp = False
-
 try:
     rtc.datetime(lt)  # Set internal clock with best available time
 except:
@@ -267,30 +285,156 @@ try:
 except:
     pass
 
-if ntp:
-    print("Connected to network time")
-else:
-    print("Failed to connect to the internet\nFalling back to i2c RTC")
-
 if batteryClock:
     print("Connected to battery-powered internal clock")
-elif ntp:
-    print("Failed to connect to the i2c RTC\nFalling back to internet clock...")
 else:
-    print("Failed to connect to the i2c RTC\nFalling back to internal clock...")
+    print("Failed to connect to the i2c RTC\nFalling back to internal clock until network time is available...")
 
 if lt:
     print("Internal clock successfully set\n")
 else:
     accurateTime = False
     print("Internal clock failed to set.\nFalling back to possibly unsynced clock...")
+bootMark("clock")
 
-# Setup json logging
+# Setup logging, data that fails to upload is kept in a ring log store in /logs/
 
 if not dirExists("/logs"):
     print("logs folder does not exist\nCreating logs folder...")
     os.mkdir("/logs")
 
+# Data is sent as compact binary records (see lib/telemetry.py), set
+# "telemetry": {"format": "json"} in gbe_settings.json to send json lists instead
+TELEMETRY_BINARY = config.get('telemetry', {}).get('format', 'binary') != 'json'
+encoder = telemetry.Encoder(machine.unique_id())
+
+# records are stored in the live data format, binary records are much smaller
+# so the same flash holds more of them
+if TELEMETRY_BINARY:
+    logStore = logstore.LogStore("/logs", 4, 512, telemetry.SIZE)
+else:
+    logStore = logstore.LogStore("/logs", 4, 128, 256)
+
+
+# Converts a json stats list saved by older versions to the live data format
+def legacyRecord(text):
+    if not TELEMETRY_BINARY:
+        return text.encode('ascii')
+    stats = json.loads(text)
+    try:
+        year, month, day = map(int, stats[1].strip('"').split('-'))
+        hour, minute = map(int, stats[2].strip('"').split(':'))
+        datetime = (year, month, day, 0, hour, minute, 0, 0)
+    except ValueError:
+        datetime = None  # saved without an accurate clock
+    return encoder.pack(datetime, stats)
+
+
+# move json files saved by older versions into the log store
+for file in os.listdir("/logs"):
+    if file.endswith(".json"):
+        try:
+            with open(f"/logs/{file}", 'r') as logFile:
+                logStore.append(legacyRecord(logFile.read()))
+            os.remove(f"/logs/{file}")
+        except Exception as e:
+            print(f"failed to move old log file \"{file}\" into the log store: {e}")
+
+if logStore.pending():
+    print(f"{logStore.pending()} saved records waiting to be uploaded")
+
+# Saved records are uploaded in batches by backlogUploader(), at most
+# BACKLOG_RATE records per second so live data keeps most of the bandwidth.
+# Both can be set in a "backlog" section of gbe_settings.json
+backlogSettings = config.get('backlog', {})
+BACKLOG_BATCH = backlogSettings.get('records per publish', 16)
+BACKLOG_RATE = backlogSettings.get('records per second', 8)
+# batches in flight at once, one in-flight slot is left for live data
+BACKLOG_INFLIGHT = max(1, config['max_inflight'] - 1)
+
+# set when a record is added to the log store
+backlogAdded = asyncio.Event()
+
+# Sensors are sampled every SAMPLE_INTERVAL_MS and averaged over each of the
+# aggregate windows (seconds). Every window summary is sent as a record, json
+# lists only carry the shortest window. Windows of an hour or more are also
+# printed with gbeformat.hourlog(). Set in an "aggregate" section of gbe_settings.json
+aggregateSettings = config.get('aggregate', {})
+SAMPLE_INTERVAL_MS = int(aggregateSettings.get('sample interval', 1) * 1000)
+
+# The battery clock can pace sampling with a 1Hz square wave on its INT/SQW
+# pin instead of the event loop's timer. Wire INT/SQW to a free GPIO and set
+# "clock": {"sqw pin": <GPIO number>} in gbe_settings.json
+clockTick = False
+sqwPin = config.get('clock', {}).get('sqw pin')
+if batteryClock and sqwPin is not None:
+    try:
+        batteryClock.SquareWave(drivers["ds3231"].SQW_1HZ)  # type: ignore
+        clockTick = asyncio.ThreadSafeFlag()
+        sqw = machine.Pin(sqwPin, machine.Pin.IN, machine.Pin.PULL_UP)
+        sqw.irq(trigger=machine.Pin.IRQ_FALLING, handler=lambda pin: clockTick.set())  # type: ignore
+        print("Sampling timed by the battery-powered clock")
+    except Exception as e:
+        print(f"failed to set up the battery-powered clock tick: {e}")
+        clockTick = False
+aggregator = aggregate.Aggregator(13, aggregateSettings.get('windows', [60, 3600]))
+
+# Every task is timed by the event loop profiler (see lib/profiler.py), a
+# summary is published on the "diagnostics" topic every DIAGNOSTICS_INTERVAL
+# seconds. Set in a "diagnostics" section of gbe_settings.json
+# ("interval" in seconds, "stall ms", "profile": false to turn timing off)
+diagnosticsSettings = config.get('diagnostics', {})
+DIAGNOSTICS_INTERVAL = diagnosticsSettings.get('interval', 900)
+# names of the profiled tasks, new tasks go at the end so the names of the
+# previous boot can still be read from the watchdog scratch registers
+TASK_NAMES = ("controlLightsAndFan", "sampleSensors", "hardwareListener", "ledStatus",
+              "mqttHandler", "watchDog", "logData", "backlogUploader", "reconnect",
+              "publishDiagnostics", "configListener")
+loopProfiler = profiler.Profiler(TASK_NAMES, diagnosticsSettings.get('stall ms', 500),
+                                 diagnosticsSettings.get('profile', True))
+resetCause = "watchdog" if machine.reset_cause() == machine.WDT_RESET else "power on"
+if loopProfiler.reset_task:
+    print(f"reset while {loopProfiler.reset_task} held the event loop")
+if loopProfiler.last_stall:
+    print(f"last event loop stall: {loopProfiler.last_stall[0]} for {loopProfiler.last_stall[1]} ms")
+
+# The watchdog is fed only while every critical task reports a heartbeat
+# within its deadline (see lib/supervisor.py). Set in a "watchdog" section of
+# gbe_settings.json ("feed ms", "deadlines": {task name: ms}). Sampling beats once
+# per sample, so its deadline grows with the sample interval
+watchdogSettings = config.get('watchdog', {})
+WATCHDOG_DEADLINES = {"controlLightsAndFan": 180000, "sampleSensors": max(30000, 3 * SAMPLE_INTERVAL_MS),
+                      "hardwareListener": 30000, "logData": 180000,
+                      "backlogUploader": 180000, "reconnect": 180000}
+WATCHDOG_DEADLINES.update(watchdogSettings.get('deadlines', {}))
+try:
+    taskSupervisor = supervisor.Supervisor(TASK_NAMES, feed_ms = watchdogSettings.get('feed ms', 1000))
+except ValueError:
+    # a feed that comes after the watchdog timeout would reset the board every few seconds
+    print(f"WARNING: watchdog feed ms {watchdogSettings.get('feed ms')} is not below the watchdog timeout, using 1000")
+    taskSupervisor = supervisor.Supervisor(TASK_NAMES)
+if taskSupervisor.reset_task:
+    print(f"reset after {taskSupervisor.reset_task} went silent")
+for name in ("controlLightsAndFan", "sampleSensors", "hardwareListener"):
+    taskSupervisor.register(name, WATCHDOG_DEADLINES[name])
+
+# Garbage is collected after each sample, the quietest moment of the event
+# loop, once part of gc.threshold() was allocated (see lib/heap.py). Set in a
+# "gc" section of gbe_settings.json ("threshold" as a fraction of the heap,
+# 0 for MicroPython's default, "idle" as a fraction of the threshold)
+gcSettings = config.get('gc', {})
+memoryHeap = heap.Heap(gcSettings.get('threshold', 0.25), gcSettings.get('idle', 0.5))
+
+# (datetime, window seconds, samples, means, mins, maxs, lasts) waiting for logData(), oldest first
+summaries = []
+SUMMARY_QUEUE_LEN = 8
+summaryReady = asyncio.Event()
+
+# decimals used when sending averaged readings as json, in getReadings() order
+JSON_DECIMALS = (0, 0, 0, 0, 2, 0, 2, 0, 0, 2, 0, 2, 2)
+# gbeformat log_avg keys, in getReadings() order
+LOG_AVG_KEYS = ("red", "gre", "blu", "whi", "vol", "mam", "wat", "fan", "rpm", "sst", "ssm")
+
 
 # ---------------Set up LED and fan control--------------------
 # Connect 24v MOSFETs to PWM channels on GPIO Pins 0-4
@@ -314,10 +458,13 @@ g.duty_u16(0)
 b.duty_u16(0)
 w.duty_u16(0)
 
-# Initialize variables for counting fan RPMs
-fanSpinCounter = 0
-fanCounterPrevMs = utime.ticks_ms()
-fanCounterCurrentMs = utime.ticks_ms()
+# Fan speed from the tach pulses, twice per rotation (see lib/tacho.py). A fan that is
+# driven but gives no pulse for a second, after 3 seconds to spin up, is stalled.
+# Set in a "tachometer" section of gbe_settings.json ("pulses per rev", "stall ms", "spin up ms")
+tachSettings = config.get('tachometer', {})
+fanTach = tacho.Tachometer(pulses_per_rev = tachSettings.get('pulses per rev', 2),
+                           stall_ms = tachSettings.get('stall ms', 1000),
+                           spin_up_ms = tachSettings.get('spin up ms', 3000))
 
 print("Hardware ID:    " + board_id)
 
@@ -325,8 +472,8 @@ print("Hardware ID:    " + board_id)
 
 
 def datetimeToSeconds(datetime):
-    # Convert entered time from HH:MM to seconds since midnight
-    return ((datetime[4]*60) + datetime[5]) * 60
+    # Convert an RTC datetime tuple to seconds since midnight
+    return ((datetime[4]*60) + datetime[5]) * 60 + datetime[6]
 
 
 def hourAndMinutestoSeconds(input_time):
@@ -340,35 +487,39 @@ def steadyLED(color): np[0] = tuple([int(rgb * 255)
 
 
 
-def fanPulse(pin):     # Count fan rotation, triggered twice per rotation
-    global fanSpinCounter
-    fanSpinCounter += 1
-
-
-def tryGetINA():      # Read current sensor
+async def tryGetINA():      # Read current sensor
 
     # check if the ina is already connected.
     if not ina:
         return -1, -1, -1
 
     try:
-        return ina.voltage(), ina.current(), ina.power()  # type: ignore
-    except:
+        vol, mam, mwa, _ = await ina.snapshot_async()  # type: ignore
+        inaDevice.ok()
+        return vol, mam, mwa
+    except Exception:
+        inaDevice.error()
         return -1, -1, -1
 
+# AHT10 results younger than this are reused
+AHT_MAX_AGE_MS = 1000
+
 # returns (humidity,temp) from an aht10
-def tryGetAht10():
+async def tryGetAht10():
     global aht10
 
     if not aht10:
         return -1, -1
     
     try:
-        return aht10.relative_humidity, aht10.temperature # type: ignore
-    except:
+        result = await aht10.measure(AHT_MAX_AGE_MS) # type: ignore
+        ahtDevice.ok()
+        return result
+    except Exception:
+        ahtDevice.error()
         return -1,-1
 
-def tryGetSeesaw():   # Read soil moisture & temp sensor
+async def tryGetSeesaw():   # Read soil moisture & temp sensor
     global seesaw
 
     # check to see if the seesaw is connected or not, if its not return -1.
@@ -376,8 +527,11 @@ def tryGetSeesaw():   # Read soil moisture & temp sensor
         return -1, -1
 
     try:
-        return seesaw.get_moisture(), seesaw.get_temp()  # type: ignore
-    except:
+        result = await seesaw.get_moisture_async(), await seesaw.get_temp_async()  # type: ignore
+        soilDevice.ok()
+        return result
+    except Exception:
+        soilDevice.error()
         return (-1, -1)
 
 
@@ -388,225 +542,240 @@ def tryGetSCD():
 # gets the stats used for logging
 
 
-def getStats():
-    global fanCounterCurrentMs
-    global fanCounterPrevMs
-    global fanSpinCounter
-    datetime = rtc.datetime()
-    vol, mam, mwa = tryGetINA()  # Read current sensor
-    # Read soil moisture & temp sensor
-    soilMoisture, soilTermperature = tryGetSeesaw()
-    ambientMoisture, ambientTemperature = tryGetAht10()
-    fanCounterPrevMs = fanCounterCurrentMs
-    fanCounterCurrentMs = utime.ticks_ms()
+async def getStats():
     # NOTE: I removed this hashmap since hashmaps are fairly slow on the pico, use index number instead
-    return ([
+    return statsHeader(rtc.datetime()) + await getReadings()
+
+
+# gets data with no accurate internal clock
+async def getStatsNoRTC():
+    return statsHeader(None) + await getReadings()
+
+
+# board id, date and time that start the getStats() list
+def statsHeader(datetime):
+    if datetime is None:
+        # used when time is not known, therefore they have been replaced by "?"
+        return [board_id, "\"?\"", "\"?\""]
+    return [
         board_id,
         # gets the time in year-month-day format
         f"\"{datetime[0]}-{datetime[1]}-{datetime[2]}\"",
         f"\"{datetime[4]}:{datetime[5]}\"",
-        # Duty of red green blue, and white LEDs (respectivly R G B, and W)
-        r.duty_u16()//256,
-        g.duty_u16()//256,
-        b.duty_u16()//256,
-        w.duty_u16()//256,
-        # voltage, miliamps, and wattage
-        round(vol, 2),
-        round(mam),
-        round(mwa/1000, 2),
-        # Fan duty (spin speed)
-        round(f.duty_u16()/256),
-        # Calculations for how fast the fan is ACTUALLY spinning (eg: duty can be max but fan is stuck)
-        fanSpinCounter/(fanCounterCurrentMs-fanCounterPrevMs)*30000,
-        # readings from temp and moisture sensor
-        soilTermperature,
-        soilMoisture,
-        # readings from aht10
-        ambientTemperature,
-        ambientMoisture,
-    ])
+    ]
 
 
-# gets data with no accurate internal clock
-def getStatsNoRTC():
-    global fanCounterCurrentMs
-    global fanCounterPrevMs
-    global fanSpinCounter
-    vol, mam, mwa = tryGetINA()  # Read current sensor
+# warns once when the fan stalls, and pulses the LED red while it is stalled
+def checkFan(duty):
+    wasStalled = fanTach.stall
+    if not fanTach.stalled(duty):
+        if wasStalled:
+            print("fan spinning again")
+        return
+    if not wasStalled:
+        print(f"WARNING: fan stalled at duty {duty // 256}")
+    statusLed.pulse(statusled.RED, LED_DISCONNECTED)
+
+
+# getReadings() writes into this list, so sampling does not allocate a new one
+readings = [0] * 13
+
+# reads all sensors, returns everything in getStats() after the board id, date and time.
+# The list is reused by the next call, copy it to keep it
+async def getReadings():
+    vol, mam, mwa = await tryGetINA()  # Read current sensor
     # Read soil moisture & temp sensor
-    soilMoisture, soilTermperature = tryGetSeesaw()
-    ambientMoisture, ambientTemperature = tryGetAht10()
-    fanCounterPrevMs = fanCounterCurrentMs
-    fanCounterCurrentMs = utime.ticks_ms()
-    return ([
-        board_id,
-        # this function is run when time is not known, therefore they have been replaced by "?"
-        "\"?\"",
-        "\"?\"",
-        # Duty of red green blue, and white LEDs (respectivly R G B, and W)
-        r.duty_u16()//256,
-        g.duty_u16()//256,
-        b.duty_u16()//256,
-        w.duty_u16()//256,
-        # voltage, miliamps, and wattage
-        round(vol, 2),
-        round(mam),
-        round(mwa/1000, 2),
-        # Fan duty (spin speed)
-        round(f.duty_u16()/256),
-        # Calculations for how fast the fan is ACTUALLY spinning (eg: duty can be max but fan is stuck)
-        fanSpinCounter/(fanCounterCurrentMs-fanCounterPrevMs)*30000,
-        # readings from temp and moisture sensor
-        soilTermperature,
-        soilMoisture,
-        ambientTemperature,
-        ambientMoisture,
-    ])
-
-
-# Remove old log files, keeping the specified number
-def cleanLogs(keep_number):
-    try:
-        log_list = os.listdir("logs")
-        del_files = range(len(log_list)-keep_number)
-        for idx in del_files:
-            os.remove("logs/" + log_list[idx])
-    except Exception as e:
-        print("Error cleaning up log files:", e)
+    soilMoisture, soilTermperature = await tryGetSeesaw()
+    ambientMoisture, ambientTemperature = await tryGetAht10()
+    # Duty of red green blue, and white LEDs (respectivly R G B, and W)
+    readings[0] = r.duty_u16()//256
+    readings[1] = g.duty_u16()//256
+    readings[2] = b.duty_u16()//256
+    readings[3] = w.duty_u16()//256
+    # voltage, miliamps, and wattage
+    readings[4] = round(vol, 2)
+    readings[5] = round(mam)
+    readings[6] = round(mwa/1000, 2) if mwa != -1 else -1
+    # Fan duty (spin speed)
+    fanDuty = f.duty_u16()
+    readings[7] = round(fanDuty/256)
+    # how fast the fan is ACTUALLY spinning (eg: duty can be max but fan is stuck)
+    readings[8] = fanTach.rpm()
+    checkFan(fanDuty)
+    # readings from temp and moisture sensor
+    readings[9] = soilTermperature
+    readings[10] = soilMoisture
+    # readings from aht10
+    readings[11] = ambientTemperature
+    readings[12] = ambientMoisture
+    return readings
 
 
-# Looks for open Unknown json date eg: UnknownDate(1).json
-def lookForUnknownNumber():
-    unknownNumber = 1
+# ----- setup async functions that will run in the async event loop -----
+
+# uploads records from the log store, which are saved when uploading failes.
+# Records are sent in batches on the "backlog" topic, as concatenated binary
+# records or as a json list of getStats() lists. Several batches are published at once and acknowledged
+# together, the read cursor only moves past batches the broker acknowledged.
+async def backlogUploader(client):
     while True:
-        if fileExists(f"/logs/UnknownDate({unknownNumber}).json"):
-            unknownNumber += 1
+        taskSupervisor.beat("backlogUploader")
+        if not logStore.pending():
+            backlogAdded.clear()
+            taskSupervisor.idle("backlogUploader")
+            await backlogAdded.wait()
             continue
-        return unknownNumber
 
+        batches = []
+        start = None
+        for _ in range(BACKLOG_INFLIGHT):
+            records, lastSeq = logStore.read(BACKLOG_BATCH, start)
+            if start is not None and lastSeq < start:
+                break  # nothing left to read
+            batches.append((records, lastSeq))
+            start = lastSeq + 1
+
+        results = await asyncio.gather(
+            *[publishBacklog(client, records) for records, _ in batches],
+            return_exceptions = True)
+
+        sent = 0
+        for (records, lastSeq), result in zip(batches, results):
+            if isinstance(result, Exception):
+                print(f"failed to upload backup records, encountered error: {result}")
+                break
+            logStore.commit(lastSeq)
+            sent += len(records)
+        else:
+            print(f"{sent} backup records sent")
+            # limit the share of bandwidth taken from live data
+            await asyncio.sleep_ms(max(1, sent) * 1000 // BACKLOG_RATE)
+            continue
+        await asyncio.sleep(5)
 
-ledBuffer = []
 
-# performs any led actions in ledBuffer
-# 0 is a green pulse
-# 1 is a red pulse
-# 2 is a blue pulse
-# add more led actions TODO
-# see ledStatus()
-def queueLedAction(ledNumber):
-    ledBuffer.append(ledNumber)
+async def publishBacklog(client, records):
+    if not records:
+        return
+    if TELEMETRY_BINARY:
+        await client.publish('backlog', signed(b"".join(records)), qos = 1)
+    else:
+        await client.publish('backlog', signed(b"[" + b",".join(records) + b"]"), qos = 1)
 
 
-# ----- setup async functions that will run in the async event loop -----
 
-# attempts to upload files in /logs/, which are saved when
-# uploading failes. does not run in main event loop, only runs in logData()
-async def tryToUploadBackup(client):
-    logFolder = os.listdir("/logs")
-    for file in logFolder:
+# called by the ntp client when network time set the internal clock, set the Battery Powered RTC too if possible
+def onNetworkTime():
+    global accurateTime
+    accurateTime = True
+    bootMark("network time")
+    print("online time set")
+    scheduleChanged.set()  # recheck the light schedule against the new time
+    if batteryClock:
         try:
-            with open(f"/logs/{file}", 'r') as f:
-                data = f.read().encode('ascii')
-                await client.publish('data', data, qos = 1)
-                f.close()
-                os.remove(f"/logs/{file}")
-                print(f"backup data sent from \"{file}\"")
-        except Exception as e:
-            print(f"failed to upload backup file \"{file}\", encountered error: {e}")
+            batteryClock.DateTime(rtc.datetime())  # type: ignore
+        except:
+            print("WARNING: Failed to set the battery-powered clock")
 
 
+print(rtc.datetime)
 
-# syncs the time using the internet or rtc, runs every hour
-async def syncTime():
-    while True:
-        await asyncio.sleep(3600)
-        # attempt to set the time online, set the Battery Powered RTC too if possible
+# waits until the sample after the one due at `due` (ticks_ms) and returns the time it
+# was due. Samples follow a fixed schedule, the time it takes to read the sensors does
+# not push the next one back. Counts ticks from the battery clock if it is wired up,
+# falls back to a timer if a tick is more than 0.5s late.
+async def waitForSample(due):
+    if not clockTick:
+        due = utime.ticks_add(due, SAMPLE_INTERVAL_MS)
+        wait = utime.ticks_diff(due, utime.ticks_ms())
+        if wait < -SAMPLE_INTERVAL_MS:
+            return utime.ticks_ms()  # fell behind by more than a sample, skip the missed ones
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+        return due
+    for _ in range(max(1, SAMPLE_INTERVAL_MS // 1000)):
         try:
-            ntptime.settime()
-            print("online time set")
-            if batteryClock:
-                batteryClock.DateTime(rtc.datetime())  # type: ignore
-            continue
-        except:
-            print(
-                "WARNING: Failed to sync time online, Internal Clock and RTC may slowly drift away from accurate time")
-
+            await asyncio.wait_for_ms(clockTick.wait(), 1500)  # type: ignore
+        except asyncio.TimeoutError:
+            pass
+    return utime.ticks_ms()
 
-# reads from ledbuffer, see queueLedAction for adding tasks to ledbuffer
-async def ledStatus():
-    global ledBuffer
-    global np
 
+# samples the sensors into the aggregator and queues the summary of every
+# window that ended for logData()
+async def sampleSensors():
+    due = utime.ticks_ms()
+    aggregator.reset(due)  # windows line up with the sample schedule
     while True:
-        await asyncio.sleep_ms(1)
-
-        if ledBuffer == []:
+        taskSupervisor.beat("sampleSensors")
+        due = await waitForSample(due)
+        aggregator.add(await getReadings())
+        done = aggregator.collect(due)
+        if not done:
+            memoryHeap.idle()  # nothing else is due until the next sample
             continue
-        else:
-            ledNumber = ledBuffer.pop()
-
-        for i in range(0, 255):
-            ledColor = [0, 0, 0]
-            ledColor[ledNumber] = i
-            np[0] = ledColor
-            np.write()
-            await asyncio.sleep_ms(4)
-        for i in range(255, -1, -1):
-            ledColor = [0, 0, 0]
-            ledColor[ledNumber] = i
-            np[0] = ledColor
-            np.write()
-            await asyncio.sleep_ms(4)
+        datetime = rtc.datetime() if accurateTime else None
+        for summary in done:
+            summaries.append((datetime,) + summary)
+        while len(summaries) > SUMMARY_QUEUE_LEN:
+            summaries.pop(0)
+        summaryReady.set()
 
 
-print(rtc.datetime)
+# prints an hourlog line for averaged readings
+def printHourlog(datetime, means):
+    stat = {"yea": datetime[0], "mon": datetime[1], "day": datetime[2],
+            "hou": datetime[4], "min": datetime[5]}
+    print(gbeformat.hourlog_head() + gbeformat.hourlog(stat, dict(zip(LOG_AVG_KEYS, means))))
 
-# Runs in the main event loop, If something takes more than 8.388 seconds, then restart the board
-# If you notice the board restarting, maybe remove thsi from the main event loop.
-# I would set it higher, but unfortunately 8388 is the max value.
-async def watchDog():
-    wdt = WDT(timeout=8388)
-    while True:
-        await asyncio.sleep_ms(1) # feed the watchdog as often as possible
-        wdt.feed()
 
-# logs data and sends it to server, saves data if it fails to send.
+# logs window summaries and sends them to server, saves data if it fails to send.
 async def logData(client):
-    global accurateTime
     while True:
-        await asyncio.sleep(5)
-        datetime = rtc.datetime()
+        taskSupervisor.beat("logData")
+        if not summaries:
+            summaryReady.clear()
+            taskSupervisor.idle("logData")
+            await summaryReady.wait()
+            continue
+        datetime, seconds, samples, means, mins, maxs, lasts = summaries.pop(0)
+
+        if seconds >= 3600 and datetime:
+            printHourlog(datetime, means)
 
-        # find the filename, will be saved as datetime, or unknown
-        if accurateTime: # if the time is accurate, use the date, else, use Unknown(NUM).json
-            allstats = getStats()
-            logDir = f"/logs/{datetime[0]}-{datetime[1]}-{datetime[2]} {datetime[4]}:{datetime[5]}.json"
+        allstats = statsHeader(datetime)
+        if TELEMETRY_BINARY:
+            dataString = encoder.pack(datetime, allstats + means, seconds, samples, (mins, maxs, lasts))
+        elif seconds == aggregator.windows[0].seconds:
+            allstats += [v if v == -1 else round(v, n) if n else round(v)
+                         for v, n in zip(means, JSON_DECIMALS)]
+            dataString = json.dumps(allstats).encode('ascii')
         else:
-            allstats = getStatsNoRTC()
-            logDir = f"/logs/UnknownDate({lookForUnknownNumber()}).json"
+            continue
 
-        # Try to upload backup data saved from previous runs
-        await tryToUploadBackup(client)
-        
-        # will try to upload most recent logs, saves to the above filename in /logs/
+        # will try to upload most recent logs, saves to the log store if there is no connection
+        # or it fails
         try:
-            dataString = json.dumps(allstats).encode('ascii')
-            print(dataString)
-            await client.publish('data', dataString, qos = 1)
-            print("data sent!")
+            if not client.isconnected():
+                raise OSError("not connected")
+            await client.publish('data', signed(dataString), qos = 1)
+            print(f"data sent! ({seconds}s average of {samples} samples)")
+            if "first publish" not in bootProfile:
+                bootMark("first publish")
+                await publishBootProfile(client)
             continue
         except Exception as e:
             print(f"data upload failed: {e}")
-            logFile = open(logDir, "w")
-            print(f"saving to \"{logDir}\"")
-            logFile.write(json.dumps(allstats))
-            logFile.close()
+            print("saving to the log store")
+            logStore.append(dataString)
+            backlogAdded.set()
         
 
 # This handles wifi outages, and attempts to reconnect if one is detected
 # NOTE: this is not started in the main function, rather, its started in mqttHandler()
 async def reconnect(client):
     while True:
+        taskSupervisor.beat("reconnect")
         await asyncio.sleep(1)
         
         if client.isconnected():
@@ -621,144 +790,338 @@ async def reconnect(client):
             print(f"failed to reconnect:{e}")
             await asyncio.sleep(5)
 
+# Settings can be changed over MQTT without a reboot: a json object of settings
+# sections published on "config/<board id>", or on "config/all" for several
+# boxes at once, replaces those sections of gbe_settings.json. Messages have to
+# be signed with the key of the box (see lib/auth.py) and newer than the last
+# one. Only CONFIG_SECTIONS can be changed, they are the ones valid_config()
+# checks completely and they are used right away. The file is only written when
+# a section changed. The result of every message to the box is published on
+# "config/<board id>/ack".
+CONFIG_TOPIC = "config/" + board_id
+FLEET_CONFIG_TOPIC = "config/all"
+CONFIG_TOPICS = (CONFIG_TOPIC.encode(), FLEET_CONFIG_TOPIC.encode())
+CONFIG_SECTIONS = ("lights", "fan")
+CONFIG_COUNTER_PATH = '/config/config_counter'
+PENDING_CONFIGS = 4
+# (payload, retained) from onMessage() waiting for configListener()
+pendingConfigs = []
+configReceived = asyncio.Event()
+
+# mqtt_as subs_cb, runs in the mqtt_as receive task so it only hands the message over
+def onMessage(topic, msg, retained):
+    if topic in CONFIG_TOPICS:
+        if len(pendingConfigs) >= PENDING_CONFIGS:
+            print("WARNING: config update dropped, too many waiting")
+            return
+        pendingConfigs.append((msg, retained))
+        configReceived.set()
+
+# mqtt_as connect_coro, sessions are clean so the subscriptions are made after every connect
+async def subscribeConfig(client):
+    if not signer:
+        return  # config messages can't be checked without the key of the box
+    try:
+        for topic in (CONFIG_TOPIC, FLEET_CONFIG_TOPIC):
+            await client.subscribe(topic, 1)
+    except Exception as e:
+        print(f"failed to subscribe to config updates: {e}")
+
+# counter of the last config message, older ones are replays
+try:
+    with open(CONFIG_COUNTER_PATH) as f:
+        configCounter = int(f.read())
+except (OSError, ValueError):
+    configCounter = 0
+
+# checks, saves and applies new settings sections, returns
+# "applied", "unchanged", "invalid" or "error"
+def applyConfig(payload):
+    global settings
+    global lightSchedule
+    try:
+        update = json.loads(payload)
+    except ValueError:
+        return "invalid"
+    if not isinstance(update, dict) or not all(isinstance(v, dict) for v in update.values()):
+        return "invalid"
+    if not all(k in CONFIG_SECTIONS for k in update):
+        return "invalid"
+    changed = [k for k in update if settings.get(k) != update[k]]
+    if not changed:
+        return "unchanged"
+
+    newSettings = dict(settings)
+    newSettings.update(update)
+    if not gbeformat.valid_config(newSettings):
+        return "invalid"
+    try:
+        schedule = loadLightSchedule(newSettings)
+    except Exception:
+        return "invalid"
+
+    # written next to the old file first so a power cut can't leave half a file
+    try:
+        with open(SETTINGS_PATH + '.new', 'w') as f:
+            json.dump(newSettings, f)
+        os.rename(SETTINGS_PATH + '.new', SETTINGS_PATH)
+    except OSError as e:
+        print(f"failed to save the settings: {e}")
+        try:
+            os.remove(SETTINGS_PATH + '.new')
+        except OSError:
+            pass
+        return "error"
+    settings = newSettings
+    for k in changed:
+        config[k] = newSettings[k]
+    lightSchedule = schedule
+    scheduleChanged.set()  # controlLightsAndFan() picks up the new schedule now
+    return "applied"
+
+# checks a config message and applies it, returns (result, counter) to
+# acknowledge, or None if there is nothing to report
+def handleConfig(msg, retained):
+    global configCounter
+    try:
+        opened = signer.unwrap(msg)  # type: ignore
+    except ValueError as e:
+        print(f"WARNING: config update rejected, {e}")
+        return "forged", None
+    if opened is None:
+        return None  # a fleet message for other boxes
+    counter, payload = opened
+    if counter <= configCounter:
+        if retained and counter == configCounter:
+            return None  # the retained copy of the last one comes again on every connect
+        print(f"WARNING: config update rejected, counter {counter} is not above {configCounter}")
+        return "stale", counter
+    configCounter = counter
+    try:
+        with open(CONFIG_COUNTER_PATH, 'w') as f:
+            f.write(str(counter))
+    except OSError as e:
+        print(f"failed to save the config counter: {e}")
+    return applyConfig(payload), counter
+
+# applies settings received on the config topics and acknowledges them
+async def configListener(client):
+    while True:
+        await configReceived.wait()
+        configReceived.clear()
+        while pendingConfigs:
+            handled = handleConfig(*pendingConfigs.pop(0))
+            if handled is None:
+                continue
+            result, counter = handled
+            print(f"config update {counter} {result}")
+            ack = {"board": board_id, "result": result, "counter": counter}
+            try:
+                await client.publish(CONFIG_TOPIC + '/ack', signed(json.dumps(ack).encode('ascii')), qos = 1)
+            except Exception as e:
+                print(f"failed to acknowledge the config update: {e}")
+
+# publishes the event loop profile, the reset cause and the last stall
+async def publishDiagnostics(client):
+    while True:
+        await asyncio.sleep(DIAGNOSTICS_INTERVAL)
+        if not client.isconnected():
+            continue
+        summary = loopProfiler.summary()
+        summary["board"] = board_id
+        summary["reset"] = resetCause
+        summary["silent task"] = taskSupervisor.reset_task
+        summary["heap"] = memoryHeap.stats()
+        summary["sensors"] = sensors.states()
+        summary["fan stalls"] = fanTach.stalls
+        try:
+            await client.publish('diagnostics', signed(json.dumps(summary).encode('ascii')))
+        except Exception as e:
+            print(f"failed to publish diagnostics: {e}")
+
+# publishes when each boot phase ended, in ms since power on, once per boot
+async def publishBootProfile(client):
+    print(f"boot profile (ms since power on): {bootProfile}")
+    profile = {"board": board_id, "reset": resetCause, "silent task": taskSupervisor.reset_task,
+               "ms": bootProfile}
+    try:
+        await client.publish('boot', signed(json.dumps(profile).encode('ascii')))
+    except Exception as e:
+        print(f"failed to publish the boot profile: {e}")
+
 # Connect to the internet
 async def mqttHandler(client):
     print("attempting to connect...")
     # try to connect, to wifi, wait 5 secs and retry if failed.
+    # quick skips mqtt_as's 5 second Wi-Fi stability check on the first connect,
+    # reconnect() takes care of a connection that drops right away
     while not client.isconnected():
         try:
-            await client.connect()
+            await client.connect(quick = True)
+            bootMark("wifi")
             print("Connected!")
         except Exception as e:
             print(f"connection failed:{e}")
             await asyncio.sleep(5)
     
+    # publishes wait for the connection to come back, an outage is not a silent task
+    offline = lambda: not client.isconnected()
+    taskSupervisor.register("logData", WATCHDOG_DEADLINES["logData"], offline)
+    taskSupervisor.register("backlogUploader", WATCHDOG_DEADLINES["backlogUploader"], offline)
+    taskSupervisor.register("reconnect", WATCHDOG_DEADLINES["reconnect"])
+
     # start internet-dependent tasks in the main event loop.
-    asyncio.create_task(logData(client))
-    asyncio.create_task(reconnect(client))
+    asyncio.create_task(loopProfiler.wrap("logData", logData(client)))
+    asyncio.create_task(loopProfiler.wrap("backlogUploader", backlogUploader(client)))
+    asyncio.create_task(loopProfiler.wrap("reconnect", reconnect(client)))
+    asyncio.create_task(loopProfiler.wrap("publishDiagnostics", publishDiagnostics(client)))
+    asyncio.create_task(loopProfiler.wrap("configListener", configListener(client)))
 
 # Listen for hardware changes, if detected, attempt to connect.
 # This function connects hardware, this is in case of accidental
-# unplugging or hardware failure. TODO: add more support, fix "disconnected" message on startup
+# unplugging or hardware failure. Each poll only addresses every sensor once,
+# drivers are set up when a sensor appears (see lib/hotplug.py). TODO: add more support
 async def hardwareListener():
     global seesaw
     global ina
     global aht10
 
-    # These variables are to make sure hardware messages aren't printed multiple times
-    # NOTE: i THINK setting these to false will fix the "disconnected" issue but I'm not sure, I don't have time.
-    seesawDebounce = True
-    inaDebounce = True
-    ahtDebounce = True
     while True:
-        await asyncio.sleep_ms(500)
-        # attempt to connect to the seesaw if its not already connected
-        if not seesaw:
-            try:
-                seesaw = stemma_soil_sensor.StemmaSoilSensor(i2c1)
-                print("i2c soil sensor connected.")
-                seesawDebounce = True
-                queueLedAction(0)
-            except:
-                pass
-
-        # attempt to connect to the INA if its not already connected
-        if not ina:
-            try:
-                ina = ina219.INA219(0.1, i2c0)
-                ina.configure()
-                print("Connected to current sensor")
-                inaDebounce = True
-                queueLedAction(0)
-            except:
-                pass
-
-        if not aht10:
-            try:
-                aht10 = ahtx0.AHT10(i2c1)
-                aht10.initialize()
-                queueLedAction(0)
-            except:
-                pass
-
-
-        # check to see if readings are working, if not, set the hardware variable to false
-
-        if (tryGetSeesaw() == (-1, -1)) and seesawDebounce:
-            print("i2c soil sensor disconnected")
-            seesawDebounce = False
-            seesaw = False
-            queueLedAction(1)
-
-        if (tryGetINA() == (-1, -1, -1)) and inaDebounce:
-            print("INA disconnected")
-            inaDebounce = False
-            ina = False
-            queueLedAction(1)
-        
-        if (tryGetAht10() == (-1,-1)) and ahtDebounce:
-            print("aht Disconnected")
-            ahtDebounce = False
-            aht10 = False
-            queueLedAction(1)
-
-
-# Changes the lights and fans based off the time and user configurations
-# TODO: add tapering, eg: light intensity that follows a sin wave.
+        taskSupervisor.beat("hardwareListener")
+        for device in await sensors.poll():
+            connected = device.state == hotplug.READY
+            if device is inaDevice:
+                ina = device.driver or False
+            elif device is soilDevice:
+                seesaw = device.driver or False
+            else:
+                aht10 = device.driver or False
+            if connected:
+                print(f"{device.name} connected")
+                statusLed.pulse(statusled.GREEN, LED_CONNECTED)
+                continue
+            if device.state == hotplug.BACKOFF:
+                print(f"{device.name} disconnected, retrying in {device.backoff_ms} ms")
+            else:
+                print(f"{device.name} disconnected")
+            statusLed.pulse(statusled.RED, LED_DISCONNECTED)
+        bootMark("sensors")
+        await asyncio.sleep_ms(HOTPLUG_POLL_MS)
+
+
+# Changes the lights and fans based off the time and user configurations.
+# The lights can ramp up after the on time and down before the off time, set
+# in a "ramp" section of the "lights" config in minutes, for all channels or
+# per channel, eg: "ramp": {"dawn": 30, "dusk": {"red": 45, "white": 20},
+# "shape": "sine" or "linear", "steps": 64}
+
+# Channels in the order used by the precomputed duty tuples
+pwmChannels = (r, g, b, w, f)
+# Last duty written to each channel, -1 forces the first write
+pwmCurrent = [-1, -1, -1, -1, -1]
+
+# Set to wake controlLightsAndFan() early, eg: after the clock or config changed
+scheduleChanged = asyncio.Event()
+
+# Longest time the scheduler sleeps before rechecking the clock (ms),
+# so clock syncs are picked up without polling
+SCHEDULE_MAX_SLEEP_MS = 60000
+
+
+# Precompute everything controlLightsAndFan() needs from the config, so the
+# loop does no dictionary lookups, clamping or float math. Returns
+# (keyframe seconds of the day, duties of each keyframe) with duties as
+# duty_u16 values in pwmChannels order (see lib/ramp.py).
+def loadLightSchedule(config):
+    lightDuty = config['lights']['duty']
+    fanDuty = config['fan']['duty']
+    onDuties = (
+        int(min(200, lightDuty['red'])) * 256,     # Maximum brightness = 200
+        int(min(89, lightDuty['green'])) * 256,    # Maximum brightness = 89
+        int(min(94, lightDuty['blue'])) * 256,     # Maximum brightness = 94
+        int(min(146, lightDuty['white'])) * 256,   # Maximum brightness = 146
+        int(min(255, fanDuty['when lights on'])) * 256)  # Maximum fan power = 255
+    offDuties = (0, 0, 0, 0, int(min(255, fanDuty['when lights off'])) * 256)
+    rampSettings = config['lights'].get('ramp', {})
+    return ramp.schedule(hourAndMinutestoSeconds(config["lights"]["timer"]["on"]),
+                         hourAndMinutestoSeconds(config["lights"]["timer"]["off"]),
+                         onDuties, offDuties,
+                         rampSeconds(rampSettings.get('dawn', 0)),
+                         rampSeconds(rampSettings.get('dusk', 0)),
+                         rampSettings.get('shape', 'sine'),
+                         rampSettings.get('steps', 64))
+
+
+# ramp length of each channel in seconds from minutes for all light channels
+# or {channel: minutes}, the fan does not ramp
+def rampSeconds(minutes):
+    if not isinstance(minutes, dict):
+        minutes = {channel: minutes for channel in ("red", "green", "blue", "white")}
+    return tuple(int(minutes.get(channel, 0) * 60) for channel in ("red", "green", "blue", "white")) + (0,)
+
+
+lightSchedule = loadLightSchedule(config)
+
+
+# Writes the duty tuple, only touching channels whose value changed
+def writeDuties(duties):
+    for i in range(5):
+        if pwmCurrent[i] != duties[i]:
+            pwmChannels[i].duty_u16(duties[i])
+            pwmCurrent[i] = duties[i]
 
 
 async def controlLightsAndFan():
     print(config["lights"]["timer"]["on"], config["lights"]["timer"]["off"])
-    startLightTime = hourAndMinutestoSeconds(
-        config["lights"]["timer"]["on"])-60
-
-    endLightTime = hourAndMinutestoSeconds(config["lights"]["timer"]["off"])-60
     while True:
+        taskSupervisor.beat("controlLightsAndFan")
+        times, duties = lightSchedule
         datetimeSeconds = datetimeToSeconds(rtc.datetime())
-        if (datetimeSeconds > startLightTime) and (datetimeSeconds < endLightTime):
-            # Maximum brightness = 200
-            r.duty_u16(int(min(200, config['lights']['duty']['red']))*256)
-            # Maximum brightness = 89
-            g.duty_u16(int(min(89, config['lights']['duty']['green']))*256)
-            # Maximum brightness = 94
-            b.duty_u16(int(min(94, config['lights']['duty']['blue']))*256)
-            # Maximum brightness = 146
-            w.duty_u16(int(min(146, config['lights']['duty']['white']))*256)
-            # Maximum fan power = 255
-            f.duty_u16(
-                int(min(255, config['fan']['duty']['when lights on'])) * 256)
-        else:
-            # Lights off
-            r.duty_u16(0)
-            g.duty_u16(0)
-            b.duty_u16(0)
-            w.duty_u16(0)
-            f.duty_u16(
-                int(min(255, config['fan']['duty']['when lights off'])) * 256)
-        await asyncio.sleep_ms(1)
+        i = ramp.index(times, datetimeSeconds)
+        writeDuties(duties[i])
+
+        # sleep until the next keyframe, the next on/off transition or ramp step
+        waitMs = ((times[(i + 1) % len(times)] - datetimeSeconds) % 86400 or 86400) * 1000
+        scheduleChanged.clear()
+        try:
+            await asyncio.wait_for_ms(scheduleChanged.wait(),
+                                      max(1, min(waitMs, SCHEDULE_MAX_SLEEP_MS)))
+        except asyncio.TimeoutError:
+            pass
 
 
 # Main Async Function, all it does is run the coroutines
 async def main():
+    bootMark("event loop")
+    config['subs_cb'] = onMessage
+    config['connect_coro'] = subscribeConfig
     client = MQTTClient(config)
 
+    # keeps the internal clock synced with network time in the background, never blocks
+    wlan = network.WLAN(network.STA_IF)
+    ntpclient(host = ntpSettings.get('server', 'pool.ntp.org'),
+              poll = ntpSettings.get('max poll', 1024),
+              tz_offset = int(config["time zone"]["GMT offset"] * 3600),
+              on_step = onNetworkTime,
+              ready = wlan.isconnected)
+
     # This should never return, if it does, restart the board
 
     await asyncio.gather(
-        syncTime(), 
-        controlLightsAndFan(),  
-        hardwareListener(), 
-        ledStatus(),
-        mqttHandler(client),
-        watchDog(),)
+        loopProfiler.wrap("controlLightsAndFan", controlLightsAndFan()),
+        loopProfiler.wrap("sampleSensors", sampleSensors()),
+        loopProfiler.wrap("hardwareListener", hardwareListener()),
+        loopProfiler.wrap("ledStatus", statusLed.run()),
+        loopProfiler.wrap("mqttHandler", mqttHandler(client)),
+        loopProfiler.wrap("watchDog", taskSupervisor.run()),)
 
     machine.reset()
 
 
 
-# Set up an interrupt (trigger) to count fan rotations for RPM calculation
+# Set up an interrupt (trigger) to time fan rotations for RPM calculation
 p5 = machine.Pin(5, machine.Pin.IN, machine.Pin.PULL_UP)
-p5.irq(trigger=machine.Pin.IRQ_FALLING, handler=fanPulse)
+p5.irq(trigger=machine.Pin.IRQ_FALLING, handler=fanTach.irq, hard=True)
 
 # Setup the main async event loop
 print(rtc.datetime())
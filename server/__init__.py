@@ -0,0 +1,4 @@
+"""Host side tools for the GBE control box: decoding, ingest and load testing.
+
+These run under CPython on a server or laptop, not on the Pico.
+"""
@@ -0,0 +1,196 @@
+"""Verifier for the authenticated envelopes of lib/auth.py.
+
+SETUP.PY makes the secret of a box and prints it with the board id, they
+are registered here by hand and never sent over the network. A board keeps
+the key it was registered with, registering another one fails until it was
+removed from the keys file.
+
+unwrap() checks the tag and the counter of a message and returns the
+payload. Counters may arrive out of order (several publishes in flight,
+QoS 1 redeliveries) within the last `window` values, a counter seen before
+or older than that is a replay. The highest counter of every board is kept
+with its key when the keys file is saved.
+
+Messages to a box, such as settings for main.py on "config/<board>", are
+signed with the same envelope, sign_fleet() addresses several boxes with one
+message for "config/all". The box only accepts a counter above the last one
+it accepted, so next_counter() keeps a sequence per board in the keys file
+that never goes back, not even below the current time in seconds when the
+keys file was lost.
+
+Usage: python -m server.auth register BOARD KEY [--keys keys.json]
+       python -m server.auth verify HEX_PAYLOAD [--keys keys.json]
+       python -m server.auth sign PAYLOAD [--board BOARD ...] [--keys keys.json] > message
+"""
+
+import argparse
+import binascii
+import hashlib
+import hmac
+import json
+import struct
+import sys
+import time
+
+MAGIC = 0xA7
+HEADER = "<B8sI"
+HEADER_SIZE = 13
+TAG_SIZE = 8
+FLEET = b"\xff" * 8
+
+
+class AuthError(ValueError):
+    """Raised for messages that are not signed, signed with the wrong key or replayed."""
+
+
+def tag(key, data):
+    """The truncated HMAC-SHA256 lib/auth.py appends"""
+    return hmac.new(key, data, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+def sign(key, board, counter, payload):
+    """Wrap payload like lib/auth.py Signer.sign() does, board is the raw id"""
+    data = struct.pack(HEADER, MAGIC, board, counter) + payload
+    return data + tag(key, data)
+
+
+def sign_fleet(keys, counter, payload):
+    """One message for every board of keys, {raw board id: key}, that lib/auth.py
+       Signer.unwrap() of each of them accepts"""
+    data = struct.pack(HEADER, MAGIC, FLEET, counter) + payload
+    entries = b"".join(board + tag(key, data) for board, key in keys.items())
+    return data + entries + struct.pack("<H", len(keys))
+
+
+def is_signed(payload):
+    return payload[:1] == bytes([MAGIC])
+
+
+class Verifier:
+    """Keys of the enrolled boards and the counters seen from them.
+       :param str path: json file of {board: {"key": hex, "counter": n, "sent": n}},
+           or None.
+       :param int window: counters below the highest seen that are still accepted.
+       :param bool required: unsigned messages are rejected too."""
+
+    def __init__(self, path=None, window=64, required=False):
+        self.path = path
+        self.window = window
+        self.required = required
+        self.keys = {}  # board hex: key
+        self._seen = {}  # board hex: [highest counter, bitmask of the window below it]
+        self._sent = {}  # board hex: counter of the last message signed for it
+        if path:
+            try:
+                with open(path) as f:
+                    boards = json.load(f)
+            except FileNotFoundError:
+                boards = {}
+            for board, entry in boards.items():
+                self.keys[board] = binascii.unhexlify(entry["key"])
+                self._seen[board] = [entry.get("counter", 0), 0]
+                self._sent[board] = entry.get("sent", 0)
+
+    def save(self):
+        if not self.path:
+            return
+        boards = {board: {"key": key.hex(), "counter": self._seen.get(board, [0])[0],
+                          "sent": self._sent.get(board, 0)}
+                  for board, key in self.keys.items()}
+        with open(self.path, "w") as f:
+            json.dump(boards, f, indent=1)
+
+    def register(self, board, key):
+        """Register the key of a board, returns False if it already has another one"""
+        current = self.keys.get(board)
+        if current is not None:
+            return hmac.compare_digest(current, key)
+        self.keys[board] = key
+        self._seen[board] = [0, 0]
+        self.save()
+        return True
+
+    def next_counter(self, boards):
+        """Counter for the next message to boards, above every one sent to them
+           before, and saves it"""
+        counter = max([int(time.time())] + [self._sent.get(board, 0) + 1 for board in boards])
+        for board in boards:
+            self._sent[board] = counter
+        self.save()
+        return counter
+
+    def unwrap(self, payload):
+        """Check a signed message, returns (board hex, counter, payload)"""
+        if len(payload) < HEADER_SIZE + TAG_SIZE or not is_signed(payload):
+            raise AuthError("not a signed message")
+        _, raw, counter = struct.unpack_from(HEADER, payload)
+        board = raw.hex()
+        key = self.keys.get(board)
+        if key is None:
+            raise AuthError(f"board {board} is not enrolled")
+        data, received = payload[:-TAG_SIZE], payload[-TAG_SIZE:]
+        if not hmac.compare_digest(tag(key, data), received):
+            raise AuthError(f"wrong tag from board {board}")
+        self._check_counter(board, counter)
+        return board, counter, data[HEADER_SIZE:]
+
+    def _check_counter(self, board, counter):
+        seen = self._seen.setdefault(board, [0, 0])
+        highest, mask = seen
+        if counter > highest:
+            shift = counter - highest
+            seen[0] = counter
+            seen[1] = ((mask << shift) | (1 << (shift - 1))) & ((1 << self.window) - 1)
+            return
+        age = highest - counter
+        if counter == highest or age > self.window or mask & (1 << (age - 1)):
+            raise AuthError(f"replayed counter {counter} from board {board}")
+        seen[1] = mask | (1 << (age - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the keys of enrolled boxes")
+    parser.add_argument("--keys", default="keys.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register", help="register a key by hand")
+    register.add_argument("board", help="board id in hex")
+    register.add_argument("key", help="secret in hex")
+    verify = commands.add_parser("verify", help="check a signed payload")
+    verify.add_argument("payload", help="payload in hex")
+    to_box = commands.add_parser("sign", help="sign a message to boxes, written to stdout")
+    to_box.add_argument("payload", help="the message, eg. a json object of settings")
+    to_box.add_argument("--board", action="append",
+                        help="board id in hex, repeat for several, all registered boards "
+                             "if left out. One board gets a message for config/<board>, "
+                             "several get one for config/all")
+    args = parser.parse_args()
+
+    if args.command == "register":
+        key = binascii.unhexlify(args.key)
+        if not Verifier(args.keys).register(args.board, key):
+            parser.exit(1, f"board {args.board} is already registered with another key\n")
+        print(f"registered {args.board}")
+    elif args.command == "sign":
+        verifier = Verifier(args.keys)
+        boards = args.board or sorted(verifier.keys)
+        missing = [board for board in boards if board not in verifier.keys]
+        if missing or not boards:
+            parser.exit(1, f"board {', '.join(missing) or '(none)'} is not registered\n")
+        counter = verifier.next_counter(boards)
+        payload = args.payload.encode()
+        if len(boards) == 1:
+            message = sign(verifier.keys[boards[0]], binascii.unhexlify(boards[0]), counter, payload)
+        else:
+            message = sign_fleet({binascii.unhexlify(board): verifier.keys[board] for board in boards},
+                                 counter, payload)
+        sys.stdout.buffer.write(message)
+    else:
+        try:
+            board, counter, payload = Verifier(args.keys).unwrap(binascii.unhexlify(args.payload))
+        except AuthError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"board {board}, counter {counter}, payload {payload.hex()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""MQTT ingest service: stores the samples published by the boxes in SQLite.
+
+Subscribes to the "data" and "backlog" topics, decodes every payload with
+server.telemetry, validates the values and inserts the rows in batches, one
+executemany() transaction per batch run in a worker thread so the event
+loop keeps reading. A batch is written when it has batch_size rows or
+flush_interval seconds after its first message.
+
+Memory is bounded: at most queue_size messages wait to be decoded. When the
+queue is full the client stops reading from the broker, which in turn slows
+the boxes down (see server/mqtt.py).
+
+Values of -1, the readings main.py could not take, and values outside
+RANGES are stored as NULL.
+
+With --keys the signed messages of enrolled boxes (see server/auth.py) are
+verified and unwrapped, messages with a wrong tag, a replayed counter or
+rows of another board are dropped. --require-auth drops unsigned messages
+too.
+
+Usage: python -m server.ingest [--db gbe.sqlite] [--host HOST] [--port PORT]
+                               [--broker] [--keys keys.json [--require-auth]]
+--broker runs the stand-in broker from server/mqtt.py in the same process.
+"""
+
+import argparse
+import asyncio
+import sqlite3
+import time
+
+from server import auth, mqtt, telemetry
+
+TOPICS = ("data", "backlog")
+
+COLUMNS = telemetry.FIELDS + telemetry.EXTRA_FIELDS + ("topic", "received")
+
+# Plausible range of each numeric field, other values are stored as NULL
+RANGES = {
+    "red": (0, 255), "green": (0, 255), "blue": (0, 255), "white": (0, 255),
+    "volts": (0, 40), "milliamps": (-10000, 10000), "watts": (0, 400),
+    "fan": (0, 255), "rpm": (0, 20000),
+    "soil_temperature": (-40, 85), "soil_moisture": (0, 4095),
+    "ambient_temperature": (-40, 85), "ambient_humidity": (0, 100),
+    "window": (0, 65535), "samples": (0, 65535),
+}
+RANGES.update({f"{field}_{stat}": RANGES[field] for field in telemetry.EXTREME_FIELDS
+               for stat in ("min", "max", "last")})
+
+# Reading main.py sends when a sensor could not be read
+MISSING = -1
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY, "
+    + ", ".join(COLUMNS) + ")",
+    "CREATE INDEX IF NOT EXISTS samples_board ON samples (board, received)",
+)
+
+INSERT = (f"INSERT INTO samples ({', '.join(COLUMNS)}) "
+          f"VALUES ({', '.join('?' * len(COLUMNS))})")
+
+
+def validate(row):
+    """Replace missing and implausible values with None, in place. Returns
+       the number of implausible values."""
+    invalid = 0
+    for field, (low, high) in RANGES.items():
+        value = row.get(field)
+        if value is None:
+            continue
+        if value == MISSING:
+            row[field] = None
+        elif (isinstance(value, bool) or not isinstance(value, (int, float))
+              or not low <= value <= high):
+            row[field] = None
+            invalid += 1
+    return invalid
+
+
+def connect(path):
+    """Open the database and create the samples table if needed"""
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(SCHEMA[0])
+    # databases made before a column was added to COLUMNS get it, empty for older rows
+    existing = {row[1] for row in db.execute("PRAGMA table_info(samples)")}
+    for column in COLUMNS:
+        if column not in existing:
+            db.execute(f"ALTER TABLE samples ADD COLUMN {column}")
+    for statement in SCHEMA[1:]:
+        db.execute(statement)
+    db.commit()
+    return db
+
+
+class Ingest:
+    """Decodes, validates and stores messages.
+       :param str path: SQLite database file.
+       :param int batch_size: rows written per transaction at most.
+       :param float flush_interval: seconds a row waits for a full batch.
+       :param int queue_size: messages waiting to be decoded at most.
+       :param verifier: server.auth.Verifier for signed messages, or None."""
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, queue_size=10000,
+                 verifier=None):
+        self.db = connect(path)
+        self.verifier = verifier
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(queue_size)
+        # called with the (message, received) pairs of every written batch
+        self.on_commit = None
+        self.messages = 0
+        self.rows = 0
+        self.batches = 0
+        self.decode_errors = 0
+        self.auth_errors = 0
+        self.invalid_values = 0
+        self.write_seconds = 0.0
+        self._pending = None  # (batch, rows) being collected by write_batches()
+
+    async def feed(self, message):
+        """Queue a server.mqtt.Message, waits while the queue is full"""
+        await self.queue.put((message, time.time()))
+
+    def _unwrap(self, message):
+        """The payload of a message, checked if it is signed. Returns
+           (board hex or None if unsigned, payload)"""
+        payload = message.payload
+        if self.verifier is None:
+            return None, payload
+        if auth.is_signed(payload):
+            board, _, payload = self.verifier.unwrap(payload)
+            return board, payload
+        if self.verifier.required:
+            raise auth.AuthError(f"unsigned {message.topic} message")
+        return None, payload
+
+    def _rows(self, message, received):
+        try:
+            board, payload = self._unwrap(message)
+            if not payload:
+                return []
+            rows = telemetry.decode(payload)
+            if board and any(row["board"] != board for row in rows):
+                raise auth.AuthError(f"board {board} signed rows of another board")
+        except auth.AuthError as e:
+            self.auth_errors += 1
+            print(f"dropped {message.topic} message: {e}")
+            return []
+        except (telemetry.DecodeError, ValueError, KeyError, TypeError) as e:
+            self.decode_errors += 1
+            print(f"dropped {message.topic} message: {e}")
+            return []
+        out = []
+        for row in rows:
+            self.invalid_values += validate(row)
+            row["topic"] = message.topic
+            row["received"] = received
+            out.append(tuple(row[c] for c in COLUMNS))
+        return out
+
+    def _insert(self, rows):
+        start = time.perf_counter()
+        with self.db:
+            self.db.executemany(INSERT, rows)
+        return time.perf_counter() - start
+
+    async def write_batches(self):
+        """Runs forever, writing queued messages in batches"""
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self.queue.get()
+            batch = [first]
+            rows = self._rows(*first)
+            self._pending = (batch, rows)
+            deadline = loop.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.append(item)
+                rows.extend(self._rows(*item))
+            self._pending = None
+            await self._write(batch, rows)
+
+    async def _write(self, batch, rows):
+        if rows:
+            self.write_seconds += await asyncio.to_thread(self._insert, rows)
+            self.rows += len(rows)
+            self.batches += 1
+        self.messages += len(batch)
+        if self.on_commit:
+            self.on_commit(batch)
+
+    async def flush(self):
+        """Write everything still queued, after write_batches() was cancelled"""
+        batch, rows = self._pending or ([], [])
+        self._pending = None
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            batch.append(item)
+            rows.extend(self._rows(*item))
+        await self._write(batch, rows)
+
+    async def consume(self, client):
+        """Feed every message the client receives until it disconnects"""
+        async for message in client.messages():
+            await self.feed(message)
+
+    async def run(self, host="127.0.0.1", port=1883, client_id="gbe-ingest"):
+        """Subscribe and store messages forever, reconnecting like the boxes do"""
+        writer = asyncio.create_task(self.write_batches())
+        try:
+            while True:
+                client = mqtt.Client(client_id, queue_size=1000)
+                try:
+                    await client.connect(host, port, clean=True)
+                    for topic in TOPICS:
+                        await client.subscribe(topic, qos=1)
+                    print(f"ingest connected to {host}:{port}")
+                    await self.consume(client)
+                    print("connection to the broker lost")
+                except (OSError, asyncio.TimeoutError, mqtt.MQTTError) as e:
+                    print(f"failed to connect to the broker: {e}")
+                finally:
+                    client.close()
+                await asyncio.sleep(5)
+        finally:
+            writer.cancel()
+
+    def stats(self):
+        return {
+            "messages": self.messages,
+            "rows": self.rows,
+            "batches": self.batches,
+            "queued": self.queue.qsize(),
+            "decode errors": self.decode_errors,
+            "auth errors": self.auth_errors,
+            "invalid values": self.invalid_values,
+            "write seconds": round(self.write_seconds, 3),
+        }
+
+    def close(self):
+        if self.verifier:
+            self.verifier.save()
+        self.db.close()
+
+
+async def _report(ingest, interval=10):
+    while True:
+        await asyncio.sleep(interval)
+        print(ingest.stats())
+
+
+async def main(args):
+    verifier = None
+    if args.keys:
+        verifier = auth.Verifier(args.keys, required=args.require_auth)
+    ingest = Ingest(args.db, args.batch_size, args.flush_interval, verifier=verifier)
+    broker = None
+    if args.broker:
+        broker = await mqtt.Broker(args.host, args.port).start()
+        print(f"broker listening on {broker.host}:{broker.port}")
+    reporter = asyncio.create_task(_report(ingest))
+    try:
+        await ingest.run(args.host, args.port)
+    finally:
+        reporter.cancel()
+        await ingest.flush()
+        ingest.close()
+        if broker:
+            await broker.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store box telemetry in SQLite")
+    parser.add_argument("--db", default="gbe.sqlite")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--broker", action="store_true", help="run the stand-in broker too")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--keys", help="json file of the enrolled boards, verifies signed messages")
+    parser.add_argument("--require-auth", action="store_true", help="drop unsigned messages")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,346 @@
+"""Fleet load generator: many simulated boxes publishing over MQTT from one process.
+
+Each box follows main.py: mqttHandler() retries the first connection every
+5 seconds, reconnect() checks the connection every second and retries after
+3 seconds, logData() publishes one record with QoS 1 every interval and
+saves it to the log store when that fails, and backlogUploader() sends the
+saved records in batches of 16, up to 3 batches in flight and 8 records a
+second. Payloads are binary records (or json lists with --format json)
+like the boxes send.
+
+--outage START SECONDS drops the Wi-Fi of every box for a while, so the
+backlog flood that follows can be measured. Without --host the stand-in
+broker of server/mqtt.py runs in the same process, --ingest DB runs the
+ingest service too and measures the time from publish to database.
+
+The report lists publish and ingest throughput and the latency percentiles
+of PUBACKs and of stored rows, in milliseconds.
+
+Usage: python -m server.loadgen [--clients N] [--duration SECONDS]
+                                [--interval SECONDS] [--ramp SECONDS]
+                                [--format binary|json] [--outage START SECONDS]
+                                [--backlog RECORDS] [--host HOST] [--port PORT]
+                                [--ingest DB]
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import struct
+import time
+
+from server import ingest, mqtt, telemetry
+
+# main.py defaults
+BACKLOG_BATCH = 16
+BACKLOG_RATE = 8
+BACKLOG_INFLIGHT = 3
+LOG_CAPACITY = 4 * 512  # records the log store holds
+RESPONSE_TIME = 10
+
+VERSION = 3
+FORMAT, SIZE = telemetry.FORMATS[VERSION]
+
+
+def pack_record(board, ts, window=60, samples=60):
+    """A version 3 binary record with plausible readings"""
+    sst = 2200 + random.randint(-50, 50)
+    ssm = 600 + random.randint(-10, 10)
+    aht = 2400 + random.randint(-50, 50)
+    ahh = 5500 + random.randint(-200, 200)
+    return struct.pack(FORMAT, VERSION, telemetry.FLAG_TIME, board, ts,
+                       72, 60, 52, 44,
+                       1200 + random.randint(-5, 5), 500 + random.randint(-20, 20), 600,
+                       255, 1980 + random.randint(-30, 30),
+                       sst, ssm, aht, ahh,
+                       window, samples,
+                       sst - 20, sst + 20, sst, ssm - 5, ssm + 5, ssm,
+                       aht - 30, aht + 30, aht, ahh - 100, ahh + 100, ahh)
+
+
+def json_record(board_id, ts):
+    """A getStats() list as main.py sends it with "telemetry": {"format": "json"}"""
+    # statsHeader() sends the hour and minute without seconds or zero padding
+    hour, minute = divmod(ts // 60, 60)
+    return json.dumps([board_id, "\"2024-6-1\"", f"\"{hour % 24}:{minute}\"",
+                       72, 60, 52, 44, 12.0, 500, 6.0, 255, 1980, 22.0, 600, 24.0, 55.0]).encode()
+
+
+def percentiles(values):
+    """p50, p90, p99 and max of values in seconds, as milliseconds"""
+    if not values:
+        return None
+    values = sorted(values)
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 2)
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99),
+            "max": round(values[-1] * 1000, 2)}
+
+
+class Box:
+    """One simulated control box"""
+
+    def __init__(self, fleet, index):
+        self.fleet = fleet
+        self.board = struct.pack(">Q", 0xE661640800000000 + index)
+        self.board_id = self.board.hex()
+        self.client = None
+        self.log = collections.deque(maxlen=LOG_CAPACITY)
+        self.log_added = asyncio.Event()
+        self._ts = index * 10000000  # unique record timestamps
+        self._booted = 0.0
+
+    def record(self):
+        self._ts += 1
+        if self.fleet.format == "json":
+            return json_record(self.board_id, self._ts)
+        return pack_record(self.board, self._ts)
+
+    def connected(self):
+        return self.client is not None and self.client.connected
+
+    async def connect(self):
+        fleet = self.fleet
+        if fleet.wifi_down():
+            await asyncio.sleep(2)  # joining the network times out
+            raise OSError("no network")
+        client = mqtt.Client(self.board_id, queue_size=16, max_inflight=4,
+                             response_time=RESPONSE_TIME)
+        start = time.perf_counter()
+        try:
+            await client.connect(fleet.host, fleet.port, clean=True, timeout=RESPONSE_TIME)
+        except (OSError, asyncio.TimeoutError, mqtt.MQTTError):
+            fleet.connect_failures += 1
+            raise
+        fleet.connect_latency.append(time.perf_counter() - start)
+        fleet.connects += 1
+        self.client = client
+
+    async def publish(self, topic, payload):
+        if not self.connected():
+            raise OSError("not connected")
+        fleet = self.fleet
+        start = time.perf_counter()
+        fleet.in_flight[payload] = start
+        try:
+            await self.client.publish(topic, payload, qos=1)
+        except BaseException:
+            fleet.in_flight.pop(payload, None)
+            raise
+        fleet.publish_latency.append(time.perf_counter() - start)
+        fleet.acked += 1
+
+    async def run(self):
+        """mqttHandler()"""
+        await asyncio.sleep(random.uniform(0, self.fleet.ramp))
+        self._booted = time.perf_counter()
+        while not self.connected():
+            try:
+                await self.connect()
+            except (OSError, asyncio.TimeoutError, mqtt.MQTTError):
+                await asyncio.sleep(5)
+        await asyncio.gather(self.log_data(), self.backlog_uploader(), self.reconnect())
+
+    async def reconnect(self):
+        while True:
+            await asyncio.sleep(1)
+            if self.connected():
+                continue
+            await asyncio.sleep(3)
+            try:
+                await self.connect()
+            except (OSError, asyncio.TimeoutError, mqtt.MQTTError):
+                await asyncio.sleep(5)
+
+    async def log_data(self):
+        fleet = self.fleet
+        # windows start at boot, boxes started together publish together
+        await asyncio.sleep(fleet.interval - (time.perf_counter() - self._booted) % fleet.interval)
+        while True:
+            record = self.record()
+            fleet.published += 1
+            try:
+                await self.publish("data", record)
+            except (OSError, asyncio.TimeoutError):
+                fleet.failed += 1
+                self.log.append(record)
+                self.log_added.set()
+            await asyncio.sleep(fleet.interval - (time.perf_counter() - self._booted) % fleet.interval)
+
+    async def backlog_uploader(self):
+        fleet = self.fleet
+        while True:
+            if not self.log:
+                self.log_added.clear()
+                await self.log_added.wait()
+                continue
+            batches = []
+            records = list(self.log)
+            for i in range(0, min(len(records), BACKLOG_BATCH * BACKLOG_INFLIGHT), BACKLOG_BATCH):
+                batches.append(records[i:i + BACKLOG_BATCH])
+            payloads = [b"".join(batch) if fleet.format == "binary"
+                        else b"[" + b",".join(batch) + b"]" for batch in batches]
+            results = await asyncio.gather(*[self.publish("backlog", p) for p in payloads],
+                                           return_exceptions=True)
+            sent = 0
+            for batch, result in zip(batches, results):
+                if isinstance(result, Exception):
+                    break
+                for _ in batch:
+                    self.log.popleft()
+                sent += len(batch)
+            fleet.backlog_records += sent
+            if sent == sum(len(b) for b in batches):
+                await asyncio.sleep(max(1, sent) / BACKLOG_RATE)
+            else:
+                await asyncio.sleep(5)
+
+    def close(self):
+        if self.client:
+            self.client.close()
+
+
+class Fleet:
+    """N boxes and the counters they share"""
+
+    def __init__(self, clients, host, port, interval=60, ramp=0, format="binary",
+                 outage=None, backlog=0):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.ramp = ramp
+        self.format = format
+        self.outage = outage  # (start, seconds) after the fleet started
+        self.start = time.perf_counter()
+        self.boxes = [Box(self, i) for i in range(clients)]
+        for box in self.boxes:
+            for _ in range(backlog):
+                box.log.append(box.record())
+        self.in_flight = {}  # payload: publish time, until stored by the ingest
+        self.publish_latency = []
+        self.connect_latency = []
+        self.ingest_latency = []
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+        self.backlog_records = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.rows = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def wifi_down(self):
+        if not self.outage:
+            return False
+        start, seconds = self.outage
+        return start <= self.elapsed() < start + seconds
+
+    def stored(self, batch):
+        """Ingest.on_commit"""
+        now = time.perf_counter()
+        for message, _ in batch:
+            sent = self.in_flight.pop(message.payload, None)
+            if sent is not None:
+                self.ingest_latency.append(now - sent)
+
+    async def _outage(self):
+        start, seconds = self.outage
+        await asyncio.sleep(start)
+        print(f"{self.elapsed():.1f}s: Wi-Fi down for {seconds}s")
+        for box in self.boxes:
+            box.close()
+        await asyncio.sleep(seconds)
+        print(f"{self.elapsed():.1f}s: Wi-Fi back")
+
+    async def run(self, duration):
+        self.start = time.perf_counter()
+        tasks = [asyncio.create_task(box.run()) for box in self.boxes]
+        if self.outage:
+            tasks.append(asyncio.create_task(self._outage()))
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for box in self.boxes:
+                box.close()
+
+    def report(self, duration, broker=None, ingest_service=None):
+        report = {
+            "clients": len(self.boxes),
+            "duration": duration,
+            "records published": self.published,
+            "records failed": self.failed,
+            "publishes acked": self.acked,
+            "backlog records sent": self.backlog_records,
+            "backlog records left": sum(len(box.log) for box in self.boxes),
+            "connects": self.connects,
+            "connect failures": self.connect_failures,
+            "publishes acked per second": round(self.acked / duration, 1),
+            "connect latency ms": percentiles(self.connect_latency),
+            "publish latency ms": percentiles(self.publish_latency),
+        }
+        if broker:
+            report["broker messages in"] = broker.messages_in
+            report["broker messages out"] = broker.messages_out
+        if ingest_service:
+            stats = ingest_service.stats()
+            report["ingest"] = stats
+            report["ingest rows per second"] = round(stats["rows"] / duration, 1)
+            report["ingest latency ms"] = percentiles(self.ingest_latency)
+        return report
+
+
+async def main(args):
+    broker = None
+    host, port = args.host, args.port
+    if host is None:
+        broker = await mqtt.Broker("127.0.0.1", 0, queue_size=10000).start()
+        host, port = broker.host, broker.port
+    ingest_service = None
+    ingest_task = None
+    fleet = Fleet(args.clients, host, port, args.interval, args.ramp, args.format,
+                  args.outage, args.backlog)
+    if args.ingest:
+        ingest_service = ingest.Ingest(args.ingest)
+        ingest_service.on_commit = fleet.stored
+        ingest_task = asyncio.create_task(ingest_service.run(host, port, "gbe-loadgen-ingest"))
+        await asyncio.sleep(0.5)
+    try:
+        await fleet.run(args.duration)
+    finally:
+        if ingest_task:
+            await asyncio.sleep(args.drain)  # let the ingest catch up
+            ingest_task.cancel()
+            await asyncio.gather(ingest_task, return_exceptions=True)
+            await ingest_service.flush()
+            ingest_service.close()
+        if broker:
+            await broker.stop()
+    print(json.dumps(fleet.report(args.duration, broker, ingest_service), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate a fleet of boxes over MQTT")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--interval", type=float, default=60,
+                        help="seconds between data publishes of a box, 60 like the default aggregate window")
+    parser.add_argument("--ramp", type=float, default=0, help="spread the first connects over seconds")
+    parser.add_argument("--format", choices=("binary", "json"), default="binary")
+    parser.add_argument("--outage", type=float, nargs=2, metavar=("START", "SECONDS"))
+    parser.add_argument("--backlog", type=int, default=0, help="records saved on each box at start")
+    parser.add_argument("--host", help="broker, default a stand-in broker in this process")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--ingest", metavar="DB", help="run the ingest service too, storing into DB")
+    parser.add_argument("--drain", type=float, default=2, help="seconds the ingest gets to catch up")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,414 @@
+"""Minimal asyncio MQTT 3.1.1 broker and client.
+
+Broker is an in-process stand-in for a real broker such as mosquitto, enough
+for the ingest service and load tests: QoS 0 and 1, + and # wildcards, no
+retained messages, wills or persistent sessions. Client talks to it or to
+any other broker.
+
+Memory is bounded on both sides. Each subscriber has a queue of at most
+queue_size messages in the broker and the client. When a queue is full the
+broker stops reading from the publishing connections, so TCP flow control
+slows the publishers down and their PUBACKs are delayed.
+
+Usage: python -m server.mqtt [--host HOST] [--port PORT]
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import struct
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+Message = collections.namedtuple("Message", "topic payload qos")
+
+
+class MQTTError(Exception):
+    """Raised for protocol errors and refused connections."""
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+def encode_str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def packet(first_byte, body=b""):
+    return bytes([first_byte]) + encode_length(len(body)) + body
+
+
+def publish_packet(topic, payload, qos=0, pid=0, retain=False):
+    body = encode_str(topic)
+    if qos:
+        body += struct.pack("!H", pid)
+    return packet(PUBLISH << 4 | qos << 1 | retain, body + bytes(payload))
+
+
+def parse_publish(header, body):
+    """Returns (Message, packet id or None) of a PUBLISH packet"""
+    qos = (header >> 1) & 3
+    topic_len = struct.unpack_from("!H", body)[0]
+    topic = body[2:2 + topic_len].decode()
+    i = 2 + topic_len
+    pid = None
+    if qos:
+        pid = struct.unpack_from("!H", body, i)[0]
+        i += 2
+    return Message(topic, body[i:], qos), pid
+
+
+async def read_packet(reader):
+    """Returns (first byte, body). Raises asyncio.IncompleteReadError when
+       the connection closes."""
+    header = (await reader.readexactly(1))[0]
+    n = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        n |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise MQTTError("malformed remaining length")
+    return header, await reader.readexactly(n) if n else b""
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching with + and # wildcards"""
+    if pattern == topic or pattern == "#":
+        return True
+    parts = pattern.split("/")
+    levels = topic.split("/")
+    for i, part in enumerate(parts):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(parts) == len(levels)
+
+
+class _Session:
+    """One client connection to the Broker"""
+
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.topics = {}  # topic filter: granted qos
+        self.queue = asyncio.Queue(broker.queue_size)
+        self._pids = itertools.cycle(range(1, 65536))
+
+    def qos_for(self, topic):
+        """Granted qos of the best matching subscription, None if not subscribed"""
+        best = None
+        for pattern, qos in self.topics.items():
+            if topic_matches(pattern, topic) and (best is None or qos > best):
+                best = qos
+        return best
+
+    async def run(self):
+        sender = asyncio.create_task(self._send_queued())
+        try:
+            header, body = await asyncio.wait_for(read_packet(self.reader), self.broker.connect_timeout)
+            if header >> 4 != CONNECT:
+                return
+            self._connect(body)
+            while True:
+                header, body = await read_packet(self.reader)
+                if not await self._handle(header, body):
+                    return
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, MQTTError):
+            pass
+        finally:
+            sender.cancel()
+            self.broker.sessions.discard(self)
+            self.writer.close()
+
+    def _connect(self, body):
+        protocol_len = struct.unpack_from("!H", body)[0]
+        i = 2 + protocol_len + 4  # protocol name, level, flags and keepalive
+        id_len = struct.unpack_from("!H", body, i)[0]
+        self.client_id = body[i + 2:i + 2 + id_len].decode()
+        self.broker.sessions.add(self)
+        self.broker.connections += 1
+        self.writer.write(packet(CONNACK << 4, b"\x00\x00"))
+
+    async def _handle(self, header, body):
+        kind = header >> 4
+        if kind == PUBLISH:
+            message, pid = parse_publish(header, body)
+            await self.broker.route(message)
+            if message.qos:
+                self.writer.write(packet(PUBACK << 4, struct.pack("!H", pid)))
+                await self.writer.drain()
+        elif kind == SUBSCRIBE:
+            pid = body[:2]
+            i = 2
+            granted = bytearray()
+            while i < len(body):
+                topic_len = struct.unpack_from("!H", body, i)[0]
+                topic = body[i + 2:i + 2 + topic_len].decode()
+                qos = min(body[i + 2 + topic_len], 1)
+                self.topics[topic] = qos
+                granted.append(qos)
+                i += 3 + topic_len
+            self.writer.write(packet(SUBACK << 4, pid + bytes(granted)))
+        elif kind == UNSUBSCRIBE:
+            i = 2
+            while i < len(body):
+                topic_len = struct.unpack_from("!H", body, i)[0]
+                self.topics.pop(body[i + 2:i + 2 + topic_len].decode(), None)
+                i += 2 + topic_len
+            self.writer.write(packet(UNSUBACK << 4, body[:2]))
+        elif kind == PINGREQ:
+            self.writer.write(packet(PINGRESP << 4))
+        elif kind == DISCONNECT:
+            return False
+        # PUBACKs from subscribers need no action, nothing is redelivered
+        return True
+
+    async def _send_queued(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                self.writer.write(publish_packet(message.topic, message.payload,
+                                                 message.qos, next(self._pids)))
+                await self.writer.drain()  # returns at once unless the buffer is full
+        except ConnectionError:
+            pass
+
+
+class Broker:
+    """In-process MQTT broker.
+       :param int port: 0 picks a free port, see .port after start().
+       :param int queue_size: messages queued per subscriber before
+           publishers are slowed down."""
+
+    def __init__(self, host="127.0.0.1", port=1883, queue_size=1000):
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.connect_timeout = 10
+        self.backlog = 1024  # connections waiting to be accepted, a fleet connects at once
+        self.sessions = set()
+        self.connections = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self._server = None
+        self._tasks = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._accept, self.host, self.port,
+                                                  backlog=self.backlog)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _accept(self, reader, writer):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await _Session(self, reader, writer).run()
+        except asyncio.CancelledError:
+            pass  # stop(), asyncio logs cancelled connection handlers as errors
+        finally:
+            self._tasks.discard(task)
+
+    async def route(self, message):
+        """Queue message for every matching subscription, waits while a
+           subscriber's queue is full"""
+        self.messages_in += 1
+        for session in list(self.sessions):
+            qos = session.qos_for(message.topic)
+            if qos is not None:
+                self.messages_out += 1
+                await session.queue.put(Message(message.topic, message.payload, min(qos, message.qos)))
+
+
+class Client:
+    """MQTT client.
+       :param str client_id: unique id of the client.
+       :param int queue_size: received messages held until read with
+           messages(), the client stops reading from the socket when full.
+       :param int max_inflight: QoS 1 publishes awaiting PUBACK at once."""
+
+    def __init__(self, client_id, queue_size=1000, max_inflight=20, response_time=10):
+        self.client_id = client_id
+        self.response_time = response_time
+        self.queue = asyncio.Queue(queue_size)
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._pids = itertools.cycle(range(1, 65536))
+        self._acks = {}
+        self._reader = None
+        self._writer = None
+        self._tasks = []
+        self.connected = False
+
+    async def connect(self, host="127.0.0.1", port=1883, clean=True, keepalive=60, timeout=10):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout)
+        body = (encode_str("MQTT") + bytes([4, 2 if clean else 0])
+                + struct.pack("!H", keepalive) + encode_str(self.client_id))
+        self._writer.write(packet(CONNECT << 4, body))
+        try:
+            header, body = await asyncio.wait_for(read_packet(self._reader), timeout)
+        except BaseException:
+            self._writer.close()
+            raise
+        if header >> 4 != CONNACK or len(body) < 2 or body[1] != 0:
+            self._writer.close()
+            raise MQTTError(f"connection refused: {body[1:2].hex()}")
+        self.connected = True
+        self._tasks = [asyncio.create_task(self._read_loop())]
+        if keepalive:
+            self._tasks.append(asyncio.create_task(self._ping_loop(keepalive)))
+        return self
+
+    def _write(self, data):
+        if not self.connected:
+            raise ConnectionError("not connected")
+        self._writer.write(data)
+
+    async def publish(self, topic, payload, qos=0):
+        """Publish, for qos 1 returns once the broker acknowledged it"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if not qos:
+            self._write(publish_packet(topic, payload))
+            await self._writer.drain()
+            return
+        async with self._inflight:
+            pid = next(self._pids)
+            ack = self._acks[pid] = asyncio.get_running_loop().create_future()
+            try:
+                self._write(publish_packet(topic, payload, 1, pid))
+                await self._writer.drain()
+                await asyncio.wait_for(ack, self.response_time)
+            finally:
+                self._acks.pop(pid, None)
+
+    async def subscribe(self, topic, qos=0):
+        pid = next(self._pids)
+        ack = self._acks[pid] = asyncio.get_running_loop().create_future()
+        try:
+            self._write(packet(SUBSCRIBE << 4 | 2, struct.pack("!H", pid) + encode_str(topic) + bytes([qos])))
+            await self._writer.drain()
+            await asyncio.wait_for(ack, self.response_time)
+        finally:
+            self._acks.pop(pid, None)
+
+    async def messages(self):
+        """Yields received Messages until the connection is lost"""
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                return
+            yield message
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header, body = await read_packet(self._reader)
+                kind = header >> 4
+                if kind == PUBLISH:
+                    message, pid = parse_publish(header, body)
+                    await self.queue.put(message)
+                    if message.qos:
+                        self._write(packet(PUBACK << 4, struct.pack("!H", pid)))
+                elif kind in (PUBACK, SUBACK, UNSUBACK):
+                    ack = self._acks.get(struct.unpack_from("!H", body)[0])
+                    if ack and not ack.done():
+                        ack.set_result(None)
+        except (asyncio.IncompleteReadError, ConnectionError, MQTTError):
+            pass
+        finally:
+            self._lost()
+
+    async def _ping_loop(self, keepalive):
+        while True:
+            await asyncio.sleep(keepalive / 2)
+            self._write(packet(PINGREQ << 4))
+
+    def _lost(self):
+        if not self.connected:
+            return
+        self._cancel_tasks()
+        self.connected = False
+        for ack in self._acks.values():
+            if not ack.done():
+                ack.set_exception(ConnectionError("connection lost"))
+        self._writer.close()
+        try:
+            self.queue.put_nowait(None)  # ends messages()
+        except asyncio.QueueFull:
+            self._tasks = [asyncio.create_task(self.queue.put(None))]
+
+    def _cancel_tasks(self):
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+
+    async def disconnect(self):
+        if self.connected:
+            self._writer.write(packet(DISCONNECT << 4))
+            await self._writer.drain()
+        self.close()
+
+    def close(self):
+        """Drop the connection, pending publishes fail with ConnectionError"""
+        if self.connected:
+            self._lost()
+        else:
+            self._cancel_tasks()
+
+
+async def serve(host, port):
+    broker = await Broker(host, port).start()
+    print(f"broker listening on {broker.host}:{broker.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the stand-in MQTT broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
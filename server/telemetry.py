@@ -0,0 +1,154 @@
+"""Decoder for the data published by main.py.
+
+Boxes publish either json lists in getStats() order or binary records packed
+by lib/telemetry.py. Both can arrive on the "data" topic (one sample) and the
+"backlog" topic (several samples). decode() handles all four cases and returns
+one dict per sample using the keys in FIELDS and EXTRA_FIELDS. The extra
+fields describe averaging and are None for json and version 1 records, the
+min, max and last of the soil and ambient readings are only in version 3.
+
+Usage: python -m server.telemetry HEX_OR_JSON_PAYLOAD
+"""
+
+import binascii
+import datetime
+import json
+import struct
+import sys
+
+# Field names in getStats() order
+FIELDS = (
+    "board", "date", "time",
+    "red", "green", "blue", "white",
+    "volts", "milliamps", "watts",
+    "fan", "rpm",
+    "soil_temperature", "soil_moisture",
+    "ambient_temperature", "ambient_humidity",
+)
+
+# Readings that version 3 records also carry the min, max and last of
+EXTREME_FIELDS = ("soil_temperature", "soil_moisture", "ambient_temperature", "ambient_humidity")
+
+# Averaging window in seconds, the number of samples averaged and the
+# extremes of the window
+EXTRA_FIELDS = ("window", "samples") + tuple(
+    f"{field}_{stat}" for field in EXTREME_FIELDS for stat in ("min", "max", "last"))
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+FLAG_TIME = 0x01
+MISSING_U16 = 0xFFFF
+MISSING_I16 = -32768
+
+# version: (struct format, record size)
+FORMATS = {
+    1: ("<BB8sIBBBBHhHBHhHhH", 35),
+    2: ("<BB8sIBBBBHhHBHhHhHHH", 39),
+    3: ("<BB8sIBBBBHhHBHhHhHHHhhhHHHhhhHHH", 63),
+}
+
+
+class DecodeError(ValueError):
+    """Raised for payloads that are neither json stats nor a known binary record."""
+
+
+def _u16(value, scale=1):
+    return None if value == MISSING_U16 else value / scale if scale != 1 else value
+
+
+def _i16(value, scale=1):
+    return None if value == MISSING_I16 else value / scale if scale != 1 else value
+
+
+def _decode_v1(fields):
+    (_, flags, board, ts, red, green, blue, white, volts, mam, watts,
+     fan, rpm, sst, ssm, aht, ahh) = fields[:17]
+    if flags & FLAG_TIME:
+        when = EPOCH + datetime.timedelta(seconds=ts)
+        date, time = f"{when.year}-{when.month}-{when.day}", f"{when.hour}:{when.minute}"
+    else:
+        date = time = "?"
+    return dict(zip(FIELDS, (
+        binascii.hexlify(board).decode(), date, time,
+        red, green, blue, white,
+        _u16(volts, 100), _i16(mam), _u16(watts, 100),
+        fan, _u16(rpm),
+        _i16(sst, 100), _u16(ssm),
+        _i16(aht, 100), _u16(ahh, 100),
+    )), **dict.fromkeys(EXTRA_FIELDS))
+
+
+def _decode_v2(fields):
+    row = _decode_v1(fields)
+    row["window"], row["samples"] = fields[17:19]
+    return row
+
+
+def _decode_v3(fields):
+    row = _decode_v2(fields)
+    scales = (100, 1, 100, 100)  # of the fields in EXTREME_FIELDS
+    decoders = (_i16, _u16, _i16, _u16)
+    for i, field in enumerate(EXTREME_FIELDS):
+        for j, stat in enumerate(("min", "max", "last")):
+            row[f"{field}_{stat}"] = decoders[i](fields[19 + 3 * i + j], scales[i])
+    return row
+
+
+_DECODERS = {1: _decode_v1, 2: _decode_v2, 3: _decode_v3}
+
+
+def decode_binary(payload):
+    """Decode one or more concatenated binary records."""
+    rows = []
+    offset = 0
+    while offset < len(payload):
+        version = payload[offset]
+        if version not in FORMATS:
+            raise DecodeError(f"unknown record version {version} at byte {offset}")
+        fmt, size = FORMATS[version]
+        if offset + size > len(payload):
+            raise DecodeError(f"truncated version {version} record at byte {offset}")
+        rows.append(_DECODERS[version](struct.unpack_from(fmt, payload, offset)))
+        offset += size
+    return rows
+
+
+def _json_row(stats):
+    if len(stats) != len(FIELDS):
+        raise DecodeError(f"expected {len(FIELDS)} fields, got {len(stats)}")
+    row = dict(zip(FIELDS, stats), **dict.fromkeys(EXTRA_FIELDS))
+    # getStats() wraps the date and time in an extra pair of quotes
+    row["date"] = row["date"].strip('"')
+    row["time"] = row["time"].strip('"')
+    return row
+
+
+def decode_json(payload):
+    """Decode a json stats list or a json list of stats lists."""
+    try:
+        data = json.loads(payload)
+    except ValueError as e:
+        raise DecodeError(f"invalid json: {e}") from None
+    if not isinstance(data, list) or not data:
+        raise DecodeError("expected a non empty json list")
+    if isinstance(data[0], list):
+        return [_json_row(stats) for stats in data]
+    return [_json_row(data)]
+
+
+def decode(payload):
+    """Decode any payload published by a box, returns a list of dicts."""
+    payload = bytes(payload)
+    if payload[:1] == b"[":
+        return decode_json(payload)
+    return decode_binary(payload)
+
+
+if __name__ == "__main__":
+    arg = sys.argv[1]
+    try:
+        raw = binascii.unhexlify(arg)
+    except binascii.Error:
+        raw = arg.encode()
+    for row in decode(raw):
+        print(json.dumps(row))
@@ -0,0 +1,26 @@
+"""Host side simulator for the GBE control box.
+
+Runs the real main.py and lib/ under CPython with fake MicroPython modules
+(machine, neopixel, network, utime, uasyncio, usocket, ...), simulated I2C
+devices at the addresses of the real hardware, a Wi-Fi network with a
+minimal MQTT broker and NTP server, and a virtual clock. The uasyncio loop
+runs on virtual time, so an hour of box time takes a few seconds.
+
+Every board gets its own copy of the firmware modules, its own filesystem
+and hardware, so many boards can share one simulation.
+
+    from sim import Simulation
+
+    s = Simulation()
+    box = s.add_board()
+    s.at(600, box.unplug, "soil")
+    s.run(3600)
+    print(s.broker.count("data"), box.resets)
+
+Usage: python -m sim [--boards N] [--duration SECONDS] [--script FILE]
+"""
+
+from sim.simulation import Simulation
+from sim.board import Board, SystemReset
+
+__all__ = ["Simulation", "Board", "SystemReset"]
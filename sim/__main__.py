@@ -0,0 +1,61 @@
+"""Run boxes in the simulator and print a json summary.
+
+Usage: python -m sim [--boards N] [--duration SECONDS] [--speed X]
+                     [--script EVENTS.json] [--verbose]
+
+EVENTS.json is a list of events for Simulation.script(), eg.
+[{"at": 600, "action": "unplug", "device": "soil", "board": 0}]
+"""
+
+import argparse
+import json
+import time
+
+from sim import Simulation
+
+
+def summary(sim, real_seconds):
+    boards = []
+    for board in sim.boards:
+        client = board.firmware.modules["__main__"].__dict__.get("board_id") if board.firmware else None
+        boards.append({
+            "name": board.name,
+            "client": client,
+            "resets": board.resets,
+            "crash": repr(board.crash) if board.crash else None,
+            "data": sim.broker.count("data", client),
+            "backlog": sim.broker.count("backlog", client),
+            "i2c transactions": {bus: i2c.transactions for bus, i2c in board.i2c.items()},
+        })
+    return {
+        "virtual seconds": sim.clock.now,
+        "real seconds": round(real_seconds, 3),
+        "messages": len(sim.broker.messages),
+        "ntp requests": sim.ntp.requests,
+        "boards": boards,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m sim", description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=3600, help="virtual seconds to run")
+    parser.add_argument("--speed", type=float, default=0, help="virtual seconds per real second, 0 for as fast as possible")
+    parser.add_argument("--script", help="json file with a list of events")
+    parser.add_argument("--verbose", action="store_true", help="print the console of every board")
+    args = parser.parse_args()
+
+    sim = Simulation(speed=args.speed, quiet=not args.verbose)
+    for _ in range(args.boards):
+        sim.add_board()
+    if args.script:
+        with open(args.script) as f:
+            sim.script(json.load(f))
+    start = time.time()
+    sim.run(args.duration)
+    print(json.dumps(summary(sim, time.time() - start), indent=2))
+    sim.close()
+
+
+if __name__ == "__main__":
+    main()
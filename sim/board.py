@@ -0,0 +1,320 @@
+"""One simulated control box: the Pico W, its wiring and its filesystem."""
+
+import calendar
+import collections
+import json
+import os
+import tempfile
+import traceback
+
+from sim import devices
+from sim.loader import Firmware, ROOT
+
+# Power on defaults of the rp2 port
+RTC_DEFAULT = calendar.timegm((2021, 1, 1, 0, 0, 0))
+
+DEFAULT_SETTINGS = {
+    "lights": {"timer": {"on": "07:00", "off": "19:00"},
+               "duty": {"red": 72, "green": 60, "blue": 52, "white": 44}},
+    "fan": {"duty": {"when lights on": 255, "when lights off": 128}},
+    "time zone": {"GMT offset": -5},
+}
+
+DEFAULT_WIFI = {"NETWORK_NAME": "gbe-sim", "NETWORK_PASSWORD": "password"}
+
+# wiring of the control box, by device name: (bus, device class)
+WIRING = {
+    "ina219": (0, devices.INA219),
+    "ds3231": (0, devices.DS3231),
+    "soil": (1, devices.Seesaw),
+    "aht10": (1, devices.AHT10),
+}
+
+FAN_PWM_PIN = 4
+FAN_TACH_PIN = 5
+TICK_S = 0.1
+
+
+class SystemReset(BaseException):
+    """Raised by machine.reset(), the simulation reboots the board"""
+
+
+class Filesystem:
+    """Maps the board's absolute paths into a host directory. /lib and
+       /main.py always come from the repository."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def host(self, path):
+        path = os.path.normpath("/" + str(path).lstrip("/"))
+        if path == "/lib" or path.startswith("/lib/"):
+            return os.path.join(ROOT, path[1:])
+        if path == "/main.py":
+            return os.path.join(ROOT, "main.py")
+        return os.path.join(self.root, path[1:])
+
+    def open(self, path, mode="r", *args, **kwargs):
+        return open(self.host(path), mode, *args, **kwargs)
+
+
+class Wlan:
+    """State of the CYW43 station interface"""
+
+    STAT_IDLE = 0
+    STAT_CONNECTING = 1
+    STAT_GOT_IP = 3
+
+    def __init__(self, board):
+        self.board = board
+        self.enabled = True  # set False to keep this board off the network
+        self.reset()
+
+    def reset(self):
+        self.active = False
+        self.status = self.STAT_IDLE
+        self.ssid = None
+
+    def connect(self, ssid):
+        self.ssid = ssid
+        self.status = self.STAT_CONNECTING
+        sim = self.board.sim
+        sim.loop.call_later(sim.net.connect_delay, self._joined)
+
+    def _joined(self):
+        if self.status == self.STAT_CONNECTING and self.enabled and self.board.sim.net.up:
+            self.status = self.STAT_GOT_IP
+        elif self.status == self.STAT_CONNECTING:
+            self.status = -2  # no AP found
+
+    def disconnect(self):
+        self.status = self.STAT_IDLE
+        for sock in list(self.board.sim.net.sockets):
+            if sock.board is self.board:
+                sock.reset()
+
+    def isconnected(self):
+        return (self.active and self.status == self.STAT_GOT_IP
+                and self.enabled and self.board.sim.net.up)
+
+
+class Board:
+    """A control box running main.py.
+       :param sim: the Simulation.
+       :param str name: prefix of console lines.
+       :param dict settings: gbe_settings.json, defaults to DEFAULT_SETTINGS.
+       :param bytes unique_id: 8 byte board id.
+       :param str root: host directory for the filesystem, a temporary
+           directory by default.
+       :param attached: names from WIRING to connect, default all of them."""
+
+    def __init__(self, sim, name="box", settings=None, unique_id=None, root=None,
+                 attached=tuple(WIRING), wifi=DEFAULT_WIFI):
+        self.sim = sim
+        self.name = name
+        self.uid = unique_id or bytes([0xE6, 0x61, 0x64, 0x08, 0x43, 0x2A, 0x00, len(sim.boards)])
+        self.temporary = root is None
+        self.root = root or tempfile.mkdtemp(prefix=f"gbe-{name}-")
+        self.fs = Filesystem(self.root)
+        self.console = collections.deque(maxlen=1000)
+        self.quiet = sim.quiet
+        self.resets = []  # (time, reason)
+        self.crash = None
+        self.mem32 = {}  # survives resets like the watchdog scratch registers
+        self.wlan = Wlan(self)
+        self.fan_max_rpm = 2000
+        self.fan_stalled = False
+        self.sqw_pin = None  # GPIO wired to the DS3231 INT/SQW output
+        self.firmware = None
+        self.tasks = set()
+        self._main = None
+        self._installed = False
+        self._settings = settings or DEFAULT_SETTINGS
+        self._wifi = wifi
+
+        self.i2c = {0: devices.I2CBus(sim.clock), 1: devices.I2CBus(sim.clock)}
+        self.devices = {}
+        for name in attached:
+            self.plug_new(name)
+        clock = self.devices.get("ds3231")
+        if clock:
+            offset = self._settings.get("time zone", {}).get("GMT offset", 0)
+            clock.set_seconds(sim.utc() + offset * 3600)
+        self._power_on()
+
+    # ---------------------------------------------------------------- setup
+
+    def install(self):
+        """Write the files SETUP.py and the release normally put on the board"""
+        for folder in ("config", "logs"):
+            os.makedirs(os.path.join(self.root, folder), exist_ok=True)
+        with open(self.fs.host("/config/gbe_settings.json"), "w") as f:
+            json.dump(self._settings, f)
+        if self._wifi:
+            with open(self.fs.host("/config/wifi_settings.json"), "w") as f:
+                json.dump(self._wifi, f)
+        self._installed = True
+
+    def plug_new(self, name, **kwargs):
+        """Connect a new device from WIRING, eg. plug_new("aht10", humidity=80)"""
+        bus, cls = WIRING[name]
+        device = cls(**kwargs)
+        self.devices[name] = self.i2c[bus].attach(device)
+        return device
+
+    def unplug(self, name):
+        self.devices[name].unplug()
+
+    def plug(self, name):
+        self.devices[name].plug()
+
+    def fail(self, name, transactions=1):
+        self.devices[name].fail(transactions)
+
+    def wifi(self, enabled):
+        """Let the board join the network or keep it off"""
+        self.wlan.enabled = enabled
+        if not enabled:
+            self.wlan.disconnect()
+
+    # -------------------------------------------------------------- hardware
+
+    def _power_on(self):
+        self.pins = {}
+        self.irqs = {}
+        self.pwm = {}
+        self.pwm_log = []  # (time, pin, duty_u16)
+        self.pixels = {}
+        self.pixel_writes = 0
+        self.rtc_base = RTC_DEFAULT
+        self.rtc_set_at = self.sim.clock.now
+        self.wdt_timeout = None
+        self.wdt_fed = 0.0
+        self.gc_collections = 0
+        self._fan_pulses = 0.0
+        self._sqw_second = None
+        self.wlan.reset()
+
+    def rtc_seconds(self):
+        return self.rtc_base + int(self.sim.clock.now - self.rtc_set_at)
+
+    def set_rtc(self, seconds):
+        self.rtc_base = seconds
+        self.rtc_set_at = self.sim.clock.now
+
+    def watchdog_expired(self):
+        """Reboots the board if the watchdog was not fed in time"""
+        if self.wdt_timeout is None:
+            return False
+        if (self.sim.clock.now - self.wdt_fed) * 1000 <= self.wdt_timeout:
+            return False
+        self.wdt_timeout = None
+        self.sim.loop.call_soon(self.reboot, "watchdog")
+        return True
+
+    def duty(self, pin):
+        pwm = self.pwm.get(pin)
+        return pwm.duty if pwm else 0
+
+    def irq(self, pin):
+        """Fire the interrupt handler of a pin, if one is set"""
+        handler = self.irqs.get(pin)
+        if handler:
+            handler(self.pins.get(pin))
+
+    def print(self, *args, sep=" ", end="\n", file=None, flush=False):
+        text = sep.join(str(a) for a in args) + end
+        for line in text.rstrip("\n").split("\n"):
+            self.console.append(line)
+            if not self.quiet:
+                print(f"[{self.sim.clock.now:10.3f}] {self.name}: {line}")
+
+    # ------------------------------------------------------------- lifecycle
+
+    def boot(self):
+        """Run main.py up to asyncio.run() and start its main task"""
+        if not self._installed:
+            self.install()
+        self.crash = None
+        self.firmware = Firmware(self)
+        try:
+            self.firmware.run(self.fs.host("/main.py"))
+        except SystemReset:
+            self.sim.loop.call_soon(self.reboot, "machine.reset")
+        except Exception as e:
+            self._crashed(e)
+        self.sim.loop.call_later(TICK_S, self._tick)
+
+    def run_main(self, coro):
+        """Called by the fake uasyncio.run()"""
+        self._main = self.spawn(coro)
+
+    def spawn(self, coro):
+        task = self.sim.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if task.cancelled():
+            return
+        e = task.exception()
+        if isinstance(e, SystemReset):
+            self.reboot("machine.reset")
+        elif e is not None:
+            if task is self._main:
+                self._crashed(e)
+            else:
+                self.print("Task exception wasn't retrieved")
+                self.print("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+    def _crashed(self, e):
+        # main.py exited with an exception, the board drops to the REPL
+        self.crash = e
+        self.print("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+        self.halt()
+
+    def halt(self):
+        for task in list(self.tasks):
+            task.cancel()
+        self.tasks.clear()
+        self._main = None
+        for sock in list(self.sim.net.sockets):
+            if sock.board is self:
+                sock.close()
+
+    def reboot(self, reason="reset"):
+        self.resets.append((self.sim.clock.now, reason))
+        self.print(f"*** reset: {reason}")
+        self.halt()
+        self._power_on()
+        self.sim.loop.call_soon(self.boot)
+
+    def _tick(self):
+        if self.firmware is None:
+            return
+        firmware = self.firmware
+        now = self.sim.clock.now
+
+        if self.watchdog_expired():
+            return
+
+        # fan tachometer, two pulses per rotation
+        if FAN_TACH_PIN in self.irqs and not self.fan_stalled:
+            rpm = self.fan_max_rpm * self.duty(FAN_PWM_PIN) / 65535
+            self._fan_pulses += rpm / 60 * 2 * TICK_S
+            while self._fan_pulses >= 1:
+                self._fan_pulses -= 1
+                self.irq(FAN_TACH_PIN)
+
+        # 1Hz square wave from the battery clock
+        clock = self.devices.get("ds3231")
+        if self.sqw_pin is not None and clock and clock.present and clock.square_wave:
+            second = int(clock.seconds())
+            if second != self._sqw_second:
+                self._sqw_second = second
+                self.irq(self.sqw_pin)
+
+        if self.firmware is firmware:
+            self.sim.loop.call_later(TICK_S, self._tick)
@@ -0,0 +1,75 @@
+"""Virtual time for the simulator.
+
+VirtualEventLoop is a CPython asyncio loop whose clock only moves when the
+loop would otherwise wait: instead of blocking in select() the clock jumps
+to the next timer. With speed > 0 the loop also sleeps 1/speed of each
+jump in real time, eg. speed=60 runs a minute of box time per second.
+"""
+
+import asyncio
+import selectors
+import time
+
+
+class VirtualClock:
+    """Seconds since the simulation started"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds):
+        """Move time forward, eg. for a blocking sleep in the firmware"""
+        if seconds > 0:
+            self.now += seconds
+
+
+class _Selector(selectors.BaseSelector):
+    """Wraps the real selector, advancing the clock instead of waiting"""
+
+    def __init__(self, clock, speed):
+        self._clock = clock
+        self._speed = speed
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        # the loop's self-pipe is always registered, only poll when
+        # something else is
+        events = self._selector.select(0) if len(self._selector.get_map()) > 1 else []
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # nothing scheduled, only real I/O can wake the loop
+            return self._selector.select(None)
+        if self._speed:
+            time.sleep(timeout / self._speed)
+        self._clock.advance(timeout)
+        return []
+
+    def close(self):
+        self._selector.close()
+
+    def get_key(self, fileobj):
+        return self._selector.get_key(fileobj)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """asyncio loop running on a VirtualClock"""
+
+    def __init__(self, clock, speed=0):
+        super().__init__(_Selector(clock, speed))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
@@ -0,0 +1,325 @@
+"""Simulated I2C buses and the devices of the control box.
+
+Devices answer the same register reads and writes as the real chips, enough
+for the drivers in lib/. Readings are plain attributes, or callables taking
+the simulation time in seconds, so tests can script them. Every device can be
+unplugged and plugged back in, or made to fail its next transactions.
+
+Transactions to an absent address raise OSError(EIO) like the rp2 port.
+"""
+
+import calendar
+import errno
+import struct
+import time as _time
+
+
+def _value(v, now):
+    return v(now) if callable(v) else v
+
+
+def _bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def _unbcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+
+class I2CBus:
+    """The devices on one I2C bus, by address"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.devices = {}
+        self.transactions = 0
+
+    def attach(self, device):
+        device.clock = self.clock
+        self.devices[device.address] = device
+        return device
+
+    def detach(self, address):
+        return self.devices.pop(address, None)
+
+    def scan(self):
+        return sorted(a for a, d in self.devices.items() if d.present)
+
+    def device(self, address):
+        """The device answering at address, raises OSError(EIO) if none"""
+        self.transactions += 1
+        device = self.devices.get(address)
+        if device is None or not device.present:
+            raise OSError(errno.EIO, "EIO")
+        device.check()
+        return device
+
+
+class Device:
+    """Base class, a device with 8 bit register addresses"""
+
+    name = "device"
+
+    def __init__(self, address):
+        self.address = address
+        self.present = True
+        self.clock = None
+        self._failures = 0
+        self._pointer = 0
+
+    def unplug(self):
+        self.present = False
+
+    def plug(self):
+        self.present = True
+        self.power_on()
+
+    def fail(self, transactions=1):
+        """Fail the next `transactions` transactions, -1 for every one"""
+        self._failures = transactions
+
+    def check(self):
+        if self._failures:
+            if self._failures > 0:
+                self._failures -= 1
+            raise OSError(errno.EIO, "EIO")
+
+    def power_on(self):
+        """Restore the power on state, called when plugged in"""
+
+    @property
+    def now(self):
+        return self.clock.now if self.clock else 0.0
+
+    # bus side, used by machine.I2C
+
+    def write(self, data):
+        if data:
+            self._pointer = data[0]
+            if len(data) > 1:
+                self.write_registers(data[0], bytes(data[1:]))
+
+    def read(self, n):
+        data = self.read_registers(self._pointer, n)
+        self._pointer = (self._pointer + n) & 0xFF
+        return data
+
+    def write_mem(self, register, data):
+        self.write(bytes([register]) + bytes(data))
+
+    def read_mem(self, register, n):
+        self._pointer = register
+        return self.read(n)
+
+    # device side
+
+    def write_registers(self, register, data):
+        pass
+
+    def read_registers(self, register, n):
+        return bytes(n)
+
+
+class INA219(Device):
+    """Current sensor. volts is the bus voltage, amps the load current,
+       shunt the resistor in ohms."""
+
+    name = "ina219"
+    _GAIN_VOLTS = (0.04, 0.08, 0.16, 0.32)
+    _CONVERSION_S = 0.00106  # 12 bit bus and shunt conversions
+
+    def __init__(self, address=0x40, volts=12.0, amps=0.5, shunt=0.1):
+        super().__init__(address)
+        self.volts = volts
+        self.amps = amps
+        self.shunt = shunt
+        self.power_on()
+
+    def power_on(self):
+        self.config = 0x399F
+        self.calibration = 0
+        self._converted = self.now
+
+    def write_registers(self, register, data):
+        if len(data) < 2:
+            return
+        value = data[0] << 8 | data[1]
+        if register == 0x00:
+            if value & 0x8000:
+                self.power_on()
+            else:
+                self.config = value
+        elif register == 0x05:
+            self.calibration = value & 0xFFFE
+
+    def _measure(self):
+        now = self.now
+        gain = self._GAIN_VOLTS[(self.config >> 11) & 3]
+        shunt_v = _value(self.amps, now) * self.shunt
+        overflow = abs(shunt_v) > gain
+        shunt_v = max(-gain, min(gain, shunt_v))
+        shunt_reg = int(shunt_v * 100000)
+        bus_reg = int(_value(self.volts, now) * 250)
+        current_reg = max(-32768, min(32767, shunt_reg * self.calibration // 4096))
+        power_reg = min(0xFFFF, abs(current_reg) * bus_reg // 5000)
+        ready = now - self._converted >= self._CONVERSION_S
+        return shunt_reg, bus_reg, current_reg, power_reg, overflow, ready
+
+    def read_registers(self, register, n):
+        shunt_reg, bus_reg, current_reg, power_reg, overflow, ready = self._measure()
+        if register == 0x00:
+            value = self.config
+        elif register == 0x01:
+            value = shunt_reg & 0xFFFF
+        elif register == 0x02:
+            value = bus_reg << 3 | (2 if ready else 0) | (1 if overflow else 0)
+        elif register == 0x03:
+            value = power_reg
+            self._converted = self.now  # reading power clears CNVR
+        elif register == 0x04:
+            value = current_reg & 0xFFFF
+        elif register == 0x05:
+            value = self.calibration
+        else:
+            value = 0
+        return struct.pack(">H", value)[:n].ljust(n, b"\0")
+
+
+class AHT10(Device):
+    """Temperature and humidity sensor, measurements take 75ms"""
+
+    name = "aht10"
+    _MEASURE_S = 0.075
+
+    def __init__(self, address=0x38, temperature=24.0, humidity=55.0):
+        super().__init__(address)
+        self.temperature = temperature
+        self.humidity = humidity
+        self.power_on()
+
+    def power_on(self):
+        self.calibrated = False
+        self._started = None
+        self._result = bytes(5)
+
+    def write(self, data):
+        command = data[0] if data else 0
+        if command == 0xBA:
+            self.power_on()
+        elif command in (0xE1, 0xBE):
+            self.calibrated = True
+        elif command == 0xAC:
+            self._started = self.now
+            humidity = int(min(max(_value(self.humidity, self.now), 0), 100) / 100 * 0xFFFFF)
+            temp = int((_value(self.temperature, self.now) + 50) / 200 * 0xFFFFF)
+            self._result = bytes([
+                humidity >> 12 & 0xFF, humidity >> 4 & 0xFF,
+                (humidity & 0x0F) << 4 | temp >> 16 & 0x0F,
+                temp >> 8 & 0xFF, temp & 0xFF])
+
+    def read(self, n):
+        busy = self._started is not None and self.now - self._started < self._MEASURE_S
+        status = (0x80 if busy else 0) | (0x08 if self.calibrated else 0)
+        return (bytes([status]) + self._result)[:n].ljust(n, b"\0")
+
+
+class Seesaw(Device):
+    """Adafruit STEMMA soil sensor. bad_reads makes the next moisture
+       reads return out of range values, like the real sensor sometimes does."""
+
+    name = "soil"
+    _RESET_S = 0.45  # a little under the 500ms the driver waits
+
+    def __init__(self, address=0x36, temperature=22.0, moisture=600):
+        super().__init__(address)
+        self.temperature = temperature
+        self.moisture = moisture
+        self.bad_reads = 0
+        self._register = (0, 0)
+        self._reset = None
+
+    def power_on(self):
+        self._reset = None
+
+    def write(self, data):
+        if len(data) < 2:
+            return
+        self._register = (data[0], data[1])
+        if self._register == (0x00, 0x7F):
+            self._reset = self.now
+
+    def check(self):
+        super().check()
+        if self._reset is not None and self.now - self._reset < self._RESET_S:
+            raise OSError(errno.EIO, "EIO")  # still rebooting
+
+    def read(self, n):
+        if self._register == (0x00, 0x01):
+            data = b"\x55"
+        elif self._register == (0x00, 0x04):
+            data = struct.pack(">i", int(_value(self.temperature, self.now) * 65536))
+        elif self._register == (0x0F, 0x10):
+            if self.bad_reads:
+                self.bad_reads -= 1
+                data = b"\xff\xff"
+            else:
+                data = struct.pack(">H", int(_value(self.moisture, self.now)) & 0xFFFF)
+        else:
+            data = b""
+        return data[:n].ljust(n, b"\0")
+
+
+class DS3231(Device):
+    """Battery backed clock. Keeps its own time, offset from the simulation
+       clock, and drives its INT/SQW output through on_square_wave."""
+
+    name = "ds3231"
+
+    def __init__(self, address=0x68, seconds=None):
+        super().__init__(address)
+        self.registers = bytearray(0x13)
+        self.registers[0x0E] = 0x1C
+        self.registers[0x11] = 25
+        # seconds since 1970 at simulation time 0
+        self.base = seconds if seconds is not None else _time.time()
+        self.on_square_wave = None
+
+    def seconds(self):
+        return self.base + self.now
+
+    def set_seconds(self, seconds):
+        self.base = seconds - self.now
+
+    @property
+    def square_wave(self):
+        """True while a 1Hz square wave is enabled on INT/SQW"""
+        ctrl = self.registers[0x0E]
+        return not ctrl & 0x04 and not ctrl & 0x18
+
+    def _time_registers(self):
+        t = _time.gmtime(int(self.seconds()))
+        return bytes([_bcd(t.tm_sec), _bcd(t.tm_min), _bcd(t.tm_hour),
+                      t.tm_wday + 1, _bcd(t.tm_mday), _bcd(t.tm_mon),
+                      _bcd(t.tm_year % 100)])
+
+    def read_registers(self, register, n):
+        self.registers[0:7] = self._time_registers()
+        data = bytes(self.registers[register % 0x13] for register in range(register, register + n))
+        return data
+
+    def write_registers(self, register, data):
+        time_regs = bytearray(self._time_registers())
+        for i, value in enumerate(data):
+            r = (register + i) % 0x13
+            if r < 7:
+                time_regs[r] = value
+            else:
+                self.registers[r] = value
+        if register < 7:
+            year = 2000 + _unbcd(time_regs[6])
+            month = max(1, _unbcd(time_regs[5] & 0x1F))
+            day = max(1, _unbcd(time_regs[4]))
+            hour = _unbcd(time_regs[2] & 0x3F)
+            minute = _unbcd(time_regs[1])
+            second = _unbcd(time_regs[0] & 0x7F)
+            self.set_seconds(calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)))
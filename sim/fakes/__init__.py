@@ -0,0 +1,4 @@
+"""Fake MicroPython modules, executed once per board by sim.loader.
+
+Each module is run with the board it belongs to as the global `board`.
+"""
@@ -0,0 +1,39 @@
+"""Fake gc, the heap numbers are a fixed Pico W sized heap"""
+
+_HEAP = 192 * 1024
+_threshold = -1
+_enabled = True
+
+
+def collect():
+    board.gc_collections += 1
+    return 0
+
+
+def mem_free():
+    return _HEAP // 2
+
+
+def mem_alloc():
+    return _HEAP - mem_free()
+
+
+def threshold(amount=None):
+    global _threshold
+    if amount is None:
+        return _threshold
+    _threshold = amount
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def isenabled():
+    return _enabled
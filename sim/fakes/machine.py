@@ -0,0 +1,181 @@
+"""Fake machine module backed by the board's simulated hardware"""
+
+import calendar
+import time
+
+from sim.board import SystemReset
+
+
+def unique_id():
+    return board.uid
+
+
+def reset():
+    raise SystemReset()
+
+
+soft_reset = reset
+
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+def reset_cause():
+    # machine.reset() reboots through the watchdog on the rp2 port
+    return WDT_RESET if board.resets else PWRON_RESET
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def idle():
+    pass
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+def lightsleep(ms=0):
+    board.sim.clock.advance(ms / 1000)
+
+
+deepsleep = lightsleep
+
+
+class _Mem:
+    """mem32[address], unknown addresses read as 0"""
+
+    def __getitem__(self, address):
+        return board.mem32.get(address, 0)
+
+    def __setitem__(self, address, value):
+        board.mem32[address] = value & 0xFFFFFFFF
+
+
+mem32 = _Mem()
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0 if value is None else value
+        board.pins[id] = self
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def toggle(self):
+        self._value ^= 1
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            board.irqs.pop(self.id, None)
+        else:
+            board.irqs[self.id] = handler
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.pin = pin.id if isinstance(pin, Pin) else pin
+        self._freq = freq or 1000
+        self.duty = 0
+        board.pwm[self.pin] = self
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self.duty
+        self.duty = max(0, min(int(value), 65535))
+        board.pwm_log.append((board.sim.clock.now, self.pin, self.duty))
+
+    def deinit(self):
+        self.duty = 0
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000, timeout=50000):
+        self.id = id
+        self._bus = board.i2c[id]
+
+    def scan(self):
+        return self._bus.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        self._bus.device(addr).write(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._bus.device(addr).read(nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        buf[:] = self._bus.device(addr).read(len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._bus.device(addr).write_mem(memaddr, bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        return self._bus.device(addr).read_mem(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        buf[:] = self._bus.device(addr).read_mem(memaddr, len(buf))
+
+
+class RTC:
+    def datetime(self, datetime=None):
+        if datetime is None:
+            t = time.gmtime(board.rtc_seconds())
+            return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday,
+                    t.tm_hour, t.tm_min, t.tm_sec, 0)
+        year, month, day, _, hour, minute, second = datetime[:7]
+        board.set_rtc(calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)))
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        if timeout > 8388:
+            raise ValueError("timeout exceeds 8388ms")
+        board.wdt_timeout = timeout
+        board.wdt_fed = board.sim.clock.now
+
+    def feed(self):
+        # the loop may have been blocked past the timeout, eg. by a blocking
+        # sleep, before this feed got to run
+        if board.watchdog_expired():
+            return
+        board.wdt_fed = board.sim.clock.now
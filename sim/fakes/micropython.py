@@ -0,0 +1,45 @@
+"""Fake micropython module"""
+
+
+def const(value):
+    return value
+
+
+def native(f):
+    return f
+
+
+viper = native
+asm_thumb = native
+
+
+def opt_level(level=None):
+    return 0
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    board.print("stack: 0 out of 7936\nGC: total: 196608, used: 98304, free: 98304")
+
+
+def qstr_info(verbose=False):
+    pass
+
+
+def stack_use():
+    return 0
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def schedule(func, arg):
+    board.sim.loop.call_soon(func, arg)
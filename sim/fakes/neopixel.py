@@ -0,0 +1,27 @@
+"""Fake neopixel, the last written colours are kept in board.pixels"""
+
+
+class NeoPixel:
+    ORDER = (1, 0, 2, 3)
+
+    def __init__(self, pin, n, bpp=3, timing=1):
+        self.pin = pin
+        self.n = n
+        self.bpp = bpp
+        self._pixels = [(0,) * bpp] * n
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, index, value):
+        self._pixels[index] = tuple(value)
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def fill(self, value):
+        self._pixels = [tuple(value)] * self.n
+
+    def write(self):
+        board.pixels[getattr(self.pin, "id", self.pin)] = list(self._pixels)
+        board.pixel_writes += 1
@@ -0,0 +1,49 @@
+"""Fake network, the station interface joins the simulated access point"""
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._wlan = board.wlan
+
+    def active(self, state=None):
+        if state is None:
+            return self._wlan.active
+        self._wlan.active = bool(state)
+        if not state:
+            self._wlan.disconnect()
+
+    def connect(self, ssid=None, key=None, **kwargs):
+        self._wlan.connect(ssid)
+
+    def disconnect(self):
+        self._wlan.disconnect()
+
+    def isconnected(self):
+        return self._wlan.isconnected()
+
+    def status(self, param=None):
+        if param == "rssi":
+            return -60
+        return self._wlan.status
+
+    def config(self, *args, **kwargs):
+        if args and args[0] == "mac":
+            return bytes(board.uid[:6])
+        if args and args[0] in ("ssid", "essid"):
+            return self._wlan.ssid
+
+    def ifconfig(self, *args):
+        return ("10.0.1.{}".format(board.uid[-1]), "255.255.255.0", "10.0.1.1", "10.0.1.1")
+
+    def scan(self):
+        return []
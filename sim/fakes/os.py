@@ -0,0 +1,71 @@
+"""Fake uos on the board's filesystem"""
+
+import os as _os
+
+sep = "/"
+_cwd = "/"
+
+
+def _host(path):
+    if not str(path).startswith("/"):
+        path = _cwd.rstrip("/") + "/" + str(path)
+    return board.fs.host(path)
+
+
+def stat(path):
+    return tuple(_os.stat(_host(path)))[:10]
+
+
+def listdir(path=None):
+    return sorted(_os.listdir(_host(path or _cwd)))
+
+
+def ilistdir(path=None):
+    for name in listdir(path):
+        full = _os.path.join(_host(path or _cwd), name)
+        yield (name, 0x4000 if _os.path.isdir(full) else 0x8000, 0, _os.path.getsize(full))
+
+
+def mkdir(path):
+    _os.mkdir(_host(path))
+
+
+def rmdir(path):
+    _os.rmdir(_host(path))
+
+
+def remove(path):
+    _os.remove(_host(path))
+
+
+def rename(old, new):
+    _os.rename(_host(old), _host(new))
+
+
+def getcwd():
+    return _cwd
+
+
+def chdir(path):
+    global _cwd
+    if not _os.path.isdir(_host(path)):
+        raise OSError(2, "ENOENT")
+    _cwd = path if path.startswith("/") else _cwd.rstrip("/") + "/" + path
+
+
+def statvfs(path):
+    # 848kB flash filesystem of a Pico W with 4kB blocks
+    return (4096, 4096, 212, 150, 150, 0, 0, 0, 0, 255)
+
+
+def sync():
+    pass
+
+
+def uname():
+    return ("rp2", "rp2", "1.22.0", "v1.22.0 on 2024-01-01 (sim)",
+            "Raspberry Pi Pico W with RP2040")
+
+
+def urandom(n):
+    return _os.urandom(n)
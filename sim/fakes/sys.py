@@ -0,0 +1,24 @@
+"""Fake sys reporting the rp2 port"""
+
+import sys as _sys
+import traceback as _traceback
+import types as _types
+
+platform = "rp2"
+version = "3.4.0; MicroPython v1.22.0"
+implementation = _types.SimpleNamespace(name="micropython", version=(1, 22, 0), _mpy=0)
+byteorder = "little"
+maxsize = (1 << 30) - 1
+argv = []
+path = ["", ".frozen", "/lib"]
+stdin = _sys.stdin
+stdout = _sys.stdout
+stderr = _sys.stderr
+
+
+def exit(code=0):
+    raise SystemExit(code)
+
+
+def print_exception(exc, file=None):
+    board.print("".join(_traceback.format_exception(type(exc), exc, exc.__traceback__)).rstrip())
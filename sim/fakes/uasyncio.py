@@ -0,0 +1,133 @@
+"""Fake uasyncio on top of the simulation's CPython asyncio loop.
+
+run() does not block: it hands the coroutine to the board, the
+simulation runs it with every other board on one virtual time loop."""
+
+import asyncio as _asyncio
+
+CancelledError = _asyncio.CancelledError
+TimeoutError = _asyncio.TimeoutError
+Event = _asyncio.Event
+Lock = _asyncio.Lock
+sleep = _asyncio.sleep
+wait_for = _asyncio.wait_for
+current_task = _asyncio.current_task
+
+
+def sleep_ms(ms):
+    return _asyncio.sleep(ms / 1000)
+
+
+def wait_for_ms(aw, timeout):
+    return _asyncio.wait_for(aw, timeout / 1000)
+
+
+def gather(*aws, return_exceptions=False):
+    return _asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+
+def create_task(coro):
+    return board.spawn(coro)
+
+
+def run(coro):
+    board.run_main(coro)
+
+
+def get_event_loop():
+    return _Loop()
+
+
+new_event_loop = get_event_loop
+
+
+class _Loop:
+    def create_task(self, coro):
+        return board.spawn(coro)
+
+    def run_forever(self):
+        pass
+
+    def run_until_complete(self, coro):
+        board.run_main(coro)
+
+    def set_exception_handler(self, handler):
+        pass
+
+    def call_exception_handler(self, context):
+        pass
+
+
+class ThreadSafeFlag:
+    """Set from an interrupt handler, wait() clears it"""
+
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+class Stream:
+    """uasyncio Stream over a simulated socket"""
+
+    def __init__(self, sock, e={}):
+        self.s = sock
+        self.e = e
+        self._out = bytearray()
+
+    def get_extra_info(self, v):
+        return self.e.get(v)
+
+    async def read(self, n=-1):
+        await self.s.wait_readable()
+        data = self.s.read(n)
+        return b"" if data is None else data
+
+    async def readinto(self, buf):
+        await self.s.wait_readable()
+        n = self.s.readinto(buf)
+        return 0 if n is None else n
+
+    async def readexactly(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = await self.read(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    async def readline(self):
+        line = b""
+        while not line.endswith(b"\n"):
+            chunk = await self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return line
+
+    def write(self, buf):
+        self._out += buf
+
+    async def drain(self):
+        data, self._out = bytes(self._out), bytearray()
+        if data:
+            self.s.write(data)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        self.s.close()
+
+
+StreamReader = Stream
+StreamWriter = Stream
@@ -0,0 +1,20 @@
+"""Fake usocket on the simulated network"""
+
+import errno
+
+AF_INET = 2
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    if not board.wlan.isconnected():
+        raise OSError(errno.EHOSTUNREACH, "EHOSTUNREACH")
+    address = board.sim.net.resolve(host)
+    return [(AF_INET, type or SOCK_STREAM, proto, "", (address, port))]
+
+
+def socket(af=AF_INET, type=SOCK_STREAM, proto=0):
+    return board.sim.net.socket(board, type == SOCK_DGRAM)
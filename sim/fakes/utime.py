@@ -0,0 +1,66 @@
+"""Fake utime on the simulation clock. Blocking sleeps move the clock
+forward, wall clock functions use the board's RTC (epoch 1970)."""
+
+import calendar
+import time as _time
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+
+def _now():
+    return board.sim.clock.now + board.sim.ticks_offset
+
+
+def ticks_ms():
+    return int(_now() * 1000) & _TICKS_MAX
+
+
+def ticks_us():
+    return int(_now() * 1000000) & _TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def sleep(seconds):
+    board.sim.clock.advance(seconds)
+
+
+def sleep_ms(ms):
+    board.sim.clock.advance(ms / 1000)
+
+
+def sleep_us(us):
+    board.sim.clock.advance(us / 1000000)
+
+
+def time():
+    return board.rtc_seconds()
+
+
+def time_ns():
+    return board.rtc_seconds() * 1000000000
+
+
+def gmtime(secs=None):
+    t = _time.gmtime(board.rtc_seconds() if secs is None else int(secs))
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+            t.tm_wday, t.tm_yday)
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0))
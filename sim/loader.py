@@ -0,0 +1,106 @@
+"""Loads main.py and lib/ for one simulated board.
+
+Firmware modules are executed in their own namespaces with a private
+__import__, open and print, so each board has its own copy of every module
+and never touches sys.modules. Imports are resolved in this order:
+
+1. MicroPython names that are aliases (time -> utime, ustruct -> struct, ...)
+2. fake hardware modules in sim/fakes/, which get the board as `board`
+3. modules in the repository's lib/ directory
+4. the CPython standard library
+"""
+
+import builtins
+import importlib
+import os
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIB = os.path.join(ROOT, "lib")
+FAKES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakes")
+
+ALIASES = {
+    "time": "utime",
+    "uos": "os",
+    "ustruct": "struct",
+    "ubinascii": "binascii",
+    "uerrno": "errno",
+    "ujson": "json",
+    "uio": "io",
+    "urandom": "random",
+    "ucollections": "collections",
+    "uhashlib": "hashlib",
+    "uselect": "select",
+    "asyncio": "uasyncio",
+}
+
+# compiled code is shared by every board
+_code = {}
+
+
+def _compile(path):
+    code = _code.get(path)
+    if code is None:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        _code[path] = code
+    return code
+
+
+def _memoryview(obj):
+    return memoryview(obj.encode() if isinstance(obj, str) else obj)
+
+
+class Firmware:
+    """Module namespace of one board"""
+
+    def __init__(self, board):
+        self.board = board
+        self.modules = {}
+        self.builtins = dict(vars(builtins))
+        self.builtins["__import__"] = self._import
+        self.builtins["open"] = board.fs.open
+        self.builtins["print"] = board.print
+        # the MicroPython compiler accepts const() without importing it
+        self.builtins["const"] = lambda value: value
+        # str has the buffer protocol in MicroPython
+        self.builtins["memoryview"] = _memoryview
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        return self.load(name)
+
+    def load(self, name):
+        """Returns the module `name` as seen by the firmware"""
+        module = self.modules.get(name)
+        if module is not None:
+            return module
+        target = ALIASES.get(name, name)
+        if target != name:
+            module = self.load(target)
+        elif os.path.exists(os.path.join(FAKES, name + ".py")):
+            module = self._exec(name, os.path.join(FAKES, name + ".py"),
+                                {"__builtins__": builtins, "board": self.board})
+        elif os.path.exists(os.path.join(LIB, name + ".py")):
+            module = self._exec(name, os.path.join(LIB, name + ".py"),
+                                {"__builtins__": self.builtins})
+        else:
+            module = importlib.import_module(name)
+        self.modules[name] = module
+        return module
+
+    def _exec(self, name, path, namespace):
+        module = types.ModuleType(name)
+        module.__file__ = path
+        module.__dict__.update(namespace)
+        # registered first so circular imports see the partial module
+        self.modules[name] = module
+        try:
+            exec(_compile(path), module.__dict__)
+        except BaseException:
+            del self.modules[name]
+            raise
+        return module
+
+    def run(self, path):
+        """Run a firmware script, eg. main.py, as __main__"""
+        return self._exec("__main__", path, {"__builtins__": self.builtins})
@@ -0,0 +1,397 @@
+"""Simulated Wi-Fi network: sockets, a minimal MQTT broker and an NTP server.
+
+Sockets behave like non-blocking MicroPython sockets: reads return None
+when there is no data yet, and every byte takes `latency` seconds of
+virtual time to reach the other end. Services listen on a port of every
+address, so whatever server main.py is configured with is reachable.
+"""
+
+import collections
+import errno
+import struct
+
+NTP_DELTA = 2208988800  # seconds from 1900 to 1970
+
+Message = collections.namedtuple("Message", "time client topic payload qos")
+
+
+class Network:
+    """The access point and every host behind it"""
+
+    def __init__(self, sim, latency=0.02):
+        self.sim = sim
+        self.latency = latency
+        self.connect_delay = 2.0  # seconds for a board to join the network
+        self.up = True
+        self.hosts = {}
+        self.sockets = set()
+        self._services = {}
+
+    def listen(self, port, service, udp=False):
+        self._services[(port, udp)] = service
+
+    def resolve(self, host):
+        """Address of host, every name resolves to a made up address"""
+        if host.replace(".", "").isdigit():
+            return host
+        if host not in self.hosts:
+            self.hosts[host] = f"10.0.0.{len(self.hosts) + 10}"
+        return self.hosts[host]
+
+    def set_up(self, up):
+        """Take the whole network down or bring it back"""
+        self.up = up
+        if not up:
+            for sock in list(self.sockets):
+                sock.reset()
+
+    def socket(self, board, udp):
+        return Socket(self, board, udp)
+
+    def later(self, callback, *args):
+        self.sim.loop.call_later(self.latency, callback, *args)
+
+
+class Socket:
+    """Non-blocking stream or datagram socket of one board"""
+
+    def __init__(self, net, board, udp):
+        self.net = net
+        self.board = board
+        self.udp = udp
+        self.blocking = True
+        self.peer = None
+        self.closed = False
+        self._reset = False
+        self._remote_closed = False
+        self._rx = bytearray()
+        self._datagrams = collections.deque()
+        self._waiters = []
+        net.sockets.add(self)
+
+    def _linked(self):
+        return self.net.up and self.board.wlan.isconnected()
+
+    # called by the network and services
+
+    def deliver(self, data):
+        if self.closed or self._reset:
+            return
+        if self.udp:
+            self._datagrams.append(bytes(data))
+        else:
+            self._rx += data
+        self._wake()
+
+    def remote_close(self):
+        self._remote_closed = True
+        self._wake()
+
+    def reset(self):
+        """Connection lost, eg. the Wi-Fi went down"""
+        if self.peer is not None and hasattr(self.peer, "closed"):
+            self.peer.closed()
+        self._reset = True
+        self.peer = None
+        self._wake()
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    async def wait_readable(self):
+        """Used by the fake uasyncio streams"""
+        while not (self._rx or self._datagrams or self._remote_closed
+                   or self._reset or self.closed):
+            future = self.net.sim.loop.create_future()
+            self._waiters.append(future)
+            await future
+
+    # MicroPython socket API
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def settimeout(self, value):
+        self.blocking = value is None
+
+    def setsockopt(self, *args):
+        pass
+
+    def connect(self, address):
+        if not self._linked():
+            raise OSError(errno.EHOSTUNREACH, "EHOSTUNREACH")
+        service = self.net._services.get((address[1], self.udp))
+        if self.udp:
+            self.peer = service
+            return
+        self.peer = service.accept(self) if service else None
+        if self.peer is None:
+            raise OSError(errno.ECONNREFUSED, "ECONNREFUSED")
+        if not self.blocking:
+            raise OSError(errno.EINPROGRESS, "EINPROGRESS")
+
+    def _check(self):
+        if self.closed:
+            raise OSError(errno.EBADF, "EBADF")
+        if self._reset or not self._linked():
+            self.reset()
+            raise OSError(errno.ECONNRESET, "ECONNRESET")
+
+    def write(self, data):
+        self._check()
+        data = bytes(data)
+        if self.peer is not None:
+            if self.udp:
+                self.net.later(self.peer.datagram, self, data)
+            else:
+                self.net.later(self.peer.received, data)
+        return len(data)
+
+    send = write
+    sendall = write
+
+    def readinto(self, buf, n=None):
+        data = self.read(len(buf) if n is None else n)
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def read(self, n=-1):
+        if self.udp and self._datagrams:
+            return self._datagrams.popleft()[:n] if n >= 0 else self._datagrams.popleft()
+        if self._rx:
+            n = len(self._rx) if n < 0 else n
+            data = bytes(self._rx[:n])
+            del self._rx[:n]
+            return data
+        self._check()
+        if self._remote_closed:
+            return b""
+        if self.blocking:
+            # a blocking read would hang the event loop, the real board
+            # would be reset by the watchdog
+            raise OSError(errno.ETIMEDOUT, "ETIMEDOUT")
+        return None
+
+    recv = read
+
+    def close(self):
+        if not self.closed and self.peer is not None and hasattr(self.peer, "closed"):
+            self.peer.closed()
+        self.closed = True
+        self.peer = None
+        self.net.sockets.discard(self)
+        self._wake()
+
+
+class Broker:
+    """MQTT 3.1.1 broker stand-in. Acknowledges QoS 1 publishes and
+       SUBSCRIBE, answers pings and records every message. Set
+       drop_acks to leave the next publishes unacknowledged."""
+
+    def __init__(self, net):
+        self.net = net
+        self.up = True
+        self.drop_acks = 0
+        self.messages = []
+        self.sessions = set()
+        self.on_message = None
+
+    def accept(self, sock):
+        if not self.up:
+            return None
+        session = _Session(self, sock)
+        self.sessions.add(session)
+        return session
+
+    def set_up(self, up):
+        self.up = up
+        if not up:
+            for session in list(self.sessions):
+                session.close()
+
+    def count(self, topic=None, client=None):
+        return sum(1 for m in self.messages
+                   if (topic is None or m.topic == topic)
+                   and (client is None or m.client == client))
+
+    def publish(self, topic, payload):
+        """Send a QoS 0 message to every matching subscription"""
+        for session in list(self.sessions):
+            if session.subscribed(topic):
+                session.send_publish(topic, payload)
+
+
+def _encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+class _Session:
+    """One client connection to the Broker"""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client = None
+        self.topics = set()
+        self._buf = bytearray()
+
+    def subscribed(self, topic):
+        for pattern in self.topics:
+            if pattern == topic or pattern == "#":
+                return True
+            if pattern.endswith("/#") and topic.startswith(pattern[:-1]):
+                return True
+        return False
+
+    def send(self, data):
+        if self.sock is not None:
+            self.broker.net.later(self.sock.deliver, data)
+
+    def send_publish(self, topic, payload):
+        body = struct.pack("!H", len(topic)) + topic.encode() + bytes(payload)
+        self.send(b"\x30" + _encode_length(len(body)) + body)
+
+    def close(self):
+        if self.sock is not None:
+            self.broker.net.later(self.sock.remote_close)
+        self.closed()
+
+    def closed(self):
+        self.sock = None
+        self.broker.sessions.discard(self)
+
+    def received(self, data):
+        self._buf += data
+        while True:
+            packet = self._next_packet()
+            if packet is None:
+                return
+            self._handle(*packet)
+
+    def _next_packet(self):
+        buf = self._buf
+        n = 0
+        shift = 0
+        i = 1
+        while True:
+            if i >= len(buf):
+                return None
+            n |= (buf[i] & 0x7F) << shift
+            shift += 7
+            i += 1
+            if not buf[i - 1] & 0x80:
+                break
+        if len(buf) < i + n:
+            return None
+        header = buf[0]
+        body = bytes(buf[i:i + n])
+        del buf[:i + n]
+        return header, body
+
+    def _handle(self, header, body):
+        kind = header >> 4
+        if kind == 1:  # CONNECT
+            id_len = struct.unpack_from("!H", body, 10)[0]
+            self.client = body[12:12 + id_len].decode()
+            self.send(b"\x20\x02\x00\x00")
+        elif kind == 3:  # PUBLISH
+            qos = (header >> 1) & 3
+            topic_len = struct.unpack_from("!H", body, 0)[0]
+            topic = body[2:2 + topic_len].decode()
+            i = 2 + topic_len
+            if qos:
+                pid = body[i:i + 2]
+                i += 2
+            message = Message(self.broker.net.sim.clock.now, self.client, topic, body[i:], qos)
+            self.broker.messages.append(message)
+            if self.broker.on_message:
+                self.broker.on_message(message)
+            if qos:
+                if self.broker.drop_acks:
+                    self.broker.drop_acks -= 1
+                else:
+                    self.send(b"\x40\x02" + pid)
+        elif kind == 8:  # SUBSCRIBE
+            pid = body[:2]
+            i = 2
+            granted = bytearray()
+            while i < len(body):
+                topic_len = struct.unpack_from("!H", body, i)[0]
+                self.topics.add(body[i + 2:i + 2 + topic_len].decode())
+                i += 2 + topic_len
+                granted.append(min(body[i], 1))
+                i += 1
+            self.send(b"\x90" + _encode_length(2 + len(granted)) + pid + bytes(granted))
+        elif kind == 10:  # UNSUBSCRIBE
+            self.send(b"\xb0\x02" + body[:2])
+        elif kind == 12:  # PINGREQ
+            self.send(b"\xd0\x00")
+        elif kind == 14:  # DISCONNECT
+            self.close()
+
+
+class NtpServer:
+    """Answers NTP requests with the simulation's UTC time plus offset"""
+
+    def __init__(self, net):
+        self.net = net
+        self.up = True
+        self.offset = 0.0  # seconds, to simulate a wrong server
+        self.stratum = 2
+        self.requests = 0
+
+    def datagram(self, sock, data):
+        self.requests += 1
+        if not self.up or len(data) < 48:
+            return
+        now = self.net.sim.utc() + self.offset + NTP_DELTA
+        sec = int(now)
+        frac = int((now - sec) * 4294967296) & 0xFFFFFFFF
+        reply = bytearray(48)
+        reply[0] = 0x24  # version 4, server
+        reply[1] = self.stratum
+        reply[24:32] = data[40:48]
+        struct.pack_into("!IIII", reply, 32, sec, frac, sec, frac)
+        self.net.later(sock.deliver, reply)
+
+
+class DnsServer:
+    """Answers A queries with the address of Network.resolve(), other
+       queries with 32 bytes, enough for mqtt_as wan_ok()"""
+
+    def __init__(self, net):
+        self.net = net
+        self.queries = 0
+
+    def datagram(self, sock, data):
+        self.queries += 1
+        self.net.later(sock.deliver, self.answer(bytes(data)))
+
+    def answer(self, query):
+        try:
+            labels = []
+            offset = 12
+            while query[offset]:
+                labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+                offset += query[offset] + 1
+            end = offset + 5
+            qtype = struct.unpack_from("!H", query, offset + 1)[0]
+        except (IndexError, UnicodeError, struct.error):
+            return query[:2] + bytes(30)
+        if qtype != 1 or not labels:
+            return query[:2] + bytes(30)
+        address = bytes(int(part) for part in self.net.resolve(".".join(labels)).split("."))
+        header = query[:2] + struct.pack("!HHHHH", 0x8180, 1, 1, 0, 0)
+        record = struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + address
+        return header + query[12:end] + record
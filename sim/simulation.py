@@ -0,0 +1,131 @@
+"""The simulated world: virtual clock, event loop, network and boards."""
+
+import asyncio
+import calendar
+import shutil
+
+from sim.board import Board
+from sim.clock import VirtualClock, VirtualEventLoop
+from sim.net import Broker, DnsServer, Network, NtpServer
+
+# (action, takes a device name) for scripted events
+ACTIONS = {
+    "unplug": True,
+    "plug": True,
+    "fail": True,
+    "reset": False,
+    "wifi_down": False,
+    "wifi_up": False,
+    "fan_stall": False,
+    "fan_ok": False,
+}
+
+GLOBAL_ACTIONS = ("network_down", "network_up", "broker_down", "broker_up",
+                  "ntp_down", "ntp_up")
+
+
+class Simulation:
+    """Boards sharing one virtual clock, network and MQTT broker.
+       :param float speed: virtual seconds per real second, 0 runs as fast
+           as possible.
+       :param tuple start: UTC date and time at which the simulation starts.
+       :param int ticks_offset: seconds added to ticks_ms()/ticks_us(), to
+           test code around the 2**30 ticks wrap.
+       :param bool quiet: keep console output in Board.console only."""
+
+    def __init__(self, speed=0, start=(2024, 6, 1, 12, 0, 0), ticks_offset=0, quiet=False):
+        self.clock = VirtualClock()
+        self.loop = VirtualEventLoop(self.clock, speed)
+        self.utc0 = calendar.timegm(tuple(start) + (0, 0, 0))
+        self.ticks_offset = ticks_offset
+        self.quiet = quiet
+        self.boards = []
+        self.net = Network(self)
+        self.broker = Broker(self.net)
+        self.ntp = NtpServer(self.net)
+        self.net.listen(1883, self.broker)
+        self.net.listen(123, self.ntp, udp=True)
+        self.net.listen(53, DnsServer(self.net), udp=True)
+        self._started = False
+
+    def utc(self):
+        """True UTC time, seconds since 1970"""
+        return self.utc0 + self.clock.now
+
+    def add_board(self, **kwargs):
+        """Add a Board, see Board for the arguments"""
+        kwargs.setdefault("name", f"box{len(self.boards)}")
+        board = Board(self, **kwargs)
+        self.boards.append(board)
+        if self._started:
+            self.loop.call_soon(board.boot)
+        return board
+
+    def at(self, seconds, callback, *args):
+        """Call callback(*args) at simulation time `seconds`"""
+        self.loop.call_at(seconds, callback, *args)
+
+    def script(self, events):
+        """Schedule a list of event dicts, eg. loaded from json:
+           {"at": 600, "action": "unplug", "device": "soil", "board": 0}
+           board is an index and defaults to every board. Actions are
+           unplug, plug, fail (with optional "count"), reset, wifi_down,
+           wifi_up, fan_stall, fan_ok and the board independent
+           network_down/up, broker_down/up and ntp_down/up."""
+        for event in events:
+            self.at(event["at"], self._apply, event)
+
+    def _apply(self, event):
+        action = event["action"]
+        if action in GLOBAL_ACTIONS:
+            target, _, state = action.partition("_")
+            up = state == "up"
+            if target == "network":
+                self.net.set_up(up)
+            elif target == "broker":
+                self.broker.set_up(up)
+            else:
+                self.ntp.up = up
+            return
+        if action not in ACTIONS:
+            raise ValueError(f"unknown action {action!r}")
+        index = event.get("board")
+        for board in self.boards if index is None else [self.boards[index]]:
+            if action == "unplug":
+                board.unplug(event["device"])
+            elif action == "plug":
+                board.plug(event["device"])
+            elif action == "fail":
+                board.fail(event["device"], event.get("count", 1))
+            elif action == "reset":
+                board.reboot("scripted reset")
+            elif action in ("wifi_down", "wifi_up"):
+                board.wifi(action == "wifi_up")
+            else:
+                board.fan_stalled = action == "fan_stall"
+
+    def run(self, seconds):
+        """Boot the boards if needed and run for `seconds` of virtual time"""
+        if not self._started:
+            self._started = True
+            for board in self.boards:
+                self.loop.call_soon(board.boot)
+        self.loop.run_until_complete(self._sleep(seconds))
+
+    async def _sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def close(self, remove=True):
+        """Stop every board, close the loop and delete temporary filesystems"""
+        for board in self.boards:
+            board.halt()
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+        if remove:
+            for board in self.boards:
+                if board.temporary:
+                    shutil.rmtree(board.root, ignore_errors=True)
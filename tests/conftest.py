@@ -0,0 +1,34 @@
+"""Fixtures for the host tests: firmware modules loaded on a simulated board."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sim import Simulation  # noqa: E402
+from sim.loader import Firmware  # noqa: E402
+
+BOARD_ID = b"\xe6\x61\x64\x08\x43\x2a\x00\x00"
+
+
+@pytest.fixture
+def sim():
+    simulation = Simulation(quiet=True)
+    yield simulation
+    simulation.close()
+
+
+@pytest.fixture
+def board(sim):
+    """A board with its files installed that has not booted, for loading lib/ modules"""
+    box = sim.add_board(name="test")
+    box.install()
+    return box
+
+
+@pytest.fixture
+def lib(board):
+    """Loads a lib/ module the way the firmware sees it, eg. lib("auth")"""
+    return Firmware(board).load
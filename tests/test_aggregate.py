@@ -0,0 +1,28 @@
+MISSING = -1
+
+
+def test_windows_roll_over_with_their_statistics(lib):
+    aggregator = lib("aggregate").Aggregator(2, [3, 1])
+    aggregator.reset(0)
+    done = []
+    for second, values in enumerate([(1, 10), (3, MISSING), (2, 30)], 1):
+        aggregator.add(values)
+        done.extend(aggregator.collect(second * 1000))
+    short = [d for d in done if d[0] == 1]
+    assert len(short) == 3 and all(samples == 1 for _, samples, *_ in short)
+    assert short[1][2] == [3, MISSING]
+    (seconds, samples, means, mins, maxs, lasts), = [d for d in done if d[0] == 3]
+    assert (seconds, samples) == (3, 3)
+    assert means == [2, 20]
+    assert (mins, maxs, lasts) == ([1, 10], [3, 30], [2, 30])
+
+
+def test_nothing_is_collected_before_a_window_ends(lib):
+    aggregator = lib("aggregate").Aggregator(1, [60])
+    aggregator.reset(0)
+    for second in range(1, 60):
+        aggregator.add([second])
+        assert aggregator.collect(second * 1000) == ()
+    aggregator.add([60])
+    (_, samples, means, *_), = aggregator.collect(60000)
+    assert samples == 60 and means == [30.5]
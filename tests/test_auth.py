@@ -0,0 +1,70 @@
+import pytest
+
+from server import auth
+from conftest import BOARD_ID
+
+KEY = bytes(range(16))
+
+
+def test_signed_messages_verify_on_the_server(lib):
+    signer = lib("auth").Signer(BOARD_ID, KEY, path=None)
+    verifier = auth.Verifier()
+    verifier.register(BOARD_ID.hex(), KEY)
+    for payload in (b"first", b"second"):
+        board, counter, unwrapped = verifier.unwrap(signer.sign(payload))
+        assert (board, unwrapped) == (BOARD_ID.hex(), payload)
+    assert counter == 2
+
+
+def test_replayed_and_forged_messages_are_rejected(lib):
+    signer = lib("auth").Signer(BOARD_ID, KEY, path=None)
+    verifier = auth.Verifier()
+    verifier.register(BOARD_ID.hex(), KEY)
+    message = signer.sign(b"payload")
+    verifier.unwrap(message)
+    with pytest.raises(auth.AuthError):
+        verifier.unwrap(message)
+    forged = bytearray(signer.sign(b"payload"))
+    forged[-1] ^= 1
+    with pytest.raises(auth.AuthError):
+        verifier.unwrap(bytes(forged))
+
+
+def test_messages_from_the_server_unwrap_on_the_box(lib):
+    signer = lib("auth").Signer(BOARD_ID, KEY, path=None)
+    message = auth.sign(KEY, BOARD_ID, 1234, b'{"fan": {}}')
+    assert signer.unwrap(message) == (1234, b'{"fan": {}}')
+    with pytest.raises(ValueError):
+        signer.unwrap(auth.sign(bytes(16), BOARD_ID, 1235, b"{}"))
+    with pytest.raises(ValueError):
+        signer.unwrap(auth.sign(KEY, bytes(8), 1236, b"{}"))
+
+
+def test_counter_survives_a_reset_without_reuse(lib, board):
+    auth_module = lib("auth")
+    signer = auth_module.Signer(BOARD_ID, KEY, path="/config/auth_counter", reserve=4)
+    for _ in range(6):
+        signer.sign(b"x")
+    again = auth_module.Signer(BOARD_ID, KEY, path="/config/auth_counter", reserve=4)
+    assert again.counter > signer.counter
+
+
+def test_fleet_messages_unwrap_on_every_box_addressed(lib):
+    signer = lib("auth").Signer(BOARD_ID, KEY, path=None)
+    other = bytes(8)
+    message = auth.sign_fleet({other: bytes(16), BOARD_ID: KEY}, 1234, b'{"fan": {}}')
+    assert signer.unwrap(message) == (1234, b'{"fan": {}}')
+    assert signer.unwrap(auth.sign_fleet({other: KEY}, 1235, b"{}")) is None
+    with pytest.raises(ValueError):
+        signer.unwrap(auth.sign_fleet({BOARD_ID: bytes(16)}, 1236, b"{}"))
+
+
+def test_counters_to_boxes_keep_growing(tmp_path):
+    path = str(tmp_path / "keys.json")
+    verifier = auth.Verifier(path)
+    verifier.register("aa" * 8, KEY)
+    verifier.register("bb" * 8, KEY)
+    first = verifier.next_counter(["aa" * 8])
+    second = auth.Verifier(path).next_counter(["aa" * 8])
+    assert second > first
+    assert auth.Verifier(path).next_counter(["aa" * 8, "bb" * 8]) > second
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from server import auth
+
+KEY = bytes(range(16))
+LIGHTS = {"timer": {"on": "07:00", "off": "19:00"},
+          "duty": {"red": 10, "green": 20, "blue": 30, "white": 40}}
+
+
+@pytest.fixture
+def boxes(sim):
+    """Two enrolled boxes that booted, with a Verifier holding their keys"""
+    verifier = auth.Verifier()
+    boxes = []
+    for name in ("a", "b"):
+        box = sim.add_board(name=name)
+        box.install()
+        with open(box.fs.host("/config/auth.json"), "w") as f:
+            json.dump({"key": KEY.hex()}, f)
+        boxes.append(box)
+    sim.run(30)
+    for box in boxes:
+        verifier.register(box.firmware.modules["__main__"].board_id, KEY)
+    return verifier, boxes
+
+
+def board_id(box):
+    return box.firmware.modules["__main__"].board_id
+
+
+def send(sim, verifier, box, update):
+    board = board_id(box)
+    counter = verifier.next_counter([board])
+    sim.broker.publish("config/" + board, auth.sign(KEY, bytes.fromhex(board), counter,
+                                                    json.dumps(update).encode()))
+    sim.run(1)
+
+
+def acks(sim, box):
+    topic = "config/" + board_id(box) + "/ack"
+    return [json.loads(message.payload[auth.HEADER_SIZE:-auth.TAG_SIZE])["result"]
+            for message in sim.broker.messages if message.topic == topic]
+
+
+def test_settings_are_applied_without_a_reboot(sim, boxes):
+    verifier, (box, _) = boxes
+    send(sim, verifier, box, {"lights": LIGHTS})
+    send(sim, verifier, box, {"lights": LIGHTS})
+    assert acks(sim, box) == ["applied", "unchanged"]
+    with open(box.fs.host("/config/gbe_settings.json")) as f:
+        assert json.load(f)["lights"] == LIGHTS
+
+
+@pytest.mark.parametrize("update", [
+    {"diagnostics": {"stall ms": "500"}},
+    {"aggregate": {"windows": [60, "3600"]}},
+    {"backlog": {"records per second": 0}},
+    {"fan": {"duty": {"when lights on": "200", "when lights off": 0}}},
+    {"lights": dict(LIGHTS, duty={"red": 500})},
+])
+def test_malformed_settings_are_rejected(sim, boxes, update):
+    verifier, (box, _) = boxes
+    with open(box.fs.host("/config/gbe_settings.json")) as f:
+        before = f.read()
+    send(sim, verifier, box, update)
+    sim.run(60)
+    assert acks(sim, box) == ["invalid"]
+    with open(box.fs.host("/config/gbe_settings.json")) as f:
+        assert f.read() == before
+    assert box.crash is None and not box.resets
+
+
+def test_stale_and_forged_messages_are_acknowledged(sim, boxes):
+    verifier, (box, _) = boxes
+    board = board_id(box)
+    payload = json.dumps({"lights": LIGHTS}).encode()
+    message = auth.sign(KEY, bytes.fromhex(board), verifier.next_counter([board]), payload)
+    sim.broker.publish("config/" + board, message)
+    sim.broker.publish("config/" + board, message)
+    sim.broker.publish("config/" + board, auth.sign(bytes(16), bytes.fromhex(board), 2 ** 31, payload))
+    sim.run(1)
+    assert sorted(acks(sim, box)) == ["applied", "forged", "stale"]
+
+
+def test_one_publish_reconfigures_the_fleet(sim, boxes):
+    verifier, fleet = boxes
+    boards = [board_id(box) for box in fleet]
+    message = auth.sign_fleet({bytes.fromhex(board): KEY for board in boards},
+                              verifier.next_counter(boards), json.dumps({"lights": LIGHTS}).encode())
+    sim.broker.publish("config/all", message)
+    sim.run(1)
+    for box in fleet:
+        assert acks(sim, box) == ["applied"]
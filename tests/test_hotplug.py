@@ -0,0 +1,22 @@
+def test_read_errors_spread_over_time_keep_the_sensor(sim):
+    box = sim.add_board(name="box")
+    sim.script([{"at": at, "action": "fail", "device": "soil", "count": 2}
+                for at in (100, 300, 500)])
+    sim.run(60)
+    soil = box.firmware.modules["__main__"].soilDevice
+    ready_since = soil._since
+    sim.run(600)
+    assert soil.state == box.firmware.load("hotplug").READY
+    assert soil._since == ready_since  # never set up again
+    assert soil.errors == 0
+
+
+def test_reads_failing_in_a_row_set_the_sensor_up_again(sim):
+    box = sim.add_board(name="box")
+    sim.run(60)
+    soil = box.firmware.modules["__main__"].soilDevice
+    ready_since = soil._since
+    box.fail("soil", 40)
+    sim.run(120)
+    assert soil.state == box.firmware.load("hotplug").READY
+    assert soil._since != ready_since
@@ -0,0 +1,22 @@
+import copy
+import json
+import re
+
+from server import loadgen
+from sim.board import DEFAULT_SETTINGS
+
+
+def shape(stats):
+    """Type of every field, and the date and time with their digits masked"""
+    return ([type(v).__name__ for v in stats[:1] + stats[3:]],
+            re.sub(r"\d+", "9", stats[1]), re.sub(r"\d+", "9", stats[2]))
+
+
+def test_json_records_match_what_a_box_sends(sim):
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    settings["telemetry"] = {"format": "json"}
+    sim.add_board(name="box", settings=settings)
+    sim.run(70)
+    sent, = [json.loads(m.payload) for m in sim.broker.messages if m.topic == "data"]
+    generated = json.loads(loadgen.json_record(sent[0], 13 * 3600 + 7 * 60 + 5))
+    assert shape(generated) == shape(sent)
@@ -0,0 +1,35 @@
+def make_store(lib, segments=2, per_segment=4):
+    return lib("logstore").LogStore("/logs", segments, per_segment, 16)
+
+
+def test_oldest_records_are_overwritten_when_full(lib):
+    store = make_store(lib)
+    for i in range(11):
+        store.append(b"record %d" % i)
+    records, last = store.read(100)
+    assert records == [b"record %d" % i for i in range(3, 11)]
+    assert store.dropped == 3
+    store.commit(last)
+    assert store.pending() == 0
+
+
+def test_reopened_store_continues_after_the_cursor(lib):
+    store = make_store(lib)
+    for i in range(5):
+        store.append(b"record %d" % i)
+    records, last = store.read(2)
+    store.commit(last)
+    store = make_store(lib)
+    assert store.read(100)[0] == [b"record %d" % i for i in range(2, 5)]
+
+
+def test_corrupted_records_are_skipped(lib, board):
+    store = make_store(lib)
+    for i in range(3):
+        store.append(b"record %d" % i)
+    # flip a payload byte of the second record, slots are 10 byte header + 16
+    with open(board.fs.host("/logs/ring0.bin"), "r+b") as f:
+        f.seek(26 + 10)
+        f.write(b"X")
+    store = make_store(lib)
+    assert store.read(100)[0] == [b"record 0", b"record 2"]
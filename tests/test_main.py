@@ -0,0 +1,12 @@
+from server import telemetry
+
+
+def test_box_publishes_a_record_per_minute(sim):
+    box = sim.add_board(name="box")
+    sim.run(190)
+    assert box.crash is None and not box.resets
+    rows = [row for message in sim.broker.messages if message.topic == "data"
+            for row in telemetry.decode(message.payload)]
+    assert len(rows) == 3
+    assert all((row["window"], row["samples"]) == (60, 60) for row in rows)
+    assert rows[-1]["board"] == box.firmware.modules["__main__"].board_id
@@ -0,0 +1,43 @@
+from server import telemetry
+from conftest import BOARD_ID
+
+DATETIME = (2024, 6, 1, 5, 13, 7, 30, 0)
+STATS = [BOARD_ID.hex(), '"2024-6-1"', '"13:7"',
+         72, 60, 52, 44, 12.01, 503, 6.02, 255, 1980, 22.5, 600, 24.25, 55.5]
+
+
+def test_records_decode_to_the_packed_values(lib):
+    encoder = lib("telemetry").Encoder(BOARD_ID)
+    readings = STATS[3:]
+    mins = [v - 1 for v in readings]
+    maxs = [v + 1 for v in readings]
+    record = bytes(encoder.pack(DATETIME, STATS, 60, 58, (mins, maxs, readings)))
+    assert len(record) == lib("telemetry").SIZE == telemetry.FORMATS[3][1]
+    row, = telemetry.decode(record)
+    assert row["board"] == BOARD_ID.hex()
+    assert (row["date"], row["time"]) == ("2024-6-1", "13:7")
+    assert (row["red"], row["white"], row["rpm"], row["soil_moisture"]) == (72, 44, 1980, 600)
+    assert (row["volts"], row["milliamps"], row["watts"]) == (12.01, 503, 6.02)
+    assert (row["ambient_temperature"], row["ambient_humidity"]) == (24.25, 55.5)
+    assert (row["window"], row["samples"]) == (60, 58)
+    assert (row["soil_temperature_min"], row["soil_temperature_max"]) == (21.5, 23.5)
+    assert (row["soil_moisture_min"], row["soil_moisture_last"]) == (599, 600)
+    assert row["ambient_humidity_max"] == 56.5
+
+
+def test_missing_readings_decode_as_none(lib):
+    encoder = lib("telemetry").Encoder(BOARD_ID)
+    stats = STATS[:12] + [-1, -1, -1, -1]
+    row, = telemetry.decode(bytes(encoder.pack(None, stats)))
+    assert row["date"] == "?"
+    assert row["soil_temperature"] is row["ambient_humidity"] is None
+    assert row["ambient_temperature_max"] is None
+
+
+def test_concatenated_records_and_older_versions(lib):
+    encoder = lib("telemetry").Encoder(BOARD_ID)
+    record = bytes(encoder.pack(DATETIME, STATS, 60, 60))
+    v2 = bytes([2]) + record[1:telemetry.FORMATS[2][1]]
+    rows = telemetry.decode(record + v2 + record)
+    assert len(rows) == 3
+    assert rows[1]["window"] == 60 and rows[1]["soil_moisture_min"] is None